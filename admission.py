@@ -0,0 +1,239 @@
+"""
+Admission control for /process-receipt: per-client rate limits and load shedding
+
+When the chatbot platform retries in bursts, queued requests wait until they
+time out and all the work done for them is wasted. Requests are turned away
+up front instead, cheaply and with a Retry-After header:
+
+- RateLimiter (429): a token bucket per client, RATE_LIMIT_PER_MINUTE
+  requests with bursts of up to RATE_LIMIT_BURST. Buckets live in a SQLite
+  table, so every gunicorn worker on the host draws from the same bucket.
+  Each check is one UPSERT (the bucket is stored as the GCRA "theoretical
+  arrival time"), atomic without an explicit transaction.
+- AdmissionGate (503): at most ADMISSION_MAX_IN_FLIGHT extractions run at
+  once, the rest wait in line. A request is shed straight away if the line
+  is ADMISSION_MAX_QUEUE long or its estimated wait - from the recent
+  average extraction time - is over ADMISSION_MAX_WAIT seconds. The gate is
+  per process: it guards that process's own extraction pool. Scanned PDFs
+  handed on to OCR go through a second gate for the OCR pool
+  (OCR_ADMISSION_*), after their extraction slot is released, so slow OCR
+  jobs neither hold text slots nor inflate their average time.
+"""
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing, contextmanager, nullcontext
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    client TEXT PRIMARY KEY,
+    tat REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Buckets full again (tat in the past) are deleted every this many checks per process
+PRUNE_EVERY = 1000
+
+
+class Rejected(Exception):
+    """A request was turned away; answer with status_code and a Retry-After of retry_after seconds"""
+
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class RateLimiter:
+    """
+    Per-client token buckets shared by all processes through SQLite
+
+    - per_minute: sustained requests per minute per client (0 disables the limiter)
+    - burst: requests a client can make at once after being idle
+    """
+
+    def __init__(self, db_path, per_minute, burst):
+        self.db_path = db_path
+        self.enabled = per_minute > 0
+        self.interval = 60.0 / per_minute if self.enabled else 0.0
+        # How far ahead of now a client's tat may run: burst requests' worth
+        self.tolerance = self.interval * max(burst, 1)
+        self._local = threading.local()
+        self._checks = 0
+        if self.enabled:
+            with closing(sqlite3.connect(db_path, timeout=30)) as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(SCHEMA)
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            # Losing the latest bucket updates in a power cut only forgives a few requests
+            local.conn.execute('PRAGMA synchronous=OFF')
+            local.pid = os.getpid()
+        return local.conn
+
+    def check(self, client, now=None):
+        """
+        Take one request from the client's bucket
+
+        Raises:
+            Rejected: 429 - the bucket is empty
+        """
+        if not self.enabled:
+            return
+        now = time.time() if now is None else now
+        conn = self._connection()
+        # Admitted: tat moves one interval on (from now, if the bucket had filled up).
+        # Refused: the WHERE keeps the row as it is and nothing is returned.
+        admitted = conn.execute(
+            'INSERT INTO buckets (client, tat) VALUES (:client, :now + :interval) '
+            'ON CONFLICT (client) DO UPDATE SET tat = MAX(tat, :now) + :interval '
+            'WHERE MAX(tat, :now) + :interval - :now <= :tolerance '
+            'RETURNING tat',
+            {'client': client, 'now': now, 'interval': self.interval, 'tolerance': self.tolerance}
+        ).fetchone()
+
+        self._checks += 1
+        if self._checks % PRUNE_EVERY == 0:
+            conn.execute('DELETE FROM buckets WHERE tat < ?', (now,))
+
+        if admitted is None:
+            tat = conn.execute('SELECT tat FROM buckets WHERE client = ?', (client,)).fetchone()[0]
+            retry_after = tat + self.interval - now - self.tolerance
+            raise Rejected(f'Too many requests - retry in {math.ceil(retry_after)}s', 429, retry_after)
+
+
+class AdmissionGate:
+    """
+    Bounds concurrent extractions in this process and sheds load when the line gets long
+
+    - max_in_flight: extractions allowed at once
+    - max_queue: requests allowed to wait for a slot
+    - max_wait: seconds a request may be expected to wait (and at most waits)
+    """
+
+    def __init__(self, max_in_flight, max_queue, max_wait):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.waiting = 0
+        self.shed = 0
+        # Recent average extraction time (exponential moving average)
+        self.average_seconds = 1.0
+        self._cond = threading.Condition()
+
+    def _weight(self, weight):
+        # A request can never need more slots than there are
+        return min(max(weight, 1), self.max_in_flight)
+
+    def estimated_wait(self, weight=1):
+        """Seconds a request arriving now, needing weight slots, would wait for them"""
+        weight = self._weight(weight)
+        if self.in_flight + weight <= self.max_in_flight:
+            return 0.0
+        return math.ceil((self.waiting + weight) / self.max_in_flight) * self.average_seconds
+
+    def _reject(self, wait):
+        self.shed += 1
+        return Rejected(f'Server busy - retry in {max(1, math.ceil(wait))}s', 503, wait)
+
+    @contextmanager
+    def slot(self, weight=1):
+        """
+        Hold extraction slots for the duration of the with block
+
+        Args:
+            weight (int): Slots to hold - the pool jobs the block runs at once (at most max_in_flight)
+
+        Raises:
+            Rejected: 503 - the line is full, or the wait would be (or was) too long
+        """
+        weight = self._weight(weight)
+        with self._cond:
+            wait = self.estimated_wait(weight)
+            if wait:
+                if self.waiting >= self.max_queue or wait > self.max_wait:
+                    raise self._reject(wait)
+                self.waiting += 1
+                try:
+                    if not self._cond.wait_for(lambda: self.in_flight + weight <= self.max_in_flight,
+                                               self.max_wait):
+                        raise self._reject(self.estimated_wait(weight))
+                finally:
+                    self.waiting -= 1
+            self.in_flight += weight
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= weight
+                self.average_seconds = 0.8 * self.average_seconds + 0.2 * (time.perf_counter() - started)
+                # A waiter needing several slots may fit only once more than one is free
+                self._cond.notify_all()
+
+    def stats(self):
+        """Counters for /health"""
+        with self._cond:
+            return {
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+                'average_seconds': round(self.average_seconds, 3),
+                'shed': self.shed,
+            }
+
+
+def gate_slot(gate, weight=1):
+    """gate.slot(weight), or a no-op context when there is no gate"""
+    return gate.slot(weight) if gate is not None else nullcontext()
+
+
+def client_key(forwarded_for, remote_addr):
+    """
+    Identify the client for rate limiting
+
+    Behind a proxy (Render), the last X-Forwarded-For entry is the address the
+    proxy saw; earlier entries are whatever the client sent and can be forged.
+    """
+    if forwarded_for:
+        return forwarded_for.rsplit(',', 1)[-1].strip()
+    return remote_addr or 'unknown'
+
+
+def rate_limiter_from_env():
+    """Create the limiter configured by RATE_LIMIT_PER_MINUTE / RATE_LIMIT_BURST / RATE_LIMIT_DB_PATH"""
+    return RateLimiter(
+        os.environ.get('RATE_LIMIT_DB_PATH') or os.path.join(tempfile.gettempdir(), 'pdf-receipt-ratelimit.sqlite3'),
+        per_minute=float(os.environ.get('RATE_LIMIT_PER_MINUTE', '120')),
+        burst=int(os.environ.get('RATE_LIMIT_BURST', '30')),
+    )
+
+
+def admission_gate_from_env(pool_size, prefix='ADMISSION', max_wait=10):
+    """
+    Create the gate configured by <prefix>_MAX_IN_FLIGHT (defaults to pool_size) / _MAX_QUEUE / _MAX_WAIT
+
+    The OCR pool's gate reads OCR_ADMISSION_* (see ocr_gate_from_env).
+    """
+    max_in_flight = int(os.environ.get(f'{prefix}_MAX_IN_FLIGHT', '0')) or pool_size
+    return AdmissionGate(
+        max_in_flight=max_in_flight,
+        max_queue=int(os.environ.get(f'{prefix}_MAX_QUEUE', str(max_in_flight * 4))),
+        max_wait=float(os.environ.get(f'{prefix}_MAX_WAIT', str(max_wait))),
+    )
+
+
+def ocr_gate_from_env(ocr_pool):
+    """Create the OCR pool's gate (OCR_ADMISSION_*, waiting up to the pool's timeout by default), or None without OCR"""
+    if ocr_pool is None:
+        return None
+    return admission_gate_from_env(ocr_pool.size, 'OCR_ADMISSION', ocr_pool.timeout)
@@ -1,13 +1,114 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import requests
-from io import BytesIO
-from pdf_processor import extract_pdf_data
-from receipt_parser import parse_receipt_data
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+import logging
+import os
+import time
+from functools import partial
+from admission import Rejected, admission_gate_from_env, client_key, ocr_gate_from_env, rate_limiter_from_env
+from downloader import DownloadError, download_pdf
+from pdf_processor import backend_stats
+from preflight import PreflightError, inspect_pdf
+from result_cache import RESULT_VERSION, cache_from_env, content_key
+from batch_processor import batch_processor_from_env, process_pdf_bytes, process_pdf_url
+from dedup_index import dedup_index_from_env
+from job_queue import JobWorker, job_store_from_env
+from receipt_result import Receipt, json_default
+from receipt_splitter import SPLIT_VERSION, flag_requested, process_pdf_receipts
+from worker_pool import WorkerAborted
+from structured_log import configure_logging, new_request_id
+from warmup import start_warm_up, warmup_status
+import metrics
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+class JSONProvider(DefaultJSONProvider):
+    """Serializes Receipt results from their slots (Flask's dataclass support would deep-copy them via asdict)"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Receipt):
+            return json_default(o)
+        return DefaultJSONProvider.default(o)
 
 app = Flask(__name__)
+app.json = JSONProvider(app)
 CORS(app)  # Enable CORS for chatbot platform
 
+# Reject oversized request bodies before Werkzeug buffers them (uploads over 500 KB are spooled to disk)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_BYTES', str(50 * 1024 * 1024)))
+
+# Results keyed by PDF content hash - chatbot users often resend the same receipt
+result_cache = cache_from_env()
+
+# Supervised process pool for all extraction: deadlines, CPU/memory limits, worker recycling
+batch_processor = batch_processor_from_env()
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', '100'))
+
+# Per-client rate limits (shared by all workers through SQLite) and load shedding in front of extraction
+rate_limiter = rate_limiter_from_env()
+admission_gate = admission_gate_from_env(batch_processor.pool_size)
+# Scanned PDFs wait for the OCR pool here, after giving their extraction slot back
+ocr_gate = ocr_gate_from_env(batch_processor.ocr_pool)
+
+# (bank, transaction ID, amount, date) of every receipt seen - catches re-exported copies of a transfer
+dedup_index = dedup_index_from_env()
+
+# SQLite-backed queue for /jobs, drained by background threads in each worker
+job_store = job_store_from_env()
+job_worker = JobWorker(job_store, batch_processor, threads=int(os.environ.get('JOB_WORKER_THREADS', '1')),
+                       dedup=dedup_index)
+
+# Exercise every extraction backend once, in the background - /ready is 503 until it is done
+# (gunicorn's master waits for it before forking workers, see gunicorn.conf.py)
+start_warm_up()
+
+def upload_error(file_obj):
+    """Return an error message if an uploaded file is missing or not a PDF, else None"""
+    if file_obj.filename == '':
+        return 'No file selected'
+    if not file_obj.filename.lower().endswith('.pdf'):
+        return f'Invalid file type: {file_obj.filename}. Please send PDF only.'
+    return None
+
+def request_flag(name):
+    """Whether a flag such as 'split' is on in the form, the query string or the JSON body"""
+    return flag_requested(request.form.get(name) or request.args.get(name) or
+                          (request.json.get(name) if request.is_json else None))
+
+def rejected_response(e):
+    """Fast 429/503 for a request turned away by admission control"""
+    metrics.count_error('rate_limited' if e.status_code == 429 else 'overloaded')
+    return jsonify({
+        'success': False,
+        'error': str(e)
+    }), e.status_code, {'Retry-After': str(e.retry_after)}
+
+@app.before_request
+def start_request():
+    # No-op once started; gunicorn starts it in each worker after fork (see gunicorn.conf.py) and
+    # python app.py at startup - this covers other WSGI servers
+    job_worker.start()
+    g.request_id = new_request_id(request.headers.get('X-Request-ID'))
+    g.started = time.perf_counter()
+
+@app.after_request
+def log_request(response):
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    duration = time.perf_counter() - g.get('started', time.perf_counter())
+    # Route pattern, not path, so /jobs/<job_id> is one series
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.REQUESTS.labels(endpoint, str(response.status_code)).inc()
+    metrics.REQUEST_SECONDS.labels(endpoint).observe(duration)
+    logger.info('%s %s %d', request.method, request.path, response.status_code, extra={
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 2),
+        'cache': response.headers.get('X-Cache'),
+    })
+    return response
+
 @app.route('/process-receipt', methods=['POST'])
 def process_receipt():
     """
@@ -16,76 +117,315 @@ def process_receipt():
     Expected:
     - multipart/form-data with 'file' field (file upload), OR
     - form data with 'file_url' field (URL to PDF file)
+    - optional 'split' (form field, query parameter or JSON key) set to true
+      for PDFs that hold several receipts - each is returned under 'receipts'
+    - optional 'explain' set to true to add 'provenance' to each receipt: how
+      every field was found, with confidence scores
     
     Returns: JSON with extracted receipt information
     """
+    # Checked before the body is read - a client over its limit costs one SQLite statement
+    try:
+        rate_limiter.check(client_key(request.headers.get('X-Forwarded-For'), request.remote_addr))
+    except Rejected as e:
+        logger.info('Rate limited: %s', e)
+        return rejected_response(e)
+    
+    downloaded = None
     try:
         file_obj = None
         
         # Option 1: Check if file URL is provided (for chatbot platforms that send URLs)
         file_url = request.form.get('file_url') or (request.json.get('file_url') if request.is_json else None)
+        split = request_flag('split')
+        explain = request_flag('explain')
         
         if file_url:
-            print(f"📥 Downloading PDF from URL: {file_url}")
+            logger.debug('Downloading PDF from URL: %s', file_url)
             
-            # Download the file from URL
-            response = requests.get(file_url, timeout=30)
-            if response.status_code != 200:
+            # Stream the file to a spooled temp file, enforcing the size limit as it arrives
+            started = time.perf_counter()
+            try:
+                file_obj = downloaded = download_pdf(file_url)
+            except DownloadError as e:
+                metrics.count_error('too_large' if e.status_code == 413 else 'download')
                 return jsonify({
                     'success': False,
-                    'error': f'Failed to download file from URL (status {response.status_code})'
-                }), 400
+                    'error': str(e)
+                }), e.status_code
             
-            # Create file-like object from downloaded content
-            file_obj = BytesIO(response.content)
-            print(f"✅ Downloaded {len(response.content)} bytes")
+            metrics.observe_stage('download', time.perf_counter() - started)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Downloaded %d bytes', file_obj.seek(0, os.SEEK_END))
+                file_obj.seek(0)
         
         # Option 2: Check if file is directly uploaded
         elif 'file' in request.files:
             file_obj = request.files['file']
             
-            # Check if file was actually selected
-            if file_obj.filename == '':
-                return jsonify({
-                    'success': False,
-                    'error': 'No file selected'
-                }), 400
-            
-            # Validate file type
-            if not file_obj.filename.lower().endswith('.pdf'):
+            # Check that a PDF was actually selected
+            error = upload_error(file_obj)
+            if error:
+                metrics.count_error('bad_request')
                 return jsonify({
                     'success': False,
-                    'error': f'Invalid file type: {file_obj.filename}. Please send PDF only.'
+                    'error': error
                 }), 400
             
-            print(f"📄 Processing uploaded file: {file_obj.filename}")
+            logger.debug('Processing uploaded file: %s', file_obj.filename)
         
         else:
+            metrics.count_error('bad_request')
             return jsonify({
                 'success': False,
                 'error': 'No file provided. Send either "file" (file upload) or "file_url" (URL to PDF)'
             }), 400
         
-        # Extract text from PDF
-        extracted_text = extract_pdf_data(file_obj)
-        print(f"✅ Extracted text length: {len(extracted_text)} characters")
+        # Signature, password and size limits - a few KB read, before any hashing or extraction
+        try:
+            info = inspect_pdf(file_obj)
+        except PreflightError as e:
+            metrics.count_error('too_large' if e.status_code == 413 else 'invalid_pdf')
+            logger.info('Refused before extraction: %s', e)
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), e.status_code
+        logger.debug('PDF %s: %s pages, fingerprint %s', info.version, info.page_count, info.fingerprint)
+        
+        # Return the stored result if this exact PDF was processed before
+        version = SPLIT_VERSION if split else RESULT_VERSION
+        cache_key = content_key(file_obj, f'{version}/explain' if explain else version)
+        receipt_data = result_cache.get(cache_key)
         
-        # Parse receipt information
-        receipt_data = parse_receipt_data(extracted_text)
+        metrics.CACHE.labels('hit' if receipt_data is not None else 'miss').inc()
+        
+        if receipt_data is not None:
+            cache_status = 'HIT'
+        else:
+            # Extract and parse in an isolated worker - a hostile PDF can't hang or bloat this process
+            try:
+                # Each gate is held only for its own pool's part of the work,
+                # and the worker reuses the preflight above instead of inspecting the PDF again
+                if split:
+                    outcome = process_pdf_receipts(batch_processor, file_obj.read(), explain, admission_gate,
+                                                   ocr_gate, info)
+                else:
+                    job = partial(process_pdf_bytes, explain=explain, info=info)
+                    outcome = batch_processor.call(job, file_obj.read(), admission_gate, ocr_gate)
+            except Rejected as e:
+                logger.warning('Load shed: %s', e)
+                return rejected_response(e)
+            except WorkerAborted as e:
+                logger.warning('Extraction aborted: %s', e)
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), e.status_code
+            if not outcome['success']:
+                logger.warning('Error processing receipt: %s', outcome['error'])
+                return jsonify(outcome), 500
+            receipt_data = outcome['receipts'] if split else outcome['data']
+            result_cache.set(cache_key, receipt_data)
+            cache_status = 'MISS'
+        
+        if split:
+            return split_response(receipt_data, info.fingerprint), 200, {'X-Cache': cache_status}
+        
+        # Checked on cache hits too - a byte-identical resubmission is still a duplicate
+        duplicate_of = dedup_index.check(receipt_data, g.request_id)
         
         # Return structured data to chatbot
-        return jsonify({
+        started = time.perf_counter()
+        response = jsonify({
             'success': True,
             'data': receipt_data,
+            'duplicate_of': duplicate_of,
+            'fingerprint': info.fingerprint,
             'message': 'Receipt processed successfully'
-        }), 200
+        })
+        metrics.observe_stage('serialize', time.perf_counter() - started)
+        return response, 200, {'X-Cache': cache_status}
         
+    except HTTPException:
+        # e.g. 413 from MAX_CONTENT_LENGTH - answered by the error handlers below
+        raise
     except Exception as e:
-        print(f"❌ Error processing receipt: {str(e)}")
+        metrics.count_error('internal')
+        logger.exception('Error processing receipt')
         return jsonify({
             'success': False,
             'error': f'Failed to process receipt: {str(e)}'
         }), 500
+    finally:
+        if downloaded is not None:
+            downloaded.close()
+
+def split_response(receipts, fingerprint):
+    """Response for a split PDF - 'data' and 'duplicate_of' describe its first receipt, as without split"""
+    items = [{'data': receipt, 'duplicate_of': dedup_index.check(receipt, f'{g.request_id}/{index}')}
+             for index, receipt in enumerate(receipts)]
+    started = time.perf_counter()
+    response = jsonify({
+        'success': True,
+        'data': items[0]['data'],
+        'duplicate_of': items[0]['duplicate_of'],
+        'receipts': items,
+        'fingerprint': fingerprint,
+        'message': f'{len(items)} receipt(s) processed successfully'
+    })
+    metrics.observe_stage('serialize', time.perf_counter() - started)
+    return response
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    metrics.count_error('too_large')
+    return jsonify({
+        'success': False,
+        'error': f'Request too large (maximum {app.config["MAX_CONTENT_LENGTH"]} bytes)'
+    }), 413
+
+@app.route('/process-receipts/batch', methods=['POST'])
+def process_receipts_batch():
+    """
+    Process many PDF receipts in parallel
+    
+    Expected:
+    - multipart/form-data with one or more 'files' fields (file uploads), OR
+    - JSON body {"file_urls": [...]} / form data with repeated 'file_urls' fields
+    
+    Returns: JSON with one result per item, in input order
+    """
+    uploads = request.files.getlist('files')
+    if request.is_json:
+        file_urls = (request.get_json(silent=True) or {}).get('file_urls') or []
+    else:
+        file_urls = request.form.getlist('file_urls')
+    
+    if not uploads and not file_urls:
+        return jsonify({
+            'success': False,
+            'error': 'No files provided. Send "files" (file uploads) or "file_urls" (list of PDF URLs)'
+        }), 400
+    
+    if not isinstance(file_urls, list) or not all(isinstance(url, str) for url in file_urls):
+        return jsonify({
+            'success': False,
+            'error': '"file_urls" must be a list of URLs'
+        }), 400
+    
+    if len(uploads) + len(file_urls) > BATCH_MAX_FILES:
+        return jsonify({
+            'success': False,
+            'error': f'Too many files: {len(uploads) + len(file_urls)} (maximum {BATCH_MAX_FILES} per batch)'
+        }), 413
+    
+    logger.debug('Batch of %d upload(s) and %d URL(s)', len(uploads), len(file_urls))
+    
+    results = []
+    jobs = []
+    pending = []  # (result index, cache key) for each submitted job
+    
+    for upload in uploads:
+        item = {'filename': upload.filename}
+        results.append(item)
+        
+        error = upload_error(upload)
+        if error:
+            metrics.count_error('bad_request')
+            item.update({'success': False, 'error': error})
+            continue
+        
+        cache_key = content_key(upload.stream)
+        cached = result_cache.get(cache_key)
+        metrics.CACHE.labels('hit' if cached is not None else 'miss').inc()
+        if cached is not None:
+            item.update({'success': True, 'data': cached})
+            continue
+        
+        jobs.append((process_pdf_bytes, upload.read()))
+        pending.append((len(results) - 1, cache_key))
+    
+    for file_url in file_urls:
+        results.append({'file_url': file_url})
+        jobs.append((process_pdf_url, file_url))
+        pending.append((len(results) - 1, None))
+    
+    for (index, cache_key), outcome in zip(pending, batch_processor.run(jobs)):
+        results[index].update(outcome)
+        if cache_key and outcome.get('success'):
+            result_cache.set(cache_key, outcome['data'])
+    
+    # In input order, so within a batch the first copy is the original
+    for index, item in enumerate(results):
+        if item.get('success'):
+            item['duplicate_of'] = dedup_index.check(item['data'], f'{g.request_id}/{index}')
+    
+    succeeded = sum(1 for item in results if item.get('success'))
+    logger.info('Batch done: %d/%d succeeded', succeeded, len(results))
+    
+    return jsonify({
+        'success': True,
+        'results': results,
+        'message': f'Processed {succeeded} of {len(results)} receipts'
+    }), 200
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Queue a PDF receipt for background processing
+    
+    Expected: same as /process-receipt ('file' upload or 'file_url')
+    
+    Returns: 202 with the job ID to poll at GET /jobs/<job_id>
+    """
+    file_url = request.form.get('file_url') or (request.get_json(silent=True) or {}).get('file_url')
+    
+    if file_url:
+        job_id = job_store.enqueue(file_url=file_url)
+    elif 'file' in request.files:
+        file_obj = request.files['file']
+        error = upload_error(file_obj)
+        if error:
+            return jsonify({
+                'success': False,
+                'error': error
+            }), 400
+        
+        # Already processed - the job is born finished
+        cache_key = content_key(file_obj.stream)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            job_id = job_store.enqueue(result=cached, dedup=dedup_index)
+        else:
+            job_id = job_store.enqueue(payload=file_obj.read())
+    else:
+        return jsonify({
+            'success': False,
+            'error': 'No file provided. Send either "file" (file upload) or "file_url" (URL to PDF)'
+        }), 400
+    
+    job_worker.notify()
+    logger.info('Queued job %s', job_id, extra={'job_id': job_id})
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': f'/jobs/{job_id}',
+        'message': 'Receipt queued for processing'
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Return the status of a queued job, plus its result once finished"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': f'Unknown job: {job_id}'
+        }), 404
+    
+    return jsonify({'success': True, **job}), 200
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -93,9 +433,26 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'service': 'PDF Receipt Processing API',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'cache': result_cache.stats(),
+        'workers': batch_processor.stats(),
+        'admission': admission_gate.stats(),
+        'ocr_admission': ocr_gate.stats() if ocr_gate else None,
+        'extraction_backends': backend_stats()
     }), 200
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe - 503 until the startup warmup has finished"""
+    status = warmup_status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics, summed over all worker processes"""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 @app.route('/', methods=['GET'])
 def index():
     """API documentation endpoint"""
@@ -105,7 +462,12 @@ def index():
         'endpoints': {
             '/': 'This documentation',
             '/health': 'Health check endpoint',
-            '/process-receipt': 'POST - Process PDF receipt'
+            '/ready': 'GET - Readiness probe (503 until warmed up)',
+            '/metrics': 'GET - Prometheus metrics',
+            '/process-receipt': 'POST - Process PDF receipt',
+            '/process-receipts/batch': 'POST - Process many PDF receipts in parallel',
+            '/jobs': 'POST - Queue a PDF receipt, returns a job ID',
+            '/jobs/<job_id>': 'GET - Job status and result'
         },
         'usage': {
             'method': 'POST',
@@ -113,7 +475,8 @@ def index():
             'options': [
                 {'content-type': 'multipart/form-data', 'body': 'file: <PDF file>'},
                 {'content-type': 'application/x-www-form-urlencoded', 'body': 'file_url: <URL to PDF>'}
-            ]
+            ],
+            'split': 'Add split=true to get every receipt in a merged PDF under "receipts"'
         }
     }), 200
 
@@ -123,5 +486,8 @@ if __name__ == '__main__':
     print("📚 Documentation: http://localhost:5000")
     print("💚 Health check: http://localhost:5000/health")
     print("\n⚡ Ready to process receipts (file upload OR file URL)!\n")
-    
+
+    # The debug reloader runs this file in a watcher process too; only the serving child takes jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_worker.start()
     app.run(host='0.0.0.0', port=5000, debug=True)
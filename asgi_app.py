@@ -0,0 +1,390 @@
+"""
+ASGI variant of the PDF Receipt Processing API
+Same /process-receipt, /health, /ready and / contract as app.py, served from an event loop
+
+file_url downloads use an async HTTP client, so a slow chatbot CDN no longer
+parks a whole worker. Hashing and extraction are CPU-bound and are handed to
+threads (extraction itself runs in the supervised worker pool).
+
+Run with:
+    uvicorn asgi_app:app --workers 2
+    gunicorn asgi_app:app -k uvicorn.workers.UvicornWorker
+"""
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from functools import partial
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import metrics
+from admission import Rejected, admission_gate_from_env, client_key, ocr_gate_from_env, rate_limiter_from_env
+from batch_processor import batch_processor_from_env, process_pdf_bytes
+from dedup_index import dedup_index_from_env
+from downloader import DownloadError, download_pdf_async, new_async_client
+from pdf_processor import backend_stats
+from preflight import PreflightError, inspect_pdf
+from receipt_result import json_default
+from receipt_splitter import SPLIT_VERSION, flag_requested, process_pdf_receipts
+from result_cache import RESULT_VERSION, cache_from_env, content_key
+from structured_log import configure_logging, new_request_id, request_id
+from warmup import start_warm_up, warmup_status
+from worker_pool import WorkerAborted
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(50 * 1024 * 1024)))
+
+result_cache = cache_from_env()
+batch_processor = batch_processor_from_env()
+dedup_index = dedup_index_from_env()
+rate_limiter = rate_limiter_from_env()
+admission_gate = admission_gate_from_env(batch_processor.pool_size)
+ocr_gate = ocr_gate_from_env(batch_processor.ocr_pool)
+
+# In the background - /ready is 503 until it is done (see app.py)
+start_warm_up()
+
+
+class ReceiptJSONResponse(JSONResponse):
+    """JSONResponse that can serialize Receipt results"""
+
+    def render(self, content):
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':'),
+                          default=json_default).encode('utf-8')
+
+
+def error_response(message, status_code):
+    return JSONResponse({'success': False, 'error': message}, status_code=status_code)
+
+
+def rejected_response(e):
+    """Fast 429/503 for a request turned away by admission control"""
+    metrics.count_error('rate_limited' if e.status_code == 429 else 'overloaded')
+    return JSONResponse({'success': False, 'error': str(e)}, status_code=e.status_code,
+                        headers={'Retry-After': str(e.retry_after)})
+
+
+class BodyTooLarge(Exception):
+    """The request body passed MAX_UPLOAD_BYTES while it was being read"""
+
+
+def limit_body(request, max_bytes):
+    """
+    The same request, reading its body through a receive channel that counts bytes as they arrive
+
+    Content-Length can be missing (chunked uploads) or wrong, and request.form()
+    buffers the whole body before any part's size is known, so the limit is
+    enforced on the stream itself.
+
+    Raises (while the body is read):
+        BodyTooLarge: More than max_bytes arrived
+    """
+    receive = request.receive
+    received = 0
+
+    async def limited_receive():
+        nonlocal received
+        message = await receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > max_bytes:
+                raise BodyTooLarge(f'Request too large (maximum {max_bytes} bytes)')
+        return message
+
+    return Request(request.scope, limited_receive)
+
+
+def upload_error(upload):
+    """Return an error message if an uploaded file is missing or not a PDF, else None"""
+    if not upload.filename:
+        return 'No file selected'
+    if not upload.filename.lower().endswith('.pdf'):
+        return f'Invalid file type: {upload.filename}. Please send PDF only.'
+    return None
+
+
+def read_with_key(file_obj, version):
+    """
+    Preflight facts, content hash and bytes of a file (runs in a thread - the last two touch the whole file)
+
+    Raises:
+        PreflightError: Refused before hashing (see preflight.inspect_pdf)
+    """
+    info = inspect_pdf(file_obj)
+    return info, content_key(file_obj, version), file_obj.read()
+
+
+def check_receipts(receipts, request_key):
+    """Duplicate check for each receipt of a split PDF (runs in a thread)"""
+    return [{'data': receipt, 'duplicate_of': dedup_index.check(receipt, f'{request_key}/{index}')}
+            for index, receipt in enumerate(receipts)]
+
+
+async def process_receipt(request):
+    """
+    Process PDF receipt - accepts either file upload OR file URL
+
+    Expected:
+    - multipart/form-data with 'file' field (file upload), OR
+    - form data or JSON with 'file_url' field (URL to PDF file)
+    - optional 'split' (form field, query parameter or JSON key) set to true
+      for PDFs that hold several receipts - each is returned under 'receipts'
+    - optional 'explain' set to true to add 'provenance' to each receipt: how
+      every field was found, with confidence scores
+
+    Returns: JSON with extracted receipt information
+    """
+    declared = request.headers.get('content-length')
+    if declared and declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES:
+        metrics.count_error('too_large')
+        return error_response(f'Request too large (maximum {MAX_UPLOAD_BYTES} bytes)', 413)
+
+    client = client_key(request.headers.get('x-forwarded-for'), request.client.host if request.client else None)
+    try:
+        await run_in_threadpool(rate_limiter.check, client)
+    except Rejected as e:
+        logger.info('Rate limited: %s', e)
+        return rejected_response(e)
+
+    request = limit_body(request, MAX_UPLOAD_BYTES)
+    file_obj = None
+    try:
+        try:
+            if request.headers.get('content-type', '').startswith('application/json'):
+                body = await request.json()
+                form = {}
+                flags = body if isinstance(body, dict) else {}
+                file_url = flags.get('file_url')
+            else:
+                form = flags = await request.form()
+                file_url = form.get('file_url')
+        except BodyTooLarge as e:
+            metrics.count_error('too_large')
+            return error_response(str(e), 413)
+        split = flag_requested(flags.get('split') or request.query_params.get('split'))
+        explain = flag_requested(flags.get('explain') or request.query_params.get('explain'))
+
+        if file_url:
+            logger.debug('Downloading PDF from URL: %s', file_url)
+            started = time.perf_counter()
+            try:
+                file_obj = await download_pdf_async(file_url, request.app.state.http)
+            except DownloadError as e:
+                metrics.count_error('too_large' if e.status_code == 413 else 'download')
+                return error_response(str(e), e.status_code)
+            metrics.observe_stage('download', time.perf_counter() - started)
+
+        elif 'file' in form and not isinstance(form['file'], str):
+            upload = form['file']
+            error = upload_error(upload)
+            if error:
+                metrics.count_error('bad_request')
+                return error_response(error, 400)
+
+            logger.debug('Processing uploaded file: %s', upload.filename)
+            file_obj = upload.file
+
+        else:
+            metrics.count_error('bad_request')
+            return error_response(
+                'No file provided. Send either "file" (file upload) or "file_url" (URL to PDF)', 400)
+
+        version = SPLIT_VERSION if split else RESULT_VERSION
+        if explain:
+            version = f'{version}/explain'
+        try:
+            info, cache_key, data = await run_in_threadpool(read_with_key, file_obj, version)
+        except PreflightError as e:
+            metrics.count_error('too_large' if e.status_code == 413 else 'invalid_pdf')
+            logger.info('Refused before extraction: %s', e)
+            return error_response(str(e), e.status_code)
+        logger.debug('PDF %s: %s pages, fingerprint %s', info.version, info.page_count, info.fingerprint)
+        receipt_data = result_cache.get(cache_key)
+        metrics.CACHE.labels('hit' if receipt_data is not None else 'miss').inc()
+
+        if receipt_data is not None:
+            cache_status = 'HIT'
+        else:
+            try:
+                # In a thread - it may wait for a slot at the admission gate (and at the OCR gate after it)
+                # The worker reuses info rather than inspecting the PDF again
+                if split:
+                    outcome = await run_in_threadpool(process_pdf_receipts, batch_processor, data, explain,
+                                                      admission_gate, ocr_gate, info)
+                else:
+                    job = partial(process_pdf_bytes, explain=explain, info=info)
+                    outcome = await run_in_threadpool(batch_processor.call, job, data, admission_gate, ocr_gate)
+            except Rejected as e:
+                logger.warning('Load shed: %s', e)
+                return rejected_response(e)
+            except WorkerAborted as e:
+                logger.warning('Extraction aborted: %s', e)
+                return error_response(str(e), e.status_code)
+            if not outcome['success']:
+                logger.warning('Error processing receipt: %s', outcome['error'])
+                return JSONResponse(outcome, status_code=500)
+            receipt_data = outcome['receipts'] if split else outcome['data']
+            result_cache.set(cache_key, receipt_data)
+            cache_status = 'MISS'
+
+        if split:
+            # 'data' and 'duplicate_of' describe the first receipt, as without split
+            items = await run_in_threadpool(check_receipts, receipt_data, request_id.get())
+            return ReceiptJSONResponse({
+                'success': True,
+                'data': items[0]['data'],
+                'duplicate_of': items[0]['duplicate_of'],
+                'receipts': items,
+                'fingerprint': info.fingerprint,
+                'message': f'{len(items)} receipt(s) processed successfully'
+            }, headers={'X-Cache': cache_status})
+
+        # Checked on cache hits too - a byte-identical resubmission is still a duplicate
+        duplicate_of = await run_in_threadpool(dedup_index.check, receipt_data, request_id.get())
+
+        started = time.perf_counter()
+        response = ReceiptJSONResponse({
+            'success': True,
+            'data': receipt_data,
+            'duplicate_of': duplicate_of,
+            'fingerprint': info.fingerprint,
+            'message': 'Receipt processed successfully'
+        }, headers={'X-Cache': cache_status})
+        metrics.observe_stage('serialize', time.perf_counter() - started)
+        return response
+
+    except Exception as e:
+        metrics.count_error('internal')
+        logger.exception('Error processing receipt')
+        return error_response(f'Failed to process receipt: {str(e)}', 500)
+    finally:
+        if file_obj is not None:
+            file_obj.close()
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    return JSONResponse({
+        'status': 'healthy',
+        'service': 'PDF Receipt Processing API',
+        'version': '1.0.0',
+        'cache': result_cache.stats(),
+        'workers': batch_processor.stats(),
+        'admission': admission_gate.stats(),
+        'ocr_admission': ocr_gate.stats() if ocr_gate else None,
+        'extraction_backends': backend_stats()
+    })
+
+
+async def readiness_check(request):
+    """Readiness probe - 503 until the startup warmup has finished"""
+    status = warmup_status()
+    return JSONResponse(status, status_code=200 if status['ready'] else 503)
+
+
+async def metrics_endpoint(request):
+    """Prometheus metrics, summed over all worker processes"""
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+
+async def index(request):
+    """API documentation endpoint"""
+    return JSONResponse({
+        'service': 'PDF Receipt Processing API',
+        'version': '1.0.0',
+        'endpoints': {
+            '/': 'This documentation',
+            '/health': 'Health check endpoint',
+            '/ready': 'GET - Readiness probe (503 until warmed up)',
+            '/metrics': 'GET - Prometheus metrics',
+            '/process-receipt': 'POST - Process PDF receipt'
+        },
+        'usage': {
+            'method': 'POST',
+            'url': '/process-receipt',
+            'options': [
+                {'content-type': 'multipart/form-data', 'body': 'file: <PDF file>'},
+                {'content-type': 'application/x-www-form-urlencoded', 'body': 'file_url: <URL to PDF>'}
+            ],
+            'split': 'Add split=true to get every receipt in a merged PDF under "receipts"'
+        }
+    })
+
+
+class RequestLogMiddleware:
+    """Tags each HTTP request with an ID (X-Request-ID) and logs one summary line when it finishes"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        incoming = dict(scope['headers']).get(b'x-request-id', b'').decode('latin-1')
+        rid = new_request_id(incoming)
+        started = time.perf_counter()
+        response = {}
+
+        async def send_with_id(message):
+            if message['type'] == 'http.response.start':
+                response.update(message)
+                message['headers'] = list(message.get('headers', [])) + [(b'x-request-id', rid.encode('latin-1'))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            status = response.get('status', 500)
+            cache = dict(response.get('headers', [])).get(b'x-cache')
+            duration = time.perf_counter() - started
+            endpoint = scope['path'] if scope['path'] in _ROUTE_PATHS else 'unmatched'
+            metrics.REQUESTS.labels(endpoint, str(status)).inc()
+            metrics.REQUEST_SECONDS.labels(endpoint).observe(duration)
+            logger.info('%s %s %d', scope['method'], scope['path'], status, extra={
+                'status': status,
+                'duration_ms': round(duration * 1000, 2),
+                'cache': cache.decode('latin-1') if cache else None,
+            })
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # One pooled client per process, shared by every request on its event loop
+    app.state.http = new_async_client()
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+        batch_processor.shutdown()
+
+
+routes = [
+    Route('/process-receipt', process_receipt, methods=['POST']),
+    Route('/health', health_check, methods=['GET']),
+    Route('/ready', readiness_check, methods=['GET']),
+    Route('/metrics', metrics_endpoint, methods=['GET']),
+    Route('/', index, methods=['GET']),
+]
+# Metric label values are limited to known routes
+_ROUTE_PATHS = {route.path for route in routes}
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(RequestLogMiddleware),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,282 @@
+"""
+Parallel batch processing of PDF receipts
+pdfplumber is CPU-bound and holds the GIL, so receipts are fanned out to a process pool
+
+The pool is a worker_pool.SupervisedPool: every job has a wall-clock deadline
+and CPU/memory limits, and workers are recycled after a number of jobs.
+"""
+import contextvars
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+import metrics
+import ocr
+from admission import Rejected, gate_slot
+from downloader import download_pdf
+from layout_extractor import parse_layout
+from pdf_processor import (EXTRACTION_MODE, PDF_MAX_PAGES, NoTextError, TextPageCounter, drain_backend_stats,
+                           iter_pdf_pages, merge_backend_stats)
+from preflight import PreflightError, inspect_pdf
+from receipt_parser import REQUIRED_FIELDS, parse_receipt_pages
+from worker_pool import SupervisedPool, WorkerAborted
+
+
+def _ocr_job(data, explain):
+    return partial(ocr.ocr_pdf_bytes, explain=True) if explain else ocr.ocr_pdf_bytes, data
+
+
+def _fields_found(result):
+    """Key fields read in a successful result, summed over its receipts for a split result"""
+    receipts = result['receipts'] if 'receipts' in result else [result['data']]
+    return sum(receipt[field] is not None for receipt in receipts for field, _ in REQUIRED_FIELDS)
+
+
+def process_pdf_file(file_obj, explain=False, info=None):
+    """
+    Extract and parse one receipt from a file object
+
+    Args:
+        file_obj: Seekable binary file-like object
+        explain (bool): Record field provenance (see receipt_parser.parse_receipt_data)
+        info (PdfInfo): This file's preflight.inspect_pdf result, when the caller already
+            has it; otherwise the file is checked here
+
+    Returns:
+        dict: {'success': True, 'data': {...}} or {'success': False, 'error': '...'}; with
+              OCR on, a scanned PDF's error also has an 'ocr_job' for BatchProcessor to hand
+              on, and so does the result of a PDF whose text pages lack a key field while
+              some of its pages have no text layer
+    """
+    pages = None
+    try:
+        # Batch items, jobs and URLs reach here without the web app's check
+        if info is None:
+            info = inspect_pdf(file_obj)
+        # Layout mode reads fields next to their labels; None means no usable words
+        data = parse_layout(file_obj, explain=explain) if EXTRACTION_MODE == 'layout' else None
+        if data is None:
+            # Pages are extracted lazily; parsing stops once all key fields are found
+            pages = TextPageCounter(iter_pdf_pages(file_obj))
+            data = parse_receipt_pages(pages, explain)
+            page_count = info.page_count and min(info.page_count, PDF_MAX_PAGES or info.page_count)
+            if (ocr.OCR_ENABLED and page_count and pages.text_pages < page_count
+                    and any(data[field] is None for field, _ in REQUIRED_FIELDS)):
+                # Mixed: the missing fields may be on the scanned pages - OCR reads those
+                file_obj.seek(0)
+                return {'success': True, 'data': data, 'ocr_job': _ocr_job(file_obj.read(), explain)}
+        return {'success': True, 'data': data}
+    except MemoryError:
+        # Let the worker supervisor report the limit breach
+        raise
+    except PreflightError as e:
+        metrics.count_error('too_large' if e.status_code == 413 else 'invalid_pdf')
+        return {'success': False, 'error': str(e)}
+    except NoTextError as e:
+        if not ocr.OCR_ENABLED:
+            metrics.count_error('extraction')
+            return {'success': False, 'error': f'Failed to process receipt: {str(e)}'}
+        # Scanned - OCR runs in its own pool, so this worker is freed for text PDFs
+        file_obj.seek(0)
+        return {'success': False, 'error': f'Failed to process receipt: {str(e)}',
+                'ocr_job': _ocr_job(file_obj.read(), explain)}
+    except Exception as e:
+        metrics.count_error('extraction')
+        return {'success': False, 'error': f'Failed to process receipt: {str(e)}'}
+    finally:
+        if pages is not None:
+            pages.close()
+
+
+def process_pdf_bytes(data, explain=False, info=None):
+    """
+    Extract and parse one receipt (runs inside a pool worker)
+
+    Args:
+        data (bytes): PDF file content
+        explain (bool): Record field provenance - submit as partial(process_pdf_bytes, explain=True)
+        info (PdfInfo): Preflight result the caller already has - submit as partial(process_pdf_bytes, info=info)
+
+    Returns:
+        dict: Same shape as process_pdf_file
+    """
+    metrics.count_bytes(len(data))
+    return process_pdf_file(BytesIO(data), explain, info)
+
+
+def process_pdf_url(file_url):
+    """
+    Download and process one receipt from a URL (runs inside a pool worker)
+
+    Args:
+        file_url (str): URL to a PDF file
+
+    Returns:
+        dict: Same shape as process_pdf_file
+    """
+    started = time.perf_counter()
+    try:
+        file_obj = download_pdf(file_url)
+    except Exception as e:
+        metrics.count_error('download')
+        return {'success': False, 'error': str(e)}
+    metrics.observe_stage('download', time.perf_counter() - started)
+
+    with file_obj:
+        metrics.count_bytes(file_obj.seek(0, os.SEEK_END))
+        file_obj.seek(0)
+        return process_pdf_file(file_obj)
+
+
+def _run_in_worker(job):
+    """Run a (function, argument) job and return its result plus the stats and metric samples it produced"""
+    metrics.buffer_samples()
+    func, arg = job
+    return func(arg), drain_backend_stats(), metrics.drain_samples()
+
+
+# receipt_errors_total type for each WorkerAborted status code
+_ABORT_ERRORS = {504: 'timeout', 422: 'resource_limit', 500: 'worker'}
+
+
+class BatchProcessor:
+    """
+    Runs receipt jobs on a lazily started, supervised process pool
+
+    - pool_size: number of worker processes
+    - max_pending: maximum jobs submitted to the pool at once; the rest wait
+      in the caller so a huge batch never queues thousands of payloads in memory
+    - timeout, cpu_limit, memory_limit, max_jobs_per_worker, start_method: see SupervisedPool
+    - ocr_pool: SupervisedPool that runs the 'ocr_job' a scanned PDF's result
+      hands on (see ocr.py); without one, scanned PDFs fail as before
+    """
+
+    def __init__(self, pool_size=None, max_pending=None, timeout=None, cpu_limit=None,
+                 memory_limit=None, max_jobs_per_worker=None, ocr_pool=None, start_method=None):
+        self.pool_size = pool_size or os.cpu_count() or 1
+        self.max_pending = max_pending or self.pool_size * 2
+        self.pool = SupervisedPool(self.pool_size, timeout=timeout, cpu_limit=cpu_limit,
+                                   memory_limit=memory_limit, max_jobs_per_worker=max_jobs_per_worker,
+                                   start_method=start_method)
+        self.ocr_pool = ocr_pool
+
+    def _call_pool(self, pool, func, arg):
+        try:
+            result, stats, samples = pool.call(_run_in_worker, (func, arg))
+        except WorkerAborted as e:
+            metrics.count_error(_ABORT_ERRORS.get(e.status_code, 'worker'))
+            raise
+        # Timings are recorded in the worker; fold them into this process for /health and /metrics
+        merge_backend_stats(stats)
+        metrics.replay_samples(samples)
+        return result
+
+    def call(self, func, arg, gate=None, ocr_gate=None):
+        """
+        Run one job in a worker process, then the OCR job its result hands on (if any) in the OCR pool
+
+        A result that already succeeded from the PDF's text pages is kept unless
+        OCR finds more of its key fields (OCR failing, timing out or being
+        turned away included).
+
+        Args:
+            func: Job function, e.g. process_pdf_bytes
+            arg: Its argument
+            gate (AdmissionGate): Held for the extraction job only
+            ocr_gate (AdmissionGate): Held for the OCR job only, so OCR never occupies an extraction slot
+
+        Raises:
+            WorkerAborted: Deadline passed (504), resource limit hit (422) or the job crashed (500)
+            Rejected: A gate turned the job away (503)
+        """
+        with gate_slot(gate):
+            result = self._call_pool(self.pool, func, arg)
+        ocr_job = result.pop('ocr_job', None) if isinstance(result, dict) else None
+        if ocr_job is None:
+            return result
+        if self.ocr_pool is None:
+            if not result['success']:
+                metrics.count_error('extraction')
+            return result
+        if not result['success']:
+            with gate_slot(ocr_gate):
+                return self._call_pool(self.ocr_pool, *ocr_job)
+        try:
+            with gate_slot(ocr_gate):
+                ocr_result = self._call_pool(self.ocr_pool, *ocr_job)
+        except (WorkerAborted, Rejected):
+            return result
+        if ocr_result['success'] and _fields_found(ocr_result) > _fields_found(result):
+            return ocr_result
+        return result
+
+    def _run_one(self, job):
+        func, arg = job
+        try:
+            return self.call(func, arg)
+        except WorkerAborted as e:
+            # Timed out or hit a limit - report it on this item only
+            return {'success': False, 'error': str(e)}
+
+    def run(self, jobs):
+        """
+        Run jobs and return their results in input order
+
+        Args:
+            jobs (list): (function, argument) pairs, e.g. (process_pdf_bytes, data)
+
+        Returns:
+            list: One result dict per job
+        """
+        if not jobs:
+            return []
+        # Each thread just waits on a worker process, so threads are cheap here
+        with ThreadPoolExecutor(max_workers=min(self.max_pending, len(jobs))) as threads:
+            # Each job keeps the caller's context, so its log lines carry the request ID
+            futures = [threads.submit(contextvars.copy_context().run, self._run_one, job) for job in jobs]
+            return [future.result() for future in futures]
+
+    def imap(self, jobs):
+        """
+        Run jobs from any iterable and yield their results in input order
+
+        Only max_pending jobs are taken from the iterable ahead of the result
+        being yielded, so a generator over a huge archive runs in bounded memory.
+
+        Args:
+            jobs: Iterable of (function, argument) pairs
+
+        Yields:
+            dict: One result per job
+        """
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.max_pending) as threads:
+            for job in jobs:
+                if len(pending) >= self.max_pending:
+                    yield pending.popleft().result()
+                pending.append(threads.submit(contextvars.copy_context().run, self._run_one, job))
+            while pending:
+                yield pending.popleft().result()
+
+    def stats(self):
+        stats = self.pool.stats()
+        if self.ocr_pool is not None:
+            stats['ocr'] = self.ocr_pool.stats()
+        return stats
+
+    def shutdown(self):
+        self.pool.shutdown()
+        if self.ocr_pool is not None:
+            self.ocr_pool.shutdown()
+
+
+def batch_processor_from_env():
+    """Create the processor configured by BATCH_POOL_SIZE / BATCH_MAX_PENDING, the EXTRACT_* limits and OCR_*"""
+    return BatchProcessor(
+        pool_size=int(os.environ.get('BATCH_POOL_SIZE', '0')) or None,
+        max_pending=int(os.environ.get('BATCH_MAX_PENDING', '0')) or None,
+        ocr_pool=ocr.ocr_pool_from_env(),
+    )
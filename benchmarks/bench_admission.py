@@ -0,0 +1,92 @@
+"""
+Benchmark: cost of admission control and what it does to a retry burst
+
+- Rate limiter: time per check() from one process, then from --processes
+  processes at once sharing the SQLite buckets (as gunicorn workers do).
+- Burst: --burst requests arrive together at a gate in front of a pool of
+  --slots extractions of --job-ms each. Reports how many were served, how
+  many were shed and how fast each group got its answer.
+
+Usage:
+    python benchmarks/bench_admission.py [--checks 20000] [--processes 4] [--burst 200]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import AdmissionGate, RateLimiter, Rejected  # noqa: E402
+
+
+def run_checks(path, checks, worker):
+    limiter = RateLimiter(path, per_minute=1e9, burst=1000)
+    started = time.perf_counter()
+    for i in range(checks):
+        limiter.check(f'client-{worker}-{i % 100}')
+    return time.perf_counter() - started
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--checks', type=int, default=20000)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--burst', type=int, default=200)
+    parser.add_argument('--slots', type=int, default=2)
+    parser.add_argument('--job-ms', type=float, default=50)
+    parser.add_argument('--max-wait', type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'rate.sqlite3')
+        elapsed = run_checks(path, args.checks, 0)
+        print(f'Rate limit check, 1 process:   {elapsed / args.checks * 1e6:7.1f} us')
+        with multiprocessing.Pool(args.processes) as pool:
+            started = time.perf_counter()
+            pool.starmap(run_checks, [(path, args.checks, n) for n in range(1, args.processes + 1)])
+            wall = time.perf_counter() - started
+        print(f'Rate limit check, {args.processes} processes: {args.checks * args.processes / wall:7.0f} checks/s total')
+
+    gate = AdmissionGate(max_in_flight=args.slots, max_queue=args.slots * 4, max_wait=args.max_wait)
+    gate.average_seconds = args.job_ms / 1000
+    served, shed = [], []
+    start = threading.Event()
+
+    def request():
+        start.wait()
+        started = time.perf_counter()
+        try:
+            with gate.slot():
+                time.sleep(args.job_ms / 1000)
+        except Rejected:
+            shed.append(time.perf_counter() - started)
+        else:
+            served.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=request) for _ in range(args.burst)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+
+    print(f'Burst of {args.burst} on {args.slots} slots x {args.job_ms:.0f} ms:')
+    print(f'  served {len(served):4d}  p50 {percentile(served, 0.5) * 1000:7.1f} ms  '
+          f'max {max(served, default=0) * 1000:7.1f} ms')
+    print(f'  shed   {len(shed):4d}  p50 {percentile(shed, 0.5) * 1000:7.2f} ms  '
+          f'max {max(shed, default=0) * 1000:7.2f} ms')
+    print(f'  without shedding the last request would wait ~{args.burst / args.slots * args.job_ms / 1000:.1f} s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
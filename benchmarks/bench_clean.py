@@ -0,0 +1,85 @@
+"""
+Benchmark: clean_duplicate_chars on 1 MB inputs, legacy loop vs regex implementation
+
+Usage:
+    python benchmarks/bench_clean.py [--size 1000000] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_processor import clean_duplicate_chars  # noqa: E402
+
+
+def legacy_clean_duplicate_chars(text):
+    """The original character-by-character implementation"""
+    if not text:
+        return text
+    result = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if i + 3 < len(text) and all(text[i+j] == char for j in range(4)):
+            result.append(char)
+            i += 4
+        else:
+            result.append(char)
+            i += 1
+    return ''.join(result)
+
+
+def receipt_like_text(size, seed=7):
+    """Plain receipt-style text of roughly `size` characters"""
+    rng = random.Random(seed)
+    words = ['Maybank', 'Transfer', 'Successful', 'RM', '1,250.00', 'Reference', 'M2U_20251203_0937',
+             'Beneficiary', 'account', 'number', '5641', '9177', '5091', '03/12/2025', '09:37:45']
+    parts = []
+    length = 0
+    while length < size:
+        word = rng.choice(words)
+        parts.append(word)
+        length += len(word) + 1
+    return ' '.join(parts)[:size]
+
+
+def best_time(func, text, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    clean = receipt_like_text(args.size)
+    # Artifact pages come out of pdfplumber as 4x lines joined by single newlines
+    source = clean[:args.size // 4]
+    duplicated = '\n'.join(''.join(c * 4 for c in source[i:i + 40]) for i in range(0, len(source), 40))
+
+    failed = False
+    for name, text in [('clean text (no artifact)', clean), ('4x duplicated text', duplicated)]:
+        if clean_duplicate_chars(text) != legacy_clean_duplicate_chars(text):
+            print(f'{name}: OUTPUT MISMATCH')
+            failed = True
+            continue
+        before = best_time(legacy_clean_duplicate_chars, text, args.repeat)
+        after = best_time(clean_duplicate_chars, text, args.repeat)
+        print(f'{name} ({len(text):,} chars)')
+        print(f'  Before: {before * 1000:9.2f} ms')
+        print(f'  After:  {after * 1000:9.2f} ms')
+        print(f'  Speedup: {before / after:8.1f}x')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Benchmark: duplicate index lookups and inserts with millions of rows
+
+Bulk-imports synthetic receipts into a fresh index, then times check() for
+new receipts (one insert) and duplicates (insert ignored + lookup), and
+lookup() on its own.
+
+Usage:
+    python benchmarks/bench_dedup.py [--rows 1000000] [--ops 10000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import receipt_parser  # noqa: E402
+from dedup_index import DedupIndex  # noqa: E402
+
+
+def record(i):
+    bank = receipt_parser.BANKS[i % len(receipt_parser.BANKS)]
+    return {'bank': bank, 'transaction_id': f'TX{i:010d}', 'amount': (i % 500000) / 100 + 1,
+            'date': f'{i % 28 + 1:02d}/{i % 12 + 1:02d}/2025'}
+
+
+def time_ops(func, items):
+    started = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - started) / len(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--ops', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = DedupIndex(os.path.join(tmp, 'dedup.sqlite3'))
+        started = time.perf_counter()
+        counts = index.bulk_import(record(i) for i in range(args.rows))
+        imported_in = time.perf_counter() - started
+
+        existing = [record(rng.randrange(args.rows)) for _ in range(args.ops)]
+        new = [record(args.rows + i) for i in range(args.ops)]
+        lookup = time_ops(index.lookup, existing)
+        insert = time_ops(lambda data: index.check(data, 'bench'), new)
+        duplicate = time_ops(lambda data: index.check(data, 'bench-again'), existing)
+        size = os.path.getsize(index.db_path)
+
+    print(f"Rows:         {counts['imported']} imported in {imported_in:.1f}s ({size / 1e6:.0f} MB)")
+    print(f'lookup:       {lookup * 1e6:8.1f} µs')
+    print(f'check (new):  {insert * 1e6:8.1f} µs')
+    print(f'check (dup):  {duplicate * 1e6:8.1f} µs')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Benchmark: per-request logging overhead of the extraction + parsing path at each log level
+
+Runs the in-process pipeline (iter_pdf_pages + parse_receipt_pages, plus the
+one request summary line app.py logs) on a 3-page receipt. JSON lines are
+written to os.devnull, so the cost of formatting and the write syscalls is
+counted without flooding the terminal.
+
+Usage:
+    python benchmarks/bench_logging.py [--requests 500] [--repeat 3]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import write_pdf  # noqa: E402
+from pdf_processor import iter_pdf_pages  # noqa: E402
+from receipt_parser import parse_receipt_pages  # noqa: E402
+from structured_log import configure_logging, new_request_id  # noqa: E402
+
+RECEIPT = ['Maybank2u', 'Transfer Successful', 'Reference ID: M2U_20251203_0937', 'Date 03/12/2025 09:37:45',
+           'Amount', 'RM 100.00', 'Beneficiary account number', '5641 9177 5091']
+
+logger = logging.getLogger('app')
+
+
+def handle_request(pdf):
+    """What one /process-receipt cache miss does in-process, minus the worker hop"""
+    new_request_id()
+    started = time.perf_counter()
+    pages = iter_pdf_pages(BytesIO(pdf))
+    try:
+        data = parse_receipt_pages(pages)
+    finally:
+        pages.close()
+    logger.info('POST /process-receipt 200', extra={
+        'status': 200, 'duration_ms': round((time.perf_counter() - started) * 1000, 2), 'cache': 'MISS'
+    })
+    return data
+
+
+def time_requests(pdf, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        handle_request(pdf)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # Receipt fields on the last page, so every page is extracted and logged
+    pdf = write_pdf([['Statement page 1'], ['Statement page 2'], RECEIPT])
+
+    with open(os.devnull, 'w') as sink:
+        configure_logging(level='WARNING', stream=sink)
+        handle_request(pdf)  # warm up imports and regex caches
+
+        # Levels are interleaved within each round so machine noise hits them all alike
+        timings = dict.fromkeys(['WARNING', 'INFO', 'DEBUG'], float('inf'))
+        for _ in range(args.repeat):
+            for level in timings:
+                logging.getLogger().setLevel(level)
+                timings[level] = min(timings[level], time_requests(pdf, args.requests))
+
+    baseline = timings['WARNING']
+    for level, seconds in timings.items():
+        print(f'{level:8} {seconds * 1e6:8.1f} µs/request  (+{(seconds - baseline) * 1e6:6.1f} µs vs no logging)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Microbenchmark: per-receipt parse time, legacy parser vs compiled single-pass engine
+
+Also times the engine with explain=True (field provenance), for its cost when switched on.
+
+legacy_parser is frozen, so fields the engine is meant to read differently
+are listed in KNOWN_DIFFERENCES and counted apart; any other difference fails
+the run.
+
+Usage:
+    python benchmarks/bench_parser.py [--receipts 2000] [--repeat 3] [--seed 7]
+"""
+import argparse
+import contextlib
+import io
+import os
+import re
+import sys
+from collections import Counter
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import legacy_parser  # noqa: E402
+import receipt_parser  # noqa: E402
+from corpus import synthetic_receipt_texts  # noqa: E402
+
+_MAYBANK_ID_RE = re.compile(r'M2U_\d+_\d+|\d{9,12}[A-Z]')
+
+
+def _bank(text):
+    profile = receipt_parser.detect_bank(text.lower())
+    return profile.name if profile else None
+
+
+# Field -> [(why, test(text, legacy value, engine value))] for intended changes of behaviour
+KNOWN_DIFFERENCES = {
+    'transaction_id': [
+        # Bank profiles: the Maybank2u formats only run on Maybank receipts
+        ('Maybank ID formats are not read on other banks\' receipts',
+         lambda text, old, new: new is None and bool(_MAYBANK_ID_RE.fullmatch(old or ''))
+         and _bank(text) != 'Maybank'),
+        # The generic pattern tries the longest label first; legacy reads "Reference ID: 123" as "ID"
+        ('"Reference ID" is read as a label, not as the ID',
+         lambda text, old, new: old == 'ID' and new is not None and f'Reference ID: {new}' in text),
+    ],
+}
+
+
+def compare(texts):
+    """Count fields where the engine and legacy parser differ, by known reason ('unexplained' otherwise)"""
+    differences = Counter()
+    for text in texts:
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy = legacy_parser.parse_receipt_data(text)
+        result = dict(receipt_parser.parse_receipt_data(text))
+        for field, old in legacy.items():
+            new = result.get(field)
+            if old == new:
+                continue
+            reason = next((why for why, test in KNOWN_DIFFERENCES.get(field, ()) if test(text, old, new)),
+                          'unexplained')
+            differences[(field, reason)] += 1
+    return differences
+
+
+def time_parser(parse, texts, repeat):
+    """Return the best-of-repeat mean seconds per receipt (stdout silenced)"""
+    best = float('inf')
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for text in texts:
+                parse(text)
+            elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+    return best / len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--receipts', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    texts = synthetic_receipt_texts(args.receipts, args.seed)
+
+    differences = compare(texts)
+    unexplained = sum(count for (_, reason), count in differences.items() if reason == 'unexplained')
+
+    before = time_parser(legacy_parser.parse_receipt_data, texts, args.repeat)
+    after = time_parser(receipt_parser.parse_receipt_data, texts, args.repeat)
+    explained = time_parser(partial(receipt_parser.parse_receipt_data, explain=True), texts, args.repeat)
+
+    print(f'Receipts:     {len(texts)}')
+    print(f'Differences:  {sum(differences.values())} ({unexplained} unexplained)')
+    for (field, reason), count in sorted(differences.items()):
+        print(f'  {count:6d}  {field}: {reason}')
+    print(f'Before:       {before * 1e6:8.1f} µs/receipt')
+    print(f'After:        {after * 1e6:8.1f} µs/receipt')
+    print(f'Speedup:      {before / after:8.2f}x')
+    print(f'With explain: {explained * 1e6:8.1f} µs/receipt')
+    return 1 if unexplained else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Benchmark: cost of the pre-extraction checks against the work they save
+
+Times, per PDF:
+
+- preflight.inspect_pdf on a one-page receipt and on a long export (it reads
+  the header and xref only, so it should not grow with the page count)
+- the PyPDF2 page count it replaces in pdf_processor.pdf_page_count
+- full text extraction of the same PDF, which a refused file no longer reaches
+
+Usage:
+    python benchmarks/bench_preflight.py [--pages 500] [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+import PyPDF2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import synthetic_receipts, write_pdf  # noqa: E402
+from pdf_processor import iter_pdf_pages  # noqa: E402
+from preflight import PreflightError, inspect_pdf  # noqa: E402
+
+
+def per_call(func, data, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(BytesIO(data))
+    return (time.perf_counter() - started) / repeat
+
+
+def refuse(file_obj):
+    try:
+        inspect_pdf(file_obj)
+    except PreflightError:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    receipts = synthetic_receipts(args.pages, args.seed)
+    pdfs = {
+        '1 page': write_pdf([receipts[0].text.rstrip('\n').split('\n')]),
+        f'{args.pages} pages': write_pdf([receipt.text.rstrip('\n').split('\n') for receipt in receipts]),
+    }
+    for name, pdf in pdfs.items():
+        pages = inspect_pdf(BytesIO(pdf)).page_count
+        print(f'{name} ({len(pdf) / 1024:.0f} KB, {pages} pages counted):')
+        print(f'  preflight        {per_call(inspect_pdf, pdf, args.repeat) * 1e6:9.1f} us')
+        print(f'  PyPDF2 count     {per_call(lambda f: len(PyPDF2.PdfReader(f).pages), pdf, args.repeat) * 1e6:9.1f} us')
+        repeat = max(1, args.repeat // pages)
+        print(f'  full extraction  {per_call(lambda f: list(iter_pdf_pages(f)), pdf, repeat) * 1e6:9.1f} us')
+
+    html = b'<!DOCTYPE html><html><body>Link expired</body></html>' * 20
+    print(f'HTML error page refused in {per_call(refuse, html, args.repeat) * 1e6:.1f} us')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
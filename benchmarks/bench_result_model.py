@@ -0,0 +1,69 @@
+"""
+Benchmark: memory, pickle size and aggregation speed of Receipt results vs dicts
+
+Parses a synthetic corpus once, then holds the results both as Receipt
+objects and as the dicts parse_receipt_data used to return, and compares
+retained memory (tracemalloc), pickled size (what a pool worker sends back)
+and summing the amounts. Both forms share the same field strings, so the
+memory figure is the per-result overhead of the container itself.
+
+Usage:
+    python benchmarks/bench_result_model.py [--receipts 100000]
+"""
+import argparse
+import copy
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import receipt_parser  # noqa: E402
+from corpus import synthetic_receipt_texts  # noqa: E402
+
+
+def retained(build):
+    """Bytes still allocated by what build() returns"""
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--receipts', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    # Raw text is shared by both forms and dominates either way - compare without it too
+    texts = synthetic_receipt_texts(1000, args.seed)
+    parsed = [receipt_parser.parse_receipt_data(texts[i % len(texts)]) for i in range(args.receipts)]
+    for receipt in parsed:
+        receipt.raw_text = None
+
+    receipts, receipts_size = retained(lambda: [copy.copy(r) for r in parsed])
+    dicts, dicts_size = retained(lambda: [dict(r) for r in parsed])
+
+    started = time.perf_counter()
+    total_cents = sum(r.amount_cents for r in receipts if r.amount_cents is not None)
+    cents_time = time.perf_counter() - started
+    started = time.perf_counter()
+    total_float = sum(d['amount'] for d in dicts if d['amount'] is not None)
+    float_time = time.perf_counter() - started
+
+    print(f'Receipts:         {args.receipts} (raw_text excluded)')
+    print(f'Memory per result: dict {dicts_size / len(dicts):6.0f} B   Receipt {receipts_size / len(receipts):6.0f} B')
+    print(f'Pickled (1000):    dict {len(pickle.dumps(dicts[:1000])):6d} B   '
+          f'Receipt {len(pickle.dumps(receipts[:1000])):6d} B')
+    print(f'Sum of amounts:    floats {float_time * 1000:6.1f} ms ({total_float!r})')
+    print(f'                   cents  {cents_time * 1000:6.1f} ms ({total_cents / 100:.2f}, exact)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
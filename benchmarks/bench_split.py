@@ -0,0 +1,89 @@
+"""
+Benchmark: splitting a long export of merged receipts into one record per receipt
+
+Builds an export of synthetic receipts - one or two per page, with a
+statement continuation page now and then - and times:
+
+- split_pages alone at several export sizes (per-page cost should stay flat:
+  every page is scanned once, however many receipts precede it)
+- process_pdf_receipts end to end on pools of 1 and --workers processes
+
+and checks every receipt came back with its own transaction ID.
+
+Usage:
+    python benchmarks/bench_split.py [--pages 500] [--workers 4]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import receipt_splitter  # noqa: E402
+from batch_processor import BatchProcessor  # noqa: E402
+from corpus import STATEMENT_LINES, synthetic_receipts, write_pdf  # noqa: E402
+from pdf_processor import clean_duplicate_chars, iter_pdf_pages  # noqa: E402
+from receipt_parser import parse_receipt_data  # noqa: E402
+
+
+def build_export(pages, seed):
+    """Return (PDF bytes, transaction IDs in order) for an export of the given page count"""
+    rng = random.Random(seed)
+    # Receipts are told apart by their IDs: leave out those the parser reads none from
+    # (Maybank ID formats on other banks' receipts, see bench_parser.KNOWN_DIFFERENCES)
+    receipts = (receipt for receipt in synthetic_receipts(pages * 4, seed)
+                if parse_receipt_data(clean_duplicate_chars(receipt.text)).transaction_id)
+    page_lines = []
+    ids = []
+    for _ in range(pages):
+        if page_lines and rng.random() < 0.1:
+            page_lines.append(['Statement continuation'] + rng.sample(STATEMENT_LINES, 3))
+            continue
+        lines = []
+        for _ in range(rng.choice((1, 2))):
+            text = next(receipts).text
+            # As read after extraction (runs of 4 digits are taken for the 4x artifact)
+            ids.append(parse_receipt_data(clean_duplicate_chars(text)).transaction_id)
+            lines.extend(text.rstrip('\n').split('\n'))
+        page_lines.append(lines)
+    return write_pdf(page_lines), ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    pdf, ids = build_export(args.pages, args.seed)
+    pages = list(iter_pdf_pages(BytesIO(pdf)))
+    print(f'Export: {args.pages} pages, {len(ids)} receipts, {len(pdf) / 1024:.0f} KB')
+
+    for count in sorted({max(args.pages // 10, 1), max(args.pages // 2, 1), args.pages}):
+        started = time.perf_counter()
+        texts = receipt_splitter.split_pages(pages[:count])
+        elapsed = time.perf_counter() - started
+        print(f'split_pages  {count:5d} pages: {elapsed * 1000:8.1f} ms  '
+              f'({elapsed / count * 1e6:6.1f} us/page, {len(texts)} segments)')
+
+    for workers in sorted({1, args.workers}):
+        processor = BatchProcessor(pool_size=workers)
+        try:
+            started = time.perf_counter()
+            outcome = receipt_splitter.process_pdf_receipts(processor, pdf)
+            elapsed = time.perf_counter() - started
+        finally:
+            processor.shutdown()
+        found = [receipt.transaction_id for receipt in outcome.get('receipts', [])]
+        print(f'end to end   {workers:2d} worker(s): {elapsed * 1000:8.1f} ms  '
+              f'{len(found)} receipts, {"all" if found == ids else "NOT all"} IDs matched')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Benchmark: startup time and first-request latency, with and without the warmup
+
+Each run is a fresh interpreter that imports app.py and waits for its warmup
+(what a gunicorn master does with preload_app) and then posts receipts through the Flask test client.
+The first request also starts the fork server and its first extraction
+worker (see worker_pool.py), which does the lazy pdfminer/PyPDF2 setup
+itself either way; the warmup only spares the web process that work.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--backends pdfplumber]
+
+--backends sets PDF_BACKEND_ORDER in the children; the synthetic receipts
+are simple enough for the raw scanner, so force pdfplumber or pypdf2 to see
+their cold start.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in the child interpreter: prints one JSON line of timings in seconds
+CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+import app as api
+api.start_warm_up().join()
+ready = time.perf_counter() - started
+sys.path.insert(0, 'benchmarks')
+from corpus import generate_corpus
+from io import BytesIO
+
+client = api.app.test_client()
+timings = []
+for item in generate_corpus(4, seed=11, statement_ratio=0, artifact_ratio=0):
+    started = time.perf_counter()
+    response = client.post('/process-receipt', data={'file': (BytesIO(item.pdf), item.name)},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    timings.append(time.perf_counter() - started)
+api.batch_processor.shutdown()
+print(json.dumps({'ready': ready, 'warmup': api.warmup_status()['seconds'], 'first': timings[0],
+                  'steady': sorted(timings[1:])[len(timings[1:]) // 2]}))
+"""
+
+
+def measure(warmup, tmp, backends=None):
+    env = dict(os.environ, WARMUP='1' if warmup else '0', LOG_LEVEL='WARNING',
+               PROMETHEUS_MULTIPROC_DIR=tempfile.mkdtemp(dir=tmp),
+               DEDUP_DB_PATH=os.path.join(tempfile.mkdtemp(dir=tmp), 'dedup.sqlite3'),
+               JOB_DB_PATH=os.path.join(tempfile.mkdtemp(dir=tmp), 'jobs.sqlite3'))
+    if backends:
+        env['PDF_BACKEND_ORDER'] = backends
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, capture_output=True,
+                            text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--backends', help='PDF_BACKEND_ORDER for the measured processes')
+    args = parser.parse_args()
+
+    print(f'Median of {args.runs} fresh processes:')
+    print(f"{'':10} {'ready':>10} {'warmup':>10} {'1st request':>12} {'steady':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for warmup in (False, True):
+            runs = [measure(warmup, tmp, args.backends) for _ in range(args.runs)]
+            median = {key: statistics.median(run[key] or 0 for run in runs) for key in runs[0]}
+            print(f"{'warmup' if warmup else 'cold':10} {median['ready'] * 1000:8.0f}ms "
+                  f"{median['warmup'] * 1000:8.0f}ms {median['first'] * 1000:10.1f}ms "
+                  f"{median['steady'] * 1000:8.1f}ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
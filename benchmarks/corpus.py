@@ -0,0 +1,164 @@
+"""
+Synthetic receipt corpus: reproducible receipt texts and PDFs for benchmarks
+
+Covers all banks in receipt_parser.BANKS, each transaction ID / amount / date
+format the parser knows, multi-page statements and the 4x duplicated
+character artifact. The same seed always gives the same corpus.
+
+Usage (write the corpus to disk, one PDF per receipt plus manifest.jsonl):
+    python benchmarks/corpus.py --out corpus/ [--count 500] [--seed 7]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import receipt_parser  # noqa: E402
+from warmup import write_pdf  # noqa: E402,F401 - re-exported for the benchmarks
+
+STATUS_WORDS = ['Successful', 'Completed', 'Failed', 'Rejected', 'Pending', 'Processing', '']
+FILLER = [
+    'Thank you for banking with us.',
+    'This is a computer generated receipt and no signature is required.',
+    'For enquiries please call our customer care centre.',
+    'Company Registration No. 196001000142 (3813-K)',
+]
+STATEMENT_LINES = [
+    'Opening balance',
+    'DuitNow QR payment - GRAB',
+    'Interbank GIRO credit',
+    'Card purchase - TNG EWALLET',
+    'Service charge',
+    'Closing balance',
+]
+
+# expected: the values parse_receipt_data should return for bank and amount
+Receipt = namedtuple('Receipt', 'text bank amount')
+# kind: 'receipt', 'statement' (multi-page) or 'artifact' (4x duplicated characters)
+CorpusItem = namedtuple('CorpusItem', 'name kind bank amount pages pdf')
+
+
+def synthetic_receipts(count, seed=7):
+    """
+    Generate varied receipt texts covering every bank and each ID/amount/date format
+
+    Args:
+        count (int): Number of receipts
+        seed (int): Random seed, so runs are reproducible
+
+    Returns:
+        list: Receipt tuples (text, expected bank, expected amount)
+    """
+    rng = random.Random(seed)
+    receipts = []
+    for i in range(count):
+        bank = receipt_parser.BANKS[i % len(receipt_parser.BANKS)]
+        day, month = rng.randint(1, 28), rng.randint(1, 12)
+        trans_id = rng.choice([
+            f'M2U_2025{month:02d}{day:02d}_{rng.randint(0, 9999):04d}',
+            f'{rng.randint(10**8, 10**9 - 1)}M',
+            f'Reference ID: {rng.randint(10**9, 10**10 - 1)}',
+            f'Transaction No: TX-{rng.randint(1000, 99999)}',
+        ])
+        ringgit, sen = rng.randint(1, 9999), rng.randint(0, 99)
+        thousands, units = rng.randint(1, 99), rng.randint(0, 999)
+        whole = rng.randint(1, 500)
+        amount_text, amount = rng.choice([
+            (f'Amount\nRM {ringgit}.{sen:02d}', round(ringgit + sen / 100, 2)),
+            (f'Total: RM{thousands},{units:03d}.00', float(thousands * 1000 + units)),
+            (f'MYR {whole}', float(whole)),
+        ])
+        date = rng.choice([
+            f'{day:02d}/{month:02d}/2025',
+            f'2025-{month:02d}-{day:02d}',
+            f'{day} Dec 2025',
+        ])
+        lines = [
+            f'{bank} Online Banking',
+            rng.choice(STATUS_WORDS) + ' Transfer',
+            trans_id,
+            f'Date {date} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}',
+            amount_text,
+            'Beneficiary account number' if rng.random() < 0.5 else 'To Account',
+            f'{rng.randint(1000, 9999)} {rng.randint(1000, 9999)} {rng.randint(1000, 9999)}',
+        ]
+        lines.extend(rng.sample(FILLER, rng.randint(1, len(FILLER))))
+        receipts.append(Receipt('\n'.join(lines) + '\n', bank, amount))
+    return receipts
+
+
+def synthetic_receipt_texts(count, seed=7):
+    """Receipt texts only - see synthetic_receipts"""
+    return [receipt.text for receipt in synthetic_receipts(count, seed)]
+
+
+def _statement_page(rng, page_number, pages):
+    lines = [f'Account statement - page {page_number} of {pages}']
+    for _ in range(rng.randint(20, 40)):
+        lines.append(f'{rng.randint(1, 28):02d}/11/2025  {rng.choice(STATEMENT_LINES)}  '
+                     f'{rng.randint(1, 5000)}.{rng.randint(0, 99):02d}')
+    return lines
+
+
+def generate_corpus(count, seed=7, statement_ratio=0.2, artifact_ratio=0.1, max_pages=8):
+    """
+    Build a corpus of receipt PDFs
+
+    Args:
+        count (int): Number of PDFs
+        seed (int): Random seed
+        statement_ratio (float): Share of multi-page statements
+        artifact_ratio (float): Share of PDFs with every character drawn 4 times
+        max_pages (int): Most pages in a statement
+
+    Returns:
+        list: CorpusItem tuples
+    """
+    rng = random.Random(seed)
+    items = []
+    for i, receipt in enumerate(synthetic_receipts(count, seed)):
+        lines = receipt.text.rstrip('\n').split('\n')
+        roll = rng.random()
+        if roll < statement_ratio:
+            kind = 'statement'
+            total = rng.randint(2, max_pages)
+            pages = [_statement_page(rng, n, total) for n in range(1, total + 1)]
+            # Receipt details on the first page (early exit) or the last (every page read)
+            at = 0 if rng.random() < 0.5 else total - 1
+            pages[at] = lines + pages[at]
+        elif roll < statement_ratio + artifact_ratio:
+            kind = 'artifact'
+            pages = [[''.join(char * 4 for char in line) for line in lines]]
+        else:
+            kind = 'receipt'
+            pages = [lines]
+        items.append(CorpusItem(f'{i:05d}-{kind}.pdf', kind, receipt.bank, receipt.amount,
+                                len(pages), write_pdf(pages)))
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--out', required=True, help='Directory to write PDFs and manifest.jsonl to')
+    parser.add_argument('--count', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    items = generate_corpus(args.count, args.seed)
+    with open(os.path.join(args.out, 'manifest.jsonl'), 'w', encoding='utf-8') as manifest:
+        for item in items:
+            with open(os.path.join(args.out, item.name), 'wb') as f:
+                f.write(item.pdf)
+            manifest.write(json.dumps({'file': item.name, 'kind': item.kind, 'bank': item.bank,
+                                       'amount': item.amount, 'pages': item.pages}) + '\n')
+    print(f'Wrote {len(items)} PDFs to {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
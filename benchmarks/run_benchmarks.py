@@ -0,0 +1,219 @@
+"""
+Benchmark suite: throughput and p50/p95/p99 latency per pipeline stage on a synthetic corpus
+
+Stages:
+- extract:  pdf_processor.extract_pdf_data on each PDF
+- clean:    clean_duplicate_chars on each raw extracted page (artifact pages included)
+- parse:    receipt_parser.parse_receipt_data on each cleaned text
+- layout:   layout_extractor.parse_layout on each PDF (EXTRACTION_MODE=layout: word
+            positions and label rules, extraction and parsing together)
+- app:      POST /process-receipt through the Flask test client (result cache off,
+            so every request is extracted in the worker pool)
+
+Results are written as JSON, so two versions can be compared:
+    python benchmarks/run_benchmarks.py --count 300 --output before.json
+    ... change code ...
+    python benchmarks/run_benchmarks.py --count 300 --output after.json --compare before.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app as api  # noqa: E402
+import layout_extractor  # noqa: E402
+import pdf_processor  # noqa: E402
+import receipt_parser  # noqa: E402
+from corpus import generate_corpus  # noqa: E402
+from result_cache import ResultCache  # noqa: E402
+
+
+def summarize(samples):
+    """
+    Throughput and latency percentiles for one stage
+
+    Args:
+        samples (list): Seconds per operation
+
+    Returns:
+        dict: count, total_s, ops_per_s, mean/p50/p95/p99/max in ms
+    """
+    total = sum(samples)
+    cuts = statistics.quantiles(samples, n=100, method='inclusive') if len(samples) > 1 else samples * 99
+    return {
+        'count': len(samples),
+        'total_s': round(total, 4),
+        'ops_per_s': round(len(samples) / total, 1) if total else None,
+        'mean_ms': round(total / len(samples) * 1000, 4),
+        'p50_ms': round(cuts[49] * 1000, 4),
+        'p95_ms': round(cuts[94] * 1000, 4),
+        'p99_ms': round(cuts[98] * 1000, 4),
+        'max_ms': round(max(samples) * 1000, 4),
+    }
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def bench_extract(items):
+    samples, texts = [], []
+    for item in items:
+        seconds, text = timed(pdf_processor.extract_pdf_data, BytesIO(item.pdf))
+        samples.append(seconds)
+        texts.append(text)
+    return samples, texts
+
+
+def bench_clean(items):
+    """Time cleaning alone on raw page text, as the first configured backend returns it"""
+    read_pages = pdf_processor.EXTRACTION_BACKENDS[pdf_processor.PDF_BACKEND_ORDER[0]]
+    raw_pages = []
+    for item in items:
+        for _, text in read_pages(BytesIO(item.pdf), 0, None):
+            raw_pages.append(text or '')
+    return [timed(pdf_processor.clean_duplicate_chars, text)[0] for text in raw_pages]
+
+
+def bench_parse(items, texts):
+    samples, correct = [], 0
+    for item, text in zip(items, texts):
+        seconds, result = timed(receipt_parser.parse_receipt_data, text)
+        samples.append(seconds)
+        correct += result['bank'] == item.bank and result['amount'] == item.amount
+    return samples, correct / len(items)
+
+
+def bench_layout(items):
+    samples, correct = [], 0
+    for item in items:
+        seconds, result = timed(layout_extractor.parse_layout, BytesIO(item.pdf))
+        samples.append(seconds)
+        correct += result is not None and result['bank'] == item.bank and result['amount'] == item.amount
+    return samples, correct / len(items)
+
+
+def bench_app(items):
+    client = api.app.test_client()
+    # Start the extraction worker process outside the timed requests
+    client.post('/process-receipt', data={'file': (BytesIO(items[0].pdf), items[0].name)},
+                content_type='multipart/form-data')
+    samples, failures = [], 0
+    for item in items:
+        seconds, response = timed(client.post, '/process-receipt',
+                                  data={'file': (BytesIO(item.pdf), item.name)},
+                                  content_type='multipart/form-data')
+        samples.append(seconds)
+        failures += response.status_code != 200
+    return samples, failures
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(count, seed, stages):
+    items = generate_corpus(count, seed)
+    kinds = {kind: sum(item.kind == kind for item in items) for kind in ('receipt', 'statement', 'artifact')}
+    pages = sum(item.pages for item in items)
+    results = {}
+
+    # Warm up imports and regex caches outside the timed runs
+    pdf_processor.extract_pdf_data(BytesIO(items[0].pdf))
+
+    texts = None
+    if 'extract' in stages or 'parse' in stages:
+        samples, texts = bench_extract(items)
+        if 'extract' in stages:
+            results['extract'] = summarize(samples)
+            results['extract']['pages_per_s'] = round(pages / sum(samples), 1)
+    if 'clean' in stages:
+        results['clean'] = summarize(bench_clean(items))
+    if 'parse' in stages:
+        samples, accuracy = bench_parse(items, texts)
+        results['parse'] = summarize(samples)
+        results['parse']['accuracy'] = round(accuracy, 4)
+    if 'layout' in stages:
+        samples, accuracy = bench_layout(items)
+        results['layout'] = summarize(samples)
+        results['layout']['accuracy'] = round(accuracy, 4)
+    if 'app' in stages:
+        api.result_cache = ResultCache(max_entries=0)
+        samples, failures = bench_app(items)
+        results['app'] = summarize(samples)
+        results['app']['failures'] = failures
+        api.batch_processor.shutdown()
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'git_revision': git_revision(),
+            'parser_version': receipt_parser.PARSER_VERSION,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'corpus': {'count': count, 'seed': seed, 'pages': pages, **kinds},
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline):
+    """Print p50/p95/p99 and throughput changes against an earlier results file"""
+    print(f"\nvs {baseline['meta'].get('git_revision')} ({baseline['meta']['timestamp']})")
+    for stage, now in current['results'].items():
+        before = baseline['results'].get(stage)
+        if not before:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'ops_per_s'):
+            if before.get(key) and now.get(key):
+                changes.append(f'{key} {now[key] / before[key]:5.2f}x')
+        print(f'  {stage:8} ' + '  '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=300, help='PDFs in the synthetic corpus')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--stages', default='extract,clean,parse,layout,app')
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report = run(args.count, args.seed, set(args.stages.split(',')))
+
+    for stage, result in report['results'].items():
+        print(f"{stage:8} {result['ops_per_s']:>10} ops/s  p50 {result['p50_ms']:9.3f} ms  "
+              f"p95 {result['p95_ms']:9.3f} ms  p99 {result['p99_ms']:9.3f} ms")
+    for stage in ('parse', 'layout'):
+        if stage in report['results']:
+            print(f"{stage} accuracy (bank + amount): {report['results'][stage]['accuracy']:.2%}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""
+Bulk offline processing of receipt directories and archives, without HTTP
+
+The source is a directory (searched recursively), a glob pattern, or a zip or
+tar archive (.tar, .tar.gz, .tgz, .tar.bz2, .tar.xz). Archive members are read
+one at a time straight from the archive - nothing is extracted to disk - and
+processed on the supervised worker pool, as the API does. Results are written
+in input order as they arrive, one per PDF:
+
+- jsonl: {"file": ..., "success": true, "data": {...}} - the batch endpoint's item shape
+- csv: one column per receipt field (raw_text left out)
+
+Only BATCH_MAX_PENDING PDFs are in memory at once, whatever the archive size.
+
+Every --checkpoint-every results the output is flushed to disk and a
+checkpoint (position in the source, output size) is saved next to it. Run
+the same command again after a crash and it picks up where it stopped (or
+starts over if the output file has since been deleted or truncated).
+
+Usage:
+    python bulk_process.py receipts/ --output results.jsonl
+    python bulk_process.py 'exports/2025-*/*.pdf' --output results.csv
+    python bulk_process.py archive.tar.gz --output results.jsonl [--workers 8]
+"""
+import argparse
+import atexit
+import csv
+import glob
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from collections import deque, namedtuple
+
+if __name__ == '__main__':
+    # Keep this run's samples out of the API's /metrics (metrics.py reads this at import)
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='pdf-receipt-bulk-metrics-')
+    atexit.register(shutil.rmtree, os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+
+from batch_processor import BatchProcessor, batch_processor_from_env, process_pdf_bytes  # noqa: E402
+from ocr import ocr_pool_from_env  # noqa: E402
+from receipt_result import json_default  # noqa: E402
+from warmup import warm_up  # noqa: E402
+
+FORMATS = ('jsonl', 'csv')
+CSV_COLUMNS = ['file', 'success', 'error', 'bank', 'transaction_id', 'amount', 'date', 'time',
+               'sender_account', 'receiver_account', 'status']
+
+# Larger members are reported as errors without being read
+MAX_PDF_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(50 * 1024 * 1024)))
+
+# data is the PDF content, or None with the reason in error
+Member = namedtuple('Member', 'name data error')
+
+
+def _too_large(size, max_bytes):
+    return f'File too large: {size} bytes (maximum {max_bytes})'
+
+
+def _read_file(path, name, max_bytes):
+    size = os.path.getsize(path)
+    if size > max_bytes:
+        return Member(name, None, _too_large(size, max_bytes))
+    with open(path, 'rb') as f:
+        return Member(name, f.read(), None)
+
+
+def _is_pdf(name):
+    return name.lower().endswith('.pdf')
+
+
+def iter_members(source, max_bytes=MAX_PDF_BYTES):
+    """
+    Yield the PDFs in a directory, glob or archive, one at a time and always in the same order
+
+    Args:
+        source (str): Directory, glob pattern, or zip/tar archive path
+        max_bytes (int): Members larger than this are yielded with an error instead of data
+
+    Yields:
+        Member: name (path relative to the directory, or archive member name), data, error
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for filename in sorted(files):
+                if _is_pdf(filename):
+                    path = os.path.join(root, filename)
+                    yield _read_file(path, os.path.relpath(path, source), max_bytes)
+    elif os.path.isfile(source) and zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not _is_pdf(info.filename):
+                    continue
+                if info.file_size > max_bytes:
+                    yield Member(info.filename, None, _too_large(info.file_size, max_bytes))
+                    continue
+                # The declared size can be wrong: zipfile stops at it and fails the CRC check,
+                # and a member that still runs past the limit is never passed on cut short
+                try:
+                    with archive.open(info) as f:
+                        data = f.read(max_bytes + 1)
+                except zipfile.BadZipFile as e:
+                    yield Member(info.filename, None, f'Damaged archive member: {e}')
+                    continue
+                if len(data) > max_bytes:
+                    yield Member(info.filename, None, _too_large(f'over {max_bytes}', max_bytes))
+                    continue
+                yield Member(info.filename, data, None)
+    elif os.path.isfile(source) and tarfile.is_tarfile(source):
+        # Stream mode ('r|*'): members are read in order, compressed archives are never seeked
+        with tarfile.open(source, 'r|*') as archive:
+            for info in archive:
+                if not info.isfile() or not _is_pdf(info.name):
+                    continue
+                if info.size > max_bytes:
+                    yield Member(info.name, None, _too_large(info.size, max_bytes))
+                    continue
+                yield Member(info.name, archive.extractfile(info).read(), None)
+    elif os.path.isfile(source):
+        yield _read_file(source, os.path.basename(source), max_bytes)
+    else:
+        for path in sorted(glob.glob(source, recursive=True)):
+            if _is_pdf(path) and os.path.isfile(path):
+                yield _read_file(path, path, max_bytes)
+
+
+def _row(item):
+    row = {'file': item['file'], 'success': item['success'], 'error': item.get('error')}
+    row.update({key: value for key, value in (item.get('data') or {}).items() if key in CSV_COLUMNS})
+    return row
+
+
+def load_checkpoint(path):
+    """Return the saved checkpoint dict, or None if there is none"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def resumable_checkpoint(path, output):
+    """
+    Return the saved checkpoint if output still holds the results it counts, or None to start over
+
+    Args:
+        path (str): Checkpoint file
+        output (str): Results file the checkpoint was saved for
+
+    Returns:
+        dict: The checkpoint, or None if there is none or output is missing or shorter than it records
+    """
+    saved = load_checkpoint(path)
+    if saved is None:
+        return None
+    try:
+        size = os.path.getsize(output)
+    except FileNotFoundError:
+        return None
+    return saved if size >= saved['output_bytes'] else None
+
+
+def save_checkpoint(path, state):
+    """Write the checkpoint atomically, so a crash mid-write leaves the previous one"""
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def run(source, output, fmt='jsonl', checkpoint=None, checkpoint_every=100, processor=None,
+        max_bytes=MAX_PDF_BYTES, progress=None):
+    """
+    Process every PDF in source into output, resuming from the checkpoint if there is one
+
+    Args:
+        source (str): Directory, glob pattern, or zip/tar archive
+        output (str): Results file
+        fmt (str): 'jsonl' or 'csv'
+        checkpoint (str): Checkpoint file (defaults to output + '.checkpoint'); removed when the run completes
+        checkpoint_every (int): Results between checkpoints
+        processor (BatchProcessor): Pool to run on (defaults to batch_processor_from_env)
+        max_bytes (int): Skip (report as failed) PDFs larger than this
+        progress: Optional function called with the counts after each checkpoint
+
+    Returns:
+        dict: done (PDFs in output), succeeded, failed, and resumed_at (PDFs skipped as already done)
+
+    Raises:
+        ValueError: The checkpoint belongs to a different source or format
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown output format: {fmt} (expected one of {", ".join(FORMATS)})')
+    checkpoint = checkpoint or f'{output}.checkpoint'
+    state = {'source': os.path.abspath(source), 'format': fmt, 'done': 0, 'succeeded': 0, 'failed': 0,
+             'output_bytes': 0}
+
+    # A checkpoint whose output was deleted or truncated is ignored, and the run starts over
+    saved = resumable_checkpoint(checkpoint, output)
+    if saved is not None:
+        if (saved['source'], saved['format']) != (state['source'], fmt):
+            raise ValueError(f'{checkpoint} is for {saved["source"]} ({saved["format"]}); '
+                             'delete it to start over')
+        state = saved
+        # Drop results written after the last checkpoint - they are redone
+        os.truncate(output, state['output_bytes'])
+    resumed_at = state['done']
+
+    own_processor = processor is None
+    processor = processor or batch_processor_from_env()
+    members = iter_members(source, max_bytes)
+    for _ in range(resumed_at):
+        if next(members, None) is None:
+            break
+
+    # Errors are kept in input order alongside the pool's results
+    def jobs(pending):
+        for member in members:
+            pending.append(member)
+            if member.data is not None:
+                yield process_pdf_bytes, member.data
+
+    try:
+        with open(output, 'a' if resumed_at else 'w', newline='', encoding='utf-8') as out:
+            writer = None
+            if fmt == 'csv':
+                writer = csv.DictWriter(out, CSV_COLUMNS)
+                if not resumed_at:
+                    writer.writeheader()
+
+            def write(item):
+                if writer is not None:
+                    writer.writerow(_row(item))
+                else:
+                    out.write(json.dumps(item, default=json_default) + '\n')
+                state['done'] += 1
+                state['succeeded' if item['success'] else 'failed'] += 1
+                if state['done'] % checkpoint_every == 0:
+                    out.flush()
+                    os.fsync(out.fileno())
+                    state['output_bytes'] = os.fstat(out.fileno()).st_size
+                    save_checkpoint(checkpoint, state)
+                    if progress:
+                        progress(state)
+
+            pending = deque()
+            for outcome in processor.imap(jobs(pending)):
+                # Members before this result that were never sent (too large) come first
+                while pending[0].data is None:
+                    member = pending.popleft()
+                    write({'file': member.name, 'success': False, 'error': member.error})
+                write({'file': pending.popleft().name, **outcome})
+            for member in pending:
+                write({'file': member.name, 'success': False, 'error': member.error})
+    finally:
+        if own_processor:
+            processor.shutdown()
+
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return {'done': state['done'], 'succeeded': state['succeeded'], 'failed': state['failed'],
+            'resumed_at': resumed_at}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Process a directory, glob or archive of PDF receipts')
+    parser.add_argument('source', help='Directory, glob pattern (quote it), or .zip/.tar[.gz|.bz2|.xz] archive')
+    parser.add_argument('--output', '-o', required=True, help='Results file (.jsonl or .csv)')
+    parser.add_argument('--format', choices=FORMATS, help='Defaults to the output file extension')
+    parser.add_argument('--checkpoint', help='Checkpoint file (defaults to OUTPUT.checkpoint)')
+    parser.add_argument('--checkpoint-every', type=int, default=100)
+    parser.add_argument('--workers', type=int, help='Extraction processes (defaults to BATCH_POOL_SIZE)')
+    args = parser.parse_args()
+
+    fmt = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+    processor = BatchProcessor(pool_size=args.workers, ocr_pool=ocr_pool_from_env()) if args.workers else None
+    # Warms the extractors used in this process (extraction workers start from a fork server, see worker_pool.py)
+    warm_up()
+
+    checkpoint_path = args.checkpoint or f'{args.output}.checkpoint'
+    checkpoint = resumable_checkpoint(checkpoint_path, args.output)
+    done_before = checkpoint['done'] if checkpoint else 0
+    if done_before:
+        print(f'Resuming after {done_before} PDFs', file=sys.stderr)
+    elif load_checkpoint(checkpoint_path) is not None:
+        print(f'{args.output} is missing or shorter than {checkpoint_path} records; starting over',
+              file=sys.stderr)
+    started = time.perf_counter()
+
+    def progress(state):
+        rate = (state['done'] - done_before) / (time.perf_counter() - started)
+        print(f"{state['done']} done ({state['failed']} failed), {rate:.1f}/s", file=sys.stderr)
+
+    try:
+        counts = run(args.source, args.output, fmt, args.checkpoint, args.checkpoint_every, processor,
+                     progress=progress)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{args.output}: {counts['succeeded']} succeeded, {counts['failed']} failed "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 0 if counts['done'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Shared pytest helpers for the PDF Receipt Processing API
+Builds small text-based PDFs in memory so tests don't need sample files
+"""
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Fresh metrics directory per test run (read by metrics.py when it is first imported)
+os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='pdf-receipt-metrics-')
+# Fresh duplicate index too, so receipts from earlier runs aren't reported as duplicates
+os.environ['DEDUP_DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='pdf-receipt-dedup-'), 'dedup.sqlite3')
+# No rate limit - tests send many requests from one address (test_admission.py builds its own limiters)
+os.environ['RATE_LIMIT_PER_MINUTE'] = '0'
+
+# Imported after the settings above - it pulls in metrics.py and the parser
+from warmup import write_pdf  # noqa: E402
+
+
+def make_pdf(pages):
+    """
+    Build a minimal text-based PDF (the warmup's generator, with uncompressed content streams)
+
+    Args:
+        pages (list): One entry per page, each a list of text lines
+
+    Returns:
+        bytes: PDF file content
+    """
+    return write_pdf(pages, compress=False)
+
+
+MAYBANK_RECEIPT = [
+    'Maybank2u',
+    'Transfer Successful',
+    'Reference ID: M2U_20251203_0937',
+    'Date 03/12/2025 09:37:45',
+    'Amount',
+    'RM 100.00',
+    'Beneficiary account number',
+    '5641 9177 5091',
+]
+
+
+@pytest.fixture
+def receipt_pdf():
+    """Bytes of a single-page Maybank transfer receipt"""
+    return make_pdf([MAYBANK_RECEIPT])
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    """
+    Serves the server's `files` dict: path -> bytes
+
+    - '/chunked/...' paths are sent without Content-Length
+    - '/cdn/...' paths carry ETag/Last-Modified and answer revalidation with 304
+    - server.fail_first[path] = n makes the first n requests for path return 503
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        self.server.client_ports.add(self.client_address[1])
+        body = self.server.files.get(self.path)
+
+        if self.server.fail_first.get(self.path, 0) > 0:
+            self.server.fail_first[self.path] -= 1
+            self._empty_response(503)
+            return
+
+        if body is None:
+            self._empty_response(404)
+            return
+
+        if self.path.startswith('/cdn/'):
+            etag = '"%08x"' % (hash(body) & 0xffffffff)
+            if self.headers.get('If-None-Match') == etag:
+                self._empty_response(304)
+                return
+
+        self.send_response(200)
+        if self.path.startswith('/cdn/'):
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', 'Wed, 03 Dec 2025 09:37:45 GMT')
+        if self.path.startswith('/chunked/'):
+            # No Content-Length: the client only learns the size while streaming
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for i in range(0, len(body), 4096):
+                piece = body[i:i + 4096]
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def _empty_response(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """
+    Local HTTP server standing in for the chatbot CDN
+
+    Put content in server.files['/path'] and fetch server.url + '/path'.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FileHandler)
+    server.files = {}
+    server.requests = []
+    server.client_ports = set()
+    server.fail_first = {}
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,224 @@
+"""
+Duplicate receipt detection across submissions
+The same transfer re-exported or printed to PDF has different bytes (so the
+result cache misses it) but the same bank, transaction ID, amount and date.
+
+Every parsed receipt is recorded in a SQLite table keyed on those four values.
+The key is the table's primary key (WITHOUT ROWID), so a lookup is one B-tree
+search and stays well under a millisecond with millions of rows.
+
+Bulk import of historical receipts (JSONL or CSV with bank, transaction_id,
+amount, date and an optional id column):
+    python dedup_index.py import history.jsonl [more.csv ...] [--db PATH]
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import closing
+from itertools import islice
+
+import metrics
+from receipt_result import parse_date, to_cents
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipts (
+    bank TEXT NOT NULL,
+    transaction_id TEXT NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    receipt_id TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    PRIMARY KEY (bank, transaction_id, amount_cents, date)
+) WITHOUT ROWID;
+"""
+
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_date(date):
+    """
+    Return the date as YYYY-MM-DD, so "03/12/2025" and "3 Dec 2025" match
+
+    Dates in no known format are returned lower-cased as they are, missing ones as ''.
+    """
+    if not date:
+        return ''
+    date = _SPACES_RE.sub(' ', str(date).strip())
+    parsed = parse_date(date)
+    return parsed.isoformat() if parsed else date.lower()
+
+
+def receipt_key(data):
+    """
+    Build the duplicate key for a parsed receipt
+
+    Args:
+        data (dict): Parsed receipt (see receipt_parser.parse_receipt_data)
+
+    Returns:
+        tuple: (bank, transaction_id, amount in cents, date), or None when the
+               bank, transaction ID or amount is missing (such receipts are not checked)
+    """
+    bank, transaction_id = data.get('bank'), data.get('transaction_id')
+    cents = to_cents(data.get('amount'))
+    if not bank or not transaction_id or cents is None:
+        return None
+    return bank, _SPACES_RE.sub('', str(transaction_id)).upper(), cents, normalize_date(data.get('date'))
+
+
+class DedupIndex:
+    """
+    SQLite-backed index of receipts seen so far
+
+    Lookups are on the request path, so each thread keeps its own open
+    connection instead of connecting per call (connections are reopened
+    after a fork).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        with closing(sqlite3.connect(db_path, timeout=30)) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            # WAL + NORMAL: commits don't fsync, a power loss can drop only the latest entries
+            local.conn.execute('PRAGMA synchronous=NORMAL')
+            local.pid = os.getpid()
+        return local.conn
+
+    def _find(self, key):
+        row = self._connection().execute(
+            'SELECT receipt_id FROM receipts WHERE bank = ? AND transaction_id = ? AND amount_cents = ? AND date = ?',
+            key
+        ).fetchone()
+        return row[0] if row else None
+
+    def lookup(self, data):
+        """Return the ID of the earlier submission of this receipt, or None (nothing is recorded)"""
+        key = receipt_key(data)
+        return self._find(key) if key is not None else None
+
+    def check(self, data, receipt_id):
+        """
+        Record a parsed receipt and report whether it was seen before
+
+        Args:
+            data (dict): Parsed receipt
+            receipt_id (str): ID of this submission (request or job ID)
+
+        Returns:
+            str or None: receipt_id of the first submission if this is a duplicate
+        """
+        key = receipt_key(data)
+        if key is None:
+            return None
+        cursor = self._connection().execute(
+            'INSERT OR IGNORE INTO receipts (bank, transaction_id, amount_cents, date, receipt_id, first_seen) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (*key, receipt_id, time.time())
+        )
+        if cursor.rowcount:
+            return None
+        original = self._find(key)
+        # The same submission checked twice (e.g. a requeued job) is not its own duplicate
+        if original == receipt_id:
+            return None
+        metrics.DUPLICATES.inc()
+        return original
+
+    def bulk_import(self, records, batch_size=10000):
+        """
+        Add historical receipts, keeping the first one of each duplicate key
+
+        Args:
+            records: Iterable of dicts with bank, transaction_id, amount, date
+                and optionally id (defaults to 'import:<position>')
+            batch_size (int): Rows per transaction
+
+        Returns:
+            dict: imported, duplicates (already indexed) and skipped (no key) counts
+        """
+        counts = {'imported': 0, 'duplicates': 0, 'skipped': 0}
+        now = time.time()
+        rows = iter(records)
+        position = 0
+        conn = self._connection()
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+            batch = []
+            for record in chunk:
+                position += 1
+                key = receipt_key(record)
+                if key is None:
+                    counts['skipped'] += 1
+                    continue
+                batch.append((*key, str(record.get('id') or f'import:{position}'), now))
+            if not batch:
+                continue
+            conn.execute('BEGIN')
+            try:
+                inserted = conn.executemany(
+                    'INSERT OR IGNORE INTO receipts (bank, transaction_id, amount_cents, date, receipt_id, '
+                    'first_seen) VALUES (?, ?, ?, ?, ?, ?)', batch
+                ).rowcount
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            counts['imported'] += inserted
+            counts['duplicates'] += len(batch) - inserted
+        return counts
+
+
+def dedup_index_from_env():
+    """Create the index at DEDUP_DB_PATH (defaults to a file in the temp directory)"""
+    return DedupIndex(os.environ.get('DEDUP_DB_PATH') or
+                      os.path.join(tempfile.gettempdir(), 'pdf-receipt-dedup.sqlite3'))
+
+
+def read_records(path):
+    """Yield receipt records from a .jsonl or .csv file"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the duplicate receipt index')
+    commands = parser.add_subparsers(dest='command', required=True)
+    importer = commands.add_parser('import', help='Bulk import historical receipts (JSONL or CSV)')
+    importer.add_argument('files', nargs='+')
+    importer.add_argument('--db', help='Index database (defaults to DEDUP_DB_PATH)')
+    importer.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    index = DedupIndex(args.db) if args.db else dedup_index_from_env()
+    for path in args.files:
+        started = time.perf_counter()
+        counts = index.bulk_import(read_records(path), args.batch_size)
+        print(f"{path}: {counts['imported']} imported, {counts['duplicates']} already indexed, "
+              f"{counts['skipped']} skipped (no bank/transaction ID/amount) "
+              f"in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
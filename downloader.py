@@ -0,0 +1,361 @@
+"""
+Streaming, size-limited download of PDF receipts from a URL
+The body is written in chunks to a spooled temporary file: small files stay in memory, large ones go to disk
+
+Downloads share one keep-alive requests.Session per worker process (connection
+pooling, retries with backoff); the ASGI app uses download_pdf_async with a
+shared httpx.AsyncClient instead. Responses carrying an ETag or Last-Modified
+header are copied to a local download cache (bounded by entries and total
+bytes), and repeat requests for the same URL send If-None-Match /
+If-Modified-Since so a 304 is served from that cache.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CHUNK_SIZE = 64 * 1024
+
+# Hard limit on downloaded PDF size, enforced while streaming
+MAX_DOWNLOAD_BYTES = int(os.environ.get('MAX_DOWNLOAD_BYTES', str(20 * 1024 * 1024)))
+# Downloads up to this size are kept in memory; larger ones spill to a temp file
+SPOOL_MAX_MEMORY = int(os.environ.get('SPOOL_MAX_MEMORY', str(2 * 1024 * 1024)))
+
+# Connection pool and retry tuning for the shared session
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', '10'))
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '10'))
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', '3'))
+HTTP_BACKOFF = float(os.environ.get('HTTP_BACKOFF', '0.3'))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '30'))
+# Concurrent connections for the async client (one event loop serves many requests)
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.environ.get('HTTP_ASYNC_MAX_CONNECTIONS', '100'))
+
+# Local cache of downloaded bytes for conditional requests (0 entries disables it)
+DOWNLOAD_CACHE_DIR = os.environ.get('DOWNLOAD_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'pdf-receipt-downloads')
+DOWNLOAD_CACHE_ENTRIES = int(os.environ.get('DOWNLOAD_CACHE_ENTRIES', '256'))
+# Total size of the cached downloads; bodies larger than this are never cached
+DOWNLOAD_CACHE_MAX_BYTES = int(os.environ.get('DOWNLOAD_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+
+class DownloadError(Exception):
+    """Download failed; status_code is the HTTP status to answer the client with"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return this process's shared session, creating it on first use
+
+    A forked worker must not reuse its parent's pooled sockets, so the
+    session is recreated when the process ID changes.
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            retry = Retry(
+                total=HTTP_RETRIES,
+                backoff_factor=HTTP_BACKOFF,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(['GET']),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS,
+                                  pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+class DownloadCache:
+    """
+    Downloaded PDFs plus their validators, one body/metadata file pair per URL
+
+    Entries are written atomically, so several workers can share the directory.
+    The oldest entries are evicted once there are more than max_entries or
+    their bodies add up to more than max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_entries=256, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = DOWNLOAD_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        if self.enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return bool(self.cache_dir) and self.max_entries > 0
+
+    def _paths(self, file_url):
+        key = hashlib.sha256(file_url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + '.pdf', base + '.json'
+
+    def validators(self, file_url):
+        """Return stored {'etag': ..., 'last_modified': ...} for file_url, or None"""
+        if not self.enabled:
+            return None
+        body_path, meta_path = self._paths(file_url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if os.path.exists(body_path) else None
+
+    def open(self, file_url):
+        """Open the cached body for reading, or return None if it was evicted"""
+        try:
+            return open(self._paths(file_url)[0], 'rb')
+        except OSError:
+            return None
+
+    def store(self, file_url, body, size, etag, last_modified):
+        """
+        Copy a downloaded body into the cache with its validators
+
+        Bodies over max_bytes are not kept, and a full or read-only disk only
+        costs the cache entry, never the download. body is rewound afterwards.
+
+        Returns:
+            bool: Whether the entry was stored
+        """
+        if not self.enabled or size > self.max_bytes:
+            return False
+        body_path, meta_path = self._paths(file_url)
+        tmp = tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix='.tmp', delete=False)
+        try:
+            with tmp:
+                body.seek(0)
+                shutil.copyfileobj(body, tmp, CHUNK_SIZE)
+            os.replace(tmp.name, body_path)
+
+            fd, meta_tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'url': file_url, 'etag': etag, 'last_modified': last_modified}, f)
+            os.replace(meta_tmp, meta_path)
+        except OSError:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+            return False
+        finally:
+            body.seek(0)
+        self._evict()
+        return True
+
+    def _evict(self):
+        try:
+            bodies = [(entry.path, entry.stat()) for entry in os.scandir(self.cache_dir)
+                      if entry.name.endswith('.pdf')]
+        except OSError:
+            return
+        total = sum(stat.st_size for _, stat in bodies)
+        bodies.sort(key=lambda body: body[1].st_mtime)
+        for path, stat in bodies:
+            if len(bodies) <= self.max_entries and total <= self.max_bytes:
+                break
+            for evicted in (path, path[:-4] + '.json'):
+                try:
+                    os.remove(evicted)
+                except OSError:
+                    pass
+            bodies = bodies[1:]
+            total -= stat.st_size
+
+
+download_cache = DownloadCache(DOWNLOAD_CACHE_DIR, DOWNLOAD_CACHE_ENTRIES, DOWNLOAD_CACHE_MAX_BYTES)
+
+
+def _conditional_headers(known):
+    """Revalidation headers for a cached download's validators"""
+    headers = {}
+    if known:
+        if known.get('etag'):
+            headers['If-None-Match'] = known['etag']
+        if known.get('last_modified'):
+            headers['If-Modified-Since'] = known['last_modified']
+    return headers
+
+
+def _check_response(status_code, headers, max_bytes):
+    """Reject non-200 responses, and bodies the server announces as oversized"""
+    if status_code != 200:
+        raise DownloadError(f'Failed to download file from URL (status {status_code})')
+    declared = headers.get('Content-Length')
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise DownloadError(f'File too large: {declared} bytes (maximum {max_bytes})', 413)
+
+
+class _SizeLimit:
+    """Counts streamed bytes - Content-Length can be missing or wrong, so count what actually arrives"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total = 0
+
+    def add(self, chunk):
+        self.total += len(chunk)
+        if self.total > self.max_bytes:
+            raise DownloadError(f'File too large: more than {self.max_bytes} bytes', 413)
+
+
+def _stream_body(response, out, max_bytes):
+    """Copy the response body into out, enforcing max_bytes as chunks arrive; returns its size"""
+    limit = _SizeLimit(max_bytes)
+    for chunk in response.iter_content(CHUNK_SIZE):
+        limit.add(chunk)
+        out.write(chunk)
+    return limit.total
+
+
+async def _astream_body(response, out, max_bytes):
+    """Async counterpart of _stream_body for httpx responses"""
+    limit = _SizeLimit(max_bytes)
+    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+        limit.add(chunk)
+        out.write(chunk)
+    return limit.total
+
+
+@contextmanager
+def _spooled_body(spool_max_memory):
+    """Spooled temp file to stream a download into; closed if streaming fails"""
+    spooled = SpooledTemporaryFile(max_size=spool_max_memory)
+    try:
+        yield spooled
+    except BaseException:
+        spooled.close()
+        raise
+
+
+def _keep_revalidatable(cache, file_url, headers, body, size):
+    """Copy a response carrying an ETag or Last-Modified into the cache, for later conditional requests"""
+    etag = headers.get('ETag')
+    last_modified = headers.get('Last-Modified')
+    if etag or last_modified:
+        cache.store(file_url, body, size, etag, last_modified)
+
+
+def download_pdf(file_url, max_bytes=None, spool_max_memory=None, timeout=None, cache=None):
+    """
+    Download a PDF into a spooled temporary file (or serve it from the download cache)
+
+    Args:
+        file_url (str): URL to the PDF file
+        max_bytes (int): Maximum allowed size (defaults to MAX_DOWNLOAD_BYTES)
+        spool_max_memory (int): Size above which the file spills to disk
+        timeout: (connect, read) timeouts in seconds
+        cache (DownloadCache): Cache for conditional requests (defaults to download_cache)
+
+    Returns:
+        file object: Rewound binary file - the caller must close it
+
+    Raises:
+        DownloadError: Non-200 response, or the file is larger than max_bytes
+    """
+    max_bytes = MAX_DOWNLOAD_BYTES if max_bytes is None else max_bytes
+    spool_max_memory = SPOOL_MAX_MEMORY if spool_max_memory is None else spool_max_memory
+    timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    cache = download_cache if cache is None else cache
+
+    known = cache.validators(file_url)
+    headers = _conditional_headers(known)
+
+    with get_session().get(file_url, stream=True, timeout=timeout, headers=headers) as response:
+        if response.status_code == 304 and known:
+            cached = cache.open(file_url)
+            if cached is not None:
+                return cached
+            # Evicted between the lookup and now - fetch it unconditionally
+            return download_pdf(file_url, max_bytes, spool_max_memory, timeout,
+                                cache=DownloadCache(None))
+
+        _check_response(response.status_code, response.headers, max_bytes)
+
+        with _spooled_body(spool_max_memory) as spooled:
+            size = _stream_body(response, spooled, max_bytes)
+            _keep_revalidatable(cache, file_url, response.headers, spooled, size)
+
+    spooled.seek(0)
+    return spooled
+
+
+def new_async_client():
+    """
+    Create an httpx.AsyncClient configured like the shared requests session
+
+    httpx retries only failed connection attempts (not 429/5xx responses).
+    The caller owns the client and must close it (await client.aclose()).
+    """
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=HTTP_ASYNC_MAX_CONNECTIONS,
+                            max_keepalive_connections=HTTP_POOL_MAXSIZE),
+        transport=httpx.AsyncHTTPTransport(retries=HTTP_RETRIES),
+        follow_redirects=True,
+    )
+
+
+async def download_pdf_async(file_url, client, max_bytes=None, spool_max_memory=None, cache=None):
+    """
+    Download a PDF without blocking the event loop
+
+    Same limits, caching and return value as download_pdf.
+
+    Args:
+        file_url (str): URL to the PDF file
+        client (httpx.AsyncClient): Shared client, see new_async_client
+        max_bytes (int): Maximum allowed size (defaults to MAX_DOWNLOAD_BYTES)
+        spool_max_memory (int): Size above which the file spills to disk
+        cache (DownloadCache): Cache for conditional requests (defaults to download_cache)
+
+    Returns:
+        file object: Rewound binary file - the caller must close it
+
+    Raises:
+        DownloadError: Non-200 response, or the file is larger than max_bytes
+    """
+    max_bytes = MAX_DOWNLOAD_BYTES if max_bytes is None else max_bytes
+    spool_max_memory = SPOOL_MAX_MEMORY if spool_max_memory is None else spool_max_memory
+    cache = download_cache if cache is None else cache
+
+    known = cache.validators(file_url)
+    headers = _conditional_headers(known)
+
+    async with client.stream('GET', file_url, headers=headers) as response:
+        if response.status_code == 304 and known:
+            cached = cache.open(file_url)
+            if cached is not None:
+                return cached
+            return await download_pdf_async(file_url, client, max_bytes, spool_max_memory,
+                                            cache=DownloadCache(None))
+
+        _check_response(response.status_code, response.headers, max_bytes)
+
+        with _spooled_body(spool_max_memory) as spooled:
+            size = await _astream_body(response, spooled, max_bytes)
+            _keep_revalidatable(cache, file_url, response.headers, spooled, size)
+
+    spooled.seek(0)
+    return spooled
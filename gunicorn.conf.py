@@ -0,0 +1,55 @@
+"""
+gunicorn settings (picked up automatically from the working directory)
+
+    gunicorn app:app
+    gunicorn asgi_app:app -k uvicorn.workers.UvicornWorker
+
+preload_app imports the app - and waits for its warmup (see warmup.py) - once
+in the master before any worker is forked, so workers start warm and share the
+imported modules, compiled patterns and parser tables copy-on-write instead
+of each paying for them. The catch: code changes need a full restart, not
+a HUP. Extraction workers are not forked from the threaded web workers; each
+web worker starts them from its own fork server (see worker_pool.py).
+
+Workers are threaded so admission control (see admission.py) sees the
+requests waiting for extraction and can shed them with a fast 503.
+"""
+import glob
+import os
+import sys
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+preload_app = True
+
+# Threaded workers, so a request can be answered 429/503 straight away while
+# others are being processed (a sync worker leaves it in the socket backlog).
+# Ignored with -k uvicorn.workers.UvicornWorker.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+
+# Workers write metric samples to files here and /metrics sums them (see metrics.py).
+# Set before the app - and with it prometheus_client - is imported.
+METRICS_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'pdf-receipt-metrics'))
+os.makedirs(METRICS_DIR, exist_ok=True)
+
+
+def pre_fork(server, worker):
+    """With preload_app, finish the master's background warmup first, so every worker is forked warm"""
+    if server.cfg.preload_app:
+        import warmup
+        warmup.warm_up()
+
+
+def post_worker_init(worker):
+    """Start the Flask app's job queue threads as soon as the worker has loaded it, not on its first request"""
+    app_module = sys.modules.get('app')
+    if app_module is not None and hasattr(app_module, 'job_worker'):
+        app_module.job_worker.start()
+
+
+def on_starting(server):
+    """Clear metric files left by the previous run"""
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.db')):
+        os.remove(path)
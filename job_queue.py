@@ -0,0 +1,261 @@
+"""
+Asynchronous job queue for receipt processing
+Jobs live in a local SQLite database, so they survive restarts and are shared by all workers
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from batch_processor import process_pdf_bytes, process_pdf_url
+from receipt_result import json_default
+from structured_log import request_id
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    file_url TEXT,
+    payload BLOB,
+    result TEXT,
+    duplicate_of TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """
+    SQLite-backed job table
+
+    Every method opens its own short-lived connection, so one store can be
+    used from request threads and background workers at the same time.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            # Databases created before duplicate detection lack the column
+            if 'duplicate_of' not in {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}:
+                conn.execute('ALTER TABLE jobs ADD COLUMN duplicate_of TEXT')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.row_factory = sqlite3.Row
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, payload=None, file_url=None, result=None, dedup=None):
+        """
+        Add a job and return its ID
+
+        Args:
+            payload (bytes): PDF content, OR
+            file_url (str): URL to download the PDF from
+            result (dict): Known result (e.g. from the cache) - stores the job as done
+            dedup (DedupIndex): With result, check it for duplicates under the new job's ID
+
+        Returns:
+            str: Job ID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        status = DONE if result is not None else QUEUED
+        duplicate_of = dedup.check(result, job_id) if dedup is not None and result is not None else None
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, file_url, payload, result, duplicate_of, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, status, file_url, None if result is not None else payload,
+                 json.dumps(result, default=json_default) if result is not None else None, duplicate_of, now, now)
+            )
+        return job_id
+
+    def claim_next(self):
+        """
+        Atomically mark the oldest queued job as running and return it
+
+        Returns:
+            sqlite3.Row or None: The claimed job, or None if the queue is empty
+        """
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers never claim the same job
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    'SELECT id, file_url, payload FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1',
+                    (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute('UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?',
+                                 (RUNNING, time.time(), row['id']))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            return row
+
+    def finish(self, job_id, outcome):
+        """Store a job's outcome ({'success': ..., 'data'/'error': ..., 'duplicate_of'}) and drop its payload"""
+        with self._connect() as conn:
+            if outcome.get('success'):
+                conn.execute(
+                    'UPDATE jobs SET status = ?, result = ?, duplicate_of = ?, payload = NULL, updated_at = ? '
+                    'WHERE id = ?',
+                    (DONE, json.dumps(outcome['data'], default=json_default), outcome.get('duplicate_of'), time.time(), job_id)
+                )
+            else:
+                conn.execute(
+                    'UPDATE jobs SET status = ?, error = ?, payload = NULL, updated_at = ? WHERE id = ?',
+                    (FAILED, outcome.get('error'), time.time(), job_id)
+                )
+
+    def get(self, job_id):
+        """
+        Look up a job
+
+        Returns:
+            dict or None: Job status and, once finished, its result or error
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT id, status, result, duplicate_of, error, created_at, updated_at FROM jobs WHERE id = ?',
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        job = {
+            'job_id': row['id'],
+            'status': row['status'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+        if row['result'] is not None:
+            job['data'] = json.loads(row['result'])
+            job['duplicate_of'] = row['duplicate_of']
+        if row['error'] is not None:
+            job['error'] = row['error']
+        return job
+
+    def requeue_stale(self, older_than):
+        """
+        Put running jobs back in the queue if they have not finished in time
+        (their worker was killed or restarted mid-job)
+
+        Args:
+            older_than (float): Seconds a job may stay running
+
+        Returns:
+            int: Number of jobs requeued
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?',
+                (QUEUED, time.time(), RUNNING, time.time() - older_than)
+            )
+            return cursor.rowcount
+
+
+class JobWorker:
+    """
+    Background threads that drain the job queue
+
+    The heavy lifting is handed to the batch process pool, so the web worker
+    thread that owns this object stays responsive. Parsed receipts are
+    checked against dedup (a DedupIndex), when given.
+    """
+
+    def __init__(self, store, processor, threads=1, poll_interval=1.0, stale_after=300, dedup=None):
+        self.store = store
+        self.processor = processor
+        self.dedup = dedup
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._started_pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads (once per process - safe to call on every request)"""
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            self._stop.clear()
+            self.store.requeue_stale(self.stale_after)
+            for i in range(self.threads):
+                threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True).start()
+
+    def notify(self):
+        """Wake idle workers after a job was enqueued"""
+        self._wakeup.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        with self._lock:
+            self._started_pid = None
+
+    def run_once(self):
+        """
+        Process a single queued job
+
+        Returns:
+            bool: True if a job was processed, False if the queue was empty
+        """
+        job = self.store.claim_next()
+        if job is None:
+            return False
+
+        # Log lines from this job carry its ID in place of a request ID
+        request_id.set(job['id'])
+        if job['file_url']:
+            outcome = self.processor.run([(process_pdf_url, job['file_url'])])[0]
+        else:
+            outcome = self.processor.run([(process_pdf_bytes, job['payload'])])[0]
+        if self.dedup is not None and outcome.get('success'):
+            outcome['duplicate_of'] = self.dedup.check(outcome['data'], job['id'])
+        self.store.finish(job['id'], outcome)
+        logger.info('Job %s %s', job['id'], 'done' if outcome.get('success') else 'failed',
+                    extra={'job_id': job['id']})
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Clear before claiming, so a job enqueued mid-claim still wakes us up
+            self._wakeup.clear()
+            try:
+                if self.run_once():
+                    continue
+            except Exception:
+                logger.exception('Job worker error')
+            self._wakeup.wait(self.poll_interval)
+
+
+def job_store_from_env():
+    """Create the store at JOB_DB_PATH (defaults to a file in the temp directory)"""
+    return JobStore(os.environ.get('JOB_DB_PATH') or
+                    os.path.join(tempfile.gettempdir(), 'pdf-receipt-jobs.sqlite3'))
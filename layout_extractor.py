@@ -0,0 +1,219 @@
+"""
+Layout-aware receipt extraction from pdfplumber word positions
+
+Instead of flattening each page to a text blob and regex-hunting through it,
+the page's words are read once with their bounding boxes (page.extract_words)
+and grouped into lines, with an index from each word to where it sits. The
+layout rules of the detected bank's profile (bank_profiles.json) name a label
+and where its value is - to its right on the same line, or under it on the
+next line - so a field is read from the few words next to its label. Fields
+no rule finds fall back to receipt_parser's patterns over the words' text.
+
+Enabled with EXTRACTION_MODE=layout (see batch_processor.process_pdf_file).
+"""
+import logging
+import re
+import time
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+import pdfplumber
+
+import metrics
+from pdf_processor import PDF_MAX_PAGES, clean_duplicate_chars, looks_parseable
+from receipt_parser import ANY_BANK, DATE_PATTERNS, GENERIC_EXTRACTORS, PageScan, parse_receipt_data
+
+logger = logging.getLogger(__name__)
+
+# Words whose tops are this close (in points) are on the same line
+LINE_TOLERANCE = 3
+# A value under its label may run on to the right while word gaps stay below this
+WORD_GAP = 12
+
+# What to take from the words next to a label, per field, when the rule has no pattern
+VALUE_PATTERNS = {
+    'transaction_id': [(re.compile(r'\b([A-Z0-9][A-Z0-9_-]*\d[A-Z0-9_-]*)\b', re.IGNORECASE), 1)],
+    'amount': [(re.compile(r'(\d+(?:,\d{3})*(?:\.\d{1,2})?)'), 1)],
+    # ISO dates first, so 2025-12-03 isn't read as 25-12-03
+    'date': [(DATE_PATTERNS[1], 1), (DATE_PATTERNS[0], 1), *GENERIC_EXTRACTORS['date'][2:]],
+    'time': GENERIC_EXTRACTORS['time'],
+    'receiver_account': [(re.compile(r'\b(\d{4}\s+\d{3,4}\s+\d{4}|\d{10,16})\b'), 1)],
+}
+
+_CENT = Decimal('0.01')
+
+# key: lower-cased text without trailing ':' or '.', what labels are matched against
+Word = namedtuple('Word', 'text key x0 x1 top bottom')
+
+
+class PageLayout:
+    """
+    One page's words grouped into lines, indexed for label lookups
+
+    - lines: list of lines, top to bottom, each a list of Words left to right
+    - text: the page as text, one line per line of words
+    """
+
+    def __init__(self, words):
+        self.lines = []
+        for word in sorted(words, key=lambda w: (w['top'], w['x0'])):
+            text = clean_duplicate_chars(word['text'])
+            entry = Word(text, text.lower().rstrip(':.'), word['x0'], word['x1'], word['top'], word['bottom'])
+            if self.lines and entry.top - self.lines[-1][0].top <= LINE_TOLERANCE:
+                self.lines[-1].append(entry)
+            else:
+                self.lines.append([entry])
+
+        # key -> [(line number, word number)], so a label is found without scanning the page
+        self._positions = {}
+        for line_no, line in enumerate(self.lines):
+            line.sort(key=lambda w: w.x0)
+            for word_no, word in enumerate(line):
+                self._positions.setdefault(word.key, []).append((line_no, word_no))
+        self.text = ''.join(' '.join(word.text for word in line) + '\n' for line in self.lines)
+
+    def find_label(self, label):
+        """Yield (line number, first word, end word) for each place the label's words appear in a row"""
+        for line_no, start in self._positions.get(label[0], ()):
+            line = self.lines[line_no]
+            end = start + len(label)
+            if end <= len(line) and all(line[start + i].key == key for i, key in enumerate(label[1:], 1)):
+                yield line_no, start, end
+
+    def neighbour(self, hit, where):
+        """
+        Text of the words next to a label found by find_label
+
+        'right': the rest of the label's line
+        'below': words on the next line that start under the label, plus the
+                 words that follow them closely (so "RM 1,250.50" stays whole)
+        """
+        line_no, start, end = hit
+        line = self.lines[line_no]
+        if where == 'right':
+            return ' '.join(word.text for word in line[end:]).lstrip(': ')
+
+        if line_no + 1 >= len(self.lines):
+            return ''
+        below = self.lines[line_no + 1]
+        height = line[start].bottom - line[start].top
+        if below[0].top - line[start].bottom > height * 2:
+            return ''
+        left, right = line[start].x0 - LINE_TOLERANCE, line[end - 1].x1
+        taken = []
+        for word in below:
+            if taken and word.x0 - taken[-1].x1 > WORD_GAP:
+                break
+            if taken or (word.x1 >= left and word.x0 <= right):
+                taken.append(word)
+        return ' '.join(word.text for word in taken)
+
+
+def _normalize(field, value):
+    if field == 'amount':
+        try:
+            return Decimal(value.replace(',', '')).quantize(_CENT, rounding=ROUND_HALF_UP)
+        except InvalidOperation:
+            return None
+    if field == 'receiver_account':
+        return value.replace(' ', '')
+    return value
+
+
+def read_field(layout, field, rules):
+    """
+    Read one field with the first layout rule that finds a value
+
+    Args:
+        layout (PageLayout): The page
+        field (str): Field name, e.g. 'amount'
+        rules (tuple): LayoutRules from a BankProfile, in order
+
+    Returns:
+        The field value (Decimal for amount, account numbers without spaces), or None
+    """
+    for rule in rules:
+        patterns = [(rule.pattern, rule.group)] if rule.pattern else VALUE_PATTERNS[field]
+        for hit in layout.find_label(rule.label):
+            text = layout.neighbour(hit, rule.where)
+            for pattern, group in patterns:
+                match = pattern.search(text)
+                if match:
+                    value = _normalize(field, match.group(group))
+                    if value is not None:
+                        logger.debug('%s found %s %r', field, rule.where, ' '.join(rule.label))
+                        return value
+    return None
+
+
+def parse_layout(file, max_pages=None, explain=False):
+    """
+    Extract and parse a receipt from the positions of its words
+
+    Pages are read until every field in REQUIRED_FIELDS has been found. The
+    detected bank's layout rules are tried first; anything they miss is
+    searched for in the pages' text by receipt_parser.parse_receipt_data.
+
+    Args:
+        file: Seekable binary file-like object
+        max_pages (int): Read at most this many pages (defaults to PDF_MAX_PAGES)
+        explain (bool): Record field provenance; fields read by a rule have the source 'layout'
+
+    Returns:
+        Receipt: Same as receipt_parser.parse_receipt_data, or None if the PDF
+              has no usable words (the caller then uses the text backends)
+    """
+    max_pages = max_pages or PDF_MAX_PAGES
+    known = {}
+    page_texts = []
+    scan = PageScan()
+    pages = 0
+    extracting = parsing = 0.0
+
+    file.seek(0)
+    try:
+        with pdfplumber.open(file) as pdf:
+            for page in pdf.pages[:max_pages]:
+                started = time.perf_counter()
+                layout = PageLayout(page.extract_words())
+                page.flush_cache()
+                pages += 1
+                extracting += time.perf_counter() - started
+                if not page_texts and not layout.lines:
+                    continue
+                # Probe, as the text backends do: undecoded fonts give words that aren't text
+                if not page_texts and not looks_parseable(layout.text):
+                    logger.info('layout text does not look parseable')
+                    return None
+
+                started = time.perf_counter()
+                page_texts.append(layout.text)
+                # Searches this page's text only (see receipt_parser.PageScan)
+                missing = scan.add(layout.text)
+                for field, rules in (scan.profile or ANY_BANK).layout.items():
+                    if known.get(field) is None:
+                        known[field] = read_field(layout, field, rules)
+                # Stop once every required field is found, by a rule or in the text so far
+                missing = [field for field, _ in missing if known.get(field) is None]
+                parsing += time.perf_counter() - started
+                if not missing:
+                    break
+    except MemoryError:
+        # Hit the worker's RLIMIT_AS - the text backends won't fare better
+        raise
+    except Exception as e:
+        logger.warning('layout extraction failed: %s', e)
+        return None
+    finally:
+        metrics.observe_stage('extract', extracting, backend='layout')
+        metrics.count_pages('layout', pages)
+
+    if not page_texts:
+        return None
+
+    logger.debug('Layout rules found %s', sorted(field for field, value in known.items() if value is not None))
+    started = time.perf_counter()
+    result = parse_receipt_data(''.join(page_texts), known, explain)
+    metrics.observe_stage('parse', parsing + time.perf_counter() - started)
+    metrics.count_fields(result, [field for field in result if field != 'raw_text'])
+    return result
@@ -0,0 +1,140 @@
+"""
+Prometheus metrics for the receipt pipeline, served at /metrics
+Request counts, errors by type, bytes and pages processed, per-stage latency and per-field hit rates
+
+Under gunicorn, metrics use prometheus_client's multiprocess mode: each worker
+writes its samples to files in PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py sets
+it) and /metrics sums them, so any worker can answer a scrape. Without the
+variable - python app.py, a bare uvicorn - they stay in this process.
+Extraction pool workers don't write files of their own (they are recycled
+often and would leave one file per PID behind); they buffer their samples,
+which the web worker replays with each result.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# prometheus_client reads this when it is imported, so it must be set (and exist) before that
+METRICS_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+# Stage latencies run from sub-millisecond (parse) to tens of seconds (download, pdfplumber)
+_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+
+REQUESTS = Counter('receipt_requests_total', 'HTTP requests handled', ['endpoint', 'status'])
+REQUEST_SECONDS = Histogram('receipt_request_seconds', 'End-to-end request latency', ['endpoint'],
+                            buckets=_BUCKETS)
+ERRORS = Counter('receipt_errors_total', 'Failed receipts by error type', ['type'])
+BYTES = Counter('receipt_bytes_processed_total', 'PDF bytes sent to extraction')
+PAGES = Counter('receipt_pages_total', 'Pages extracted', ['backend'])
+STAGE_SECONDS = Histogram('receipt_stage_seconds', 'Latency per pipeline stage', ['stage', 'backend'],
+                          buckets=_BUCKETS)
+FIELDS = Counter('receipt_fields_total', 'Parsed receipts by field and whether it was found',
+                 ['field', 'found'])
+CACHE = Counter('receipt_cache_total', 'Result cache lookups', ['result'])
+DUPLICATES = Counter('receipt_duplicates_total', 'Receipts matching an earlier submission (see dedup_index)')
+
+_METRICS = {
+    'errors': ERRORS,
+    'bytes': BYTES,
+    'pages': PAGES,
+    'stage': STAGE_SECONDS,
+    'fields': FIELDS,
+}
+
+# Samples recorded inside an extraction worker, waiting to be shipped to the web worker. Kept per
+# thread, so the warmup discarding its own samples never drops those of a request thread
+_local = threading.local()
+
+
+def _buffer():
+    return getattr(_local, 'buffer', None)
+
+
+def buffer_samples():
+    """Record into a local buffer instead of the shared files (called in extraction workers)"""
+    if _buffer() is None:
+        _local.buffer = []
+
+
+def drain_samples():
+    """Return this thread's buffered samples and start a new buffer"""
+    samples = _buffer()
+    if samples is None:
+        return []
+    _local.buffer = []
+    return samples
+
+
+@contextmanager
+def discard_samples():
+    """Drop samples this thread records inside the block (e.g. the startup warmup run, which isn't traffic)"""
+    saved, _local.buffer = _buffer(), []
+    try:
+        yield
+    finally:
+        _local.buffer = saved
+
+
+def replay_samples(samples):
+    """Apply samples from drain_samples() in another process"""
+    for name, labels, value in samples:
+        _apply(name, labels, value)
+
+
+def _apply(name, labels, value):
+    metric = _METRICS[name]
+    if labels:
+        metric = metric.labels(*labels)
+    if name == 'stage':
+        metric.observe(value)
+    else:
+        metric.inc(value)
+
+
+def _record(name, labels, value):
+    buffer = _buffer()
+    if buffer is not None:
+        buffer.append((name, labels, value))
+    else:
+        _apply(name, labels, value)
+
+
+def observe_stage(stage, seconds, backend=''):
+    """Add a latency sample for a pipeline stage (download, extract, clean, parse, serialize)"""
+    _record('stage', (stage, backend), seconds)
+
+
+def count_error(kind):
+    _record('errors', (kind,), 1)
+
+
+def count_bytes(size):
+    _record('bytes', (), size)
+
+
+def count_pages(backend, pages):
+    if pages:
+        _record('pages', (backend,), pages)
+
+
+def count_fields(result, fields):
+    """Count, per field, whether the parsed result has a value"""
+    for field in fields:
+        _record('fields', (field, 'true' if result.get(field) is not None else 'false'), 1)
+
+
+def render():
+    """
+    Current metrics in the Prometheus text format, summed over all processes in multiprocess mode
+
+    Returns:
+        tuple: (body bytes, content type)
+    """
+    if not METRICS_DIR:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,220 @@
+"""
+OCR fallback for scanned (image-only) PDF receipts, with a local Tesseract
+
+Off unless OCR=1 and the tesseract binary is installed. When text extraction
+finds no text at all - or some pages have no text layer and the text pages
+lack a key field - the extraction worker hands the PDF on to a separate,
+smaller OCR pool (see BatchProcessor), so slow OCR jobs never hold the
+workers that text-based receipts need. That pool has its own deadline,
+limits and admission gate, and the tesseract process inherits its worker's
+memory limit.
+
+Inside the OCR worker (ocr_pdf_bytes):
+
+- Pages are read lazily and parsing stops once the receipt's key fields
+  are found, so a one-page phone scan with trailing pages costs one OCR run.
+- Pages that do have a text layer use it; only the others are rasterized,
+  at most OCR_MAX_PAGES of them per PDF.
+- A page is rendered at the resolution of its largest image (a phone photo
+  is usually 150-300 DPI), clamped to MIN_DPI-MAX_DPI and to MAX_PIXELS.
+- OCR output is cached by a hash of the rendered page image, in memory and
+  in OCR_CACHE_DIR, so the same scan re-exported into another PDF is not
+  OCRed again.
+"""
+import hashlib
+import logging
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from io import BytesIO
+
+import pypdfium2
+import pypdfium2.raw as pdfium_c
+
+import metrics
+from receipt_parser import parse_receipt_pages
+from worker_pool import SupervisedPool
+
+try:
+    import resource
+except ImportError:  # Windows: the subprocess timeout still applies
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+TESSERACT_CMD = os.environ.get('TESSERACT_CMD', 'tesseract')
+OCR_LANG = os.environ.get('OCR_LANG', 'eng')
+# Pages without a text layer OCRed per PDF; later ones are skipped
+OCR_MAX_PAGES = int(os.environ.get('OCR_MAX_PAGES', '5'))
+# Wall-clock seconds per PDF in the OCR pool (also the tesseract CPU limit per page)
+OCR_TIMEOUT = float(os.environ.get('OCR_TIMEOUT', '60'))
+
+OCR_ENABLED = os.environ.get('OCR', '0') == '1'
+if OCR_ENABLED and shutil.which(TESSERACT_CMD) is None:
+    logger.warning('OCR=1 but %s was not found - scanned PDFs will not be OCRed', TESSERACT_CMD)
+    OCR_ENABLED = False
+
+# Rendering resolution bounds; DEFAULT_DPI is used for pages without images (vector scans)
+MIN_DPI, DEFAULT_DPI, MAX_DPI = 150, 300, 400
+MAX_PIXELS = 12_000_000
+
+# Bump when rendering or engine settings change, so cached text is not reused
+OCR_VERSION = f'1/{OCR_LANG}'
+
+_cache = None
+
+
+def _page_cache():
+    """The OCR text cache (memory tier per OCR worker, disk tier shared)"""
+    global _cache
+    if _cache is None:
+        # Imported here: result_cache reads OCR_ENABLED from this module for its keys
+        from result_cache import ResultCache
+        _cache = ResultCache(
+            max_entries=int(os.environ.get('OCR_CACHE_SIZE', '64')),
+            disk_dir=os.environ.get('OCR_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'pdf-receipt-ocr'),
+        )
+    return _cache
+
+
+def page_dpi(page):
+    """
+    Pick the rendering DPI for a pypdfium2 page
+
+    Returns:
+        float: The native resolution of the page's largest image, within
+        MIN_DPI-MAX_DPI and low enough that the page stays under MAX_PIXELS
+    """
+    dpi, largest = DEFAULT_DPI, 0
+    for image in page.get_objects(filter=[pdfium_c.FPDF_PAGEOBJ_IMAGE]):
+        px_width, px_height = image.get_px_size()
+        left, _, right, _ = image.get_bounds()
+        if right > left and px_width * px_height > largest:
+            largest = px_width * px_height
+            dpi = px_width / ((right - left) / 72)
+    dpi = min(max(dpi, MIN_DPI), MAX_DPI)
+
+    width, height = page.get_size()
+    fits = math.sqrt(MAX_PIXELS / ((width / 72) * (height / 72)))
+    return min(dpi, fits)
+
+
+def _limit_child():
+    # A tesseract left behind by a killed worker stops within OCR_TIMEOUT CPU seconds
+    limit = max(1, int(OCR_TIMEOUT))
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, limit))
+
+
+def run_tesseract(png):
+    """
+    OCR one PNG image with the tesseract command line
+
+    Raises:
+        RuntimeError: tesseract failed
+        subprocess.TimeoutExpired: it ran past OCR_TIMEOUT
+    """
+    completed = subprocess.run(
+        [TESSERACT_CMD, 'stdin', 'stdout', '-l', OCR_LANG],
+        input=png, capture_output=True, timeout=OCR_TIMEOUT,
+        # One thread: the OCR pool already runs one tesseract per worker
+        env={**os.environ, 'OMP_THREAD_LIMIT': '1'},
+        preexec_fn=_limit_child if resource is not None else None,
+    )
+    if completed.returncode:
+        raise RuntimeError(f'tesseract failed: {completed.stderr.decode("utf-8", "replace").strip()}')
+    return completed.stdout.decode('utf-8', 'replace')
+
+
+def ocr_page(page):
+    """Return the OCR text of a pypdfium2 page, from the cache when this page image was seen before"""
+    image = page.render(scale=page_dpi(page) / 72, grayscale=True).to_pil()
+    digest = hashlib.sha256(f'ocr{OCR_VERSION}:{image.width}x{image.height}:'.encode())
+    digest.update(image.tobytes())
+    key = digest.hexdigest()
+
+    cache = _page_cache()
+    text = cache.get(key)
+    if text is None:
+        png = BytesIO()
+        image.save(png, 'PNG')
+        text = run_tesseract(png.getvalue())
+        cache.set(key, text)
+    return text
+
+
+def iter_ocr_pages(data, max_ocr_pages=None):
+    """
+    Yield the text of each page, from its text layer or by OCR
+
+    Args:
+        data (bytes): PDF file content
+        max_ocr_pages (int): OCR at most this many pages (defaults to OCR_MAX_PAGES); pages
+            with a text layer after them are still yielded
+
+    Yields:
+        str: Page text, newline-terminated (pages with no text at all are skipped)
+
+    Raises:
+        RuntimeError: No page had any text, even after OCR
+    """
+    max_ocr_pages = max_ocr_pages or OCR_MAX_PAGES
+    ocr_pages = skipped = 0
+    has_text = False
+    pdf = pypdfium2.PdfDocument(data)
+    try:
+        for index in range(len(pdf)):
+            page = pdf[index]
+            text = page.get_textpage().get_text_range()
+            if not text.strip():
+                if ocr_pages >= max_ocr_pages:
+                    # Only OCR stops at the limit - later pages with a text layer are still read
+                    skipped += 1
+                    continue
+                started = time.perf_counter()
+                text = ocr_page(page)
+                ocr_pages += 1
+                metrics.observe_stage('ocr', time.perf_counter() - started)
+                metrics.count_pages('ocr', 1)
+                logger.debug('Page %d: OCR read %d characters', index + 1, len(text))
+            if text.strip():
+                has_text = True
+                yield text + '\n'
+    finally:
+        pdf.close()
+    if skipped:
+        logger.info('OCR page limit (%d) reached: %d more pages without text skipped', max_ocr_pages, skipped)
+    if not has_text:
+        raise RuntimeError('OCR found no text in the PDF')
+
+
+def ocr_pdf_bytes(data, explain=False):
+    """
+    Parse a scanned receipt with OCR (runs inside an OCR pool worker)
+
+    Returns:
+        dict: Same shape as batch_processor.process_pdf_file
+    """
+    pages = iter_ocr_pages(data)
+    try:
+        return {'success': True, 'data': parse_receipt_pages(pages, explain)}
+    except MemoryError:
+        raise
+    except Exception as e:
+        metrics.count_error('ocr')
+        return {'success': False, 'error': f'Failed to process scanned receipt: {str(e)}'}
+    finally:
+        pages.close()
+
+
+def ocr_pool_from_env():
+    """Create the OCR pool configured by OCR_POOL_SIZE / OCR_TIMEOUT, or None when OCR is off"""
+    if not OCR_ENABLED:
+        return None
+    return SupervisedPool(
+        int(os.environ.get('OCR_POOL_SIZE', '1')),
+        timeout=OCR_TIMEOUT,
+        cpu_limit=int(OCR_TIMEOUT),
+    )
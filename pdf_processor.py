@@ -1,7 +1,33 @@
 import pdfplumber
 import PyPDF2
+from contextlib import contextmanager
 from io import BytesIO
+import logging
+import os
 import re
+import threading
+import time
+import metrics
+import raw_text_scanner
+from preflight import inspect_pdf
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on pages read per PDF (0 = no limit)
+PDF_MAX_PAGES = int(os.environ.get('PDF_MAX_PAGES', '0')) or None
+
+# 'text' (backends below, then regex parsing) or 'layout' (layout_extractor first, text as fallback)
+EXTRACTION_MODE = os.environ.get('EXTRACTION_MODE', 'text')
+
+# Extraction backends, fastest first; the first one whose text passes the probe is used
+PDF_BACKEND_ORDER = [name.strip() for name in
+                     os.environ.get('PDF_BACKEND_ORDER', 'raw,pypdf2,pdfplumber').split(',') if name.strip()]
+
+class NoTextError(Exception):
+    """No backend found usable text - the PDF is likely scanned (see ocr.py)"""
+
+# A character followed by three copies of itself (newlines included)
+QUAD_CHAR_RE = re.compile(r'(.)\1{3}', re.DOTALL)
 
 def clean_duplicate_chars(text):
     """
@@ -11,6 +37,11 @@ def clean_duplicate_chars(text):
     - '111100000000' → '100'
     - '....' → '.'
     
+    Scanning left to right, every run of 4 identical characters collapses
+    to one; anything else is kept as is. Text without any 4x run is
+    returned untouched, and fully duplicated lines are collapsed with
+    slicing instead of a per-character loop.
+    
     Args:
         text (str): Text with 4x character repetitions
         
@@ -20,98 +51,282 @@ def clean_duplicate_chars(text):
     if not text:
         return text
     
-    # This PDF repeats each character EXACTLY 4 times
-    # Strategy: Take every 4th character
-    result = []
-    i = 0
+    # Fast path: most PDFs don't have the repetition artifact at all
+    if not QUAD_CHAR_RE.search(text):
+        return text
     
-    while i < len(text):
-        char = text[i]
-        
-        # Check if this character is repeated 4 times
-        if i + 3 < len(text) and all(text[i+j] == char for j in range(4)):
-            # Yes, it's repeated 4 times - take it once
-            result.append(char)
-            i += 4  # Skip the next 3 duplicates
+    # A run of 4 can only span a line break if it is 4 newlines; otherwise
+    # every line can be cleaned on its own
+    if '\n\n\n\n' in text:
+        return QUAD_CHAR_RE.sub(r'\1', text)
+    
+    lines = text.split('\n')
+    for i, line in enumerate(lines):
+        if len(line) % 4 == 0 and line[0::4] == line[1::4] == line[2::4] == line[3::4]:
+            # Whole line is the artifact ('RRRRMMMM') - keep every 4th character
+            lines[i] = line[0::4]
         else:
-            # No pattern - keep as is
-            result.append(char)
-            i += 1
+            lines[i] = QUAD_CHAR_RE.sub(r'\1', line)
+    return '\n'.join(lines)
+
+def _pdfplumber_pages(file, start, max_pages):
+    """Yield (page index, raw text) with pdfplumber (full layout analysis - slowest, most robust)"""
+    file.seek(0)
+    with pdfplumber.open(file) as pdf:
+        logger.debug('PDF has %d page(s)', len(pdf.pages))
+        for i, page in enumerate(pdf.pages[start:max_pages], start):
+            page_text = page.extract_text()
+            # Drop the page's cached layout objects - only its text is needed
+            page.flush_cache()
+            yield i, page_text
+
+def _pypdf2_pages(file, start, max_pages):
+    """Yield (page index, raw text) with PyPDF2"""
+    file.seek(0)
+    pdf_reader = PyPDF2.PdfReader(file)
+    logger.debug('PDF has %d page(s)', len(pdf_reader.pages))
+    for i in range(start, min(len(pdf_reader.pages), max_pages or len(pdf_reader.pages))):
+        yield i, pdf_reader.pages[i].extract_text()
+
+def _raw_pages(file, start, max_pages):
+    """Yield (page index, raw text) by scanning content streams directly (fastest, simple PDFs only)"""
+    file.seek(0)
+    yield from raw_text_scanner.iter_page_texts(file.read(), start, max_pages)
+
+# name -> function(file, start, max_pages) yielding (page index, raw page text)
+EXTRACTION_BACKENDS = {
+    'raw': _raw_pages,
+    'pypdf2': _pypdf2_pages,
+    'pdfplumber': _pdfplumber_pages,
+}
+
+def register_backend(name, read_pages):
+    """Add or replace an extraction backend (enable it via PDF_BACKEND_ORDER)"""
+    EXTRACTION_BACKENDS[name] = read_pages
+    with _stats_lock:
+        _backend_stats.pop(name, None)
+
+_stats_lock = threading.Lock()
+_backend_stats = {}
+# Set by discard_backend_stats for the thread running the block
+_discarding = threading.local()
+
+def _record(name, outcome, seconds, pages):
+    if getattr(_discarding, 'active', False):
+        return
+    with _stats_lock:
+        stats = _backend_stats.setdefault(name, {
+            'attempts': 0, 'succeeded': 0, 'rejected': 0, 'failed': 0, 'pages': 0, 'seconds': 0.0
+        })
+        stats['attempts'] += 1
+        stats[outcome] += 1
+        stats['pages'] += pages
+        stats['seconds'] += seconds
+
+def drain_backend_stats():
+    """Return the raw counters recorded so far and reset them (used to ship stats out of pool workers)"""
+    global _backend_stats
+    with _stats_lock:
+        stats, _backend_stats = _backend_stats, {}
+    return stats
+
+@contextmanager
+def discard_backend_stats():
+    """Don't count extractions this thread runs inside the block (other threads still count theirs)"""
+    saved, _discarding.active = getattr(_discarding, 'active', False), True
+    try:
+        yield
+    finally:
+        _discarding.active = saved
+
+def merge_backend_stats(stats):
+    """Add counters from drain_backend_stats() in another process to this process's totals"""
+    with _stats_lock:
+        for name, values in stats.items():
+            totals = _backend_stats.setdefault(name, dict.fromkeys(values, 0))
+            for key, value in values.items():
+                totals[key] = totals.get(key, 0) + value
+
+def backend_stats():
+    """
+    Per-backend timing and outcome counters for this process
     
-    return ''.join(result)
+    Returns:
+        dict: name -> attempts, succeeded / rejected (no usable text) / failed (error),
+              pages, seconds and ms_per_page
+    """
+    with _stats_lock:
+        stats = {name: dict(values) for name, values in _backend_stats.items()}
+    for values in stats.values():
+        values['success_rate'] = round(values['succeeded'] / values['attempts'], 3) if values['attempts'] else None
+        values['ms_per_page'] = round(values['seconds'] * 1000 / values['pages'], 3) if values['pages'] else None
+    return stats
 
-def extract_pdf_data(file):
+# Characters expected in receipt text; anything else suggests an undecoded font
+_UNEXPECTED_CHAR_RE = re.compile(r'[^\s\x20-\x7e\u00a0-\u024f\u2010-\u20ac]')
+_WORD_RE = re.compile(r'[A-Za-z]{3,}')
+
+def looks_parseable(text):
     """
-    Extract text from PDF using multiple methods
+    Cheap probe: does this page text look like real, decoded text?
+    
+    Rejects empty pages and text that is mostly symbols or control
+    characters (what a scanner produces when it can't decode a font).
+    """
+    stripped = text.strip() if text else ''
+    if not stripped or not _WORD_RE.search(stripped):
+        return False
+    return len(_UNEXPECTED_CHAR_RE.findall(stripped)) <= len(stripped) * 0.05
+
+def iter_pdf_pages(file, max_pages=None, backends=None, start=0):
+    """
+    Extract text from PDF lazily, one cleaned page at a time
+    
+    Pages are only opened as the caller asks for them, so a consumer that
+    stops early (see receipt_parser.parse_receipt_pages) skips the rest.
+    Backends are tried in PDF_BACKEND_ORDER. The first page with text is a
+    probe: if it doesn't look parseable, the next backend is tried. If a
+    backend fails part-way, the next one carries on from the page where it
+    stopped.
     
     Args:
-        file: FileStorage object from Flask request
+        file: Seekable binary file-like object
+        max_pages (int): Read at most this many pages (defaults to PDF_MAX_PAGES)
+        backends (list): Backend names to try, in order (defaults to PDF_BACKEND_ORDER)
+        start (int): First page index to read; max_pages still counts from the first page
         
-    Returns:
-        str: Extracted text from PDF
+    Yields:
+        str: Cleaned page text, newline-terminated
         
     Raises:
-        Exception: If unable to extract text from PDF
+        NoTextError: If unable to extract any text from PDF
     """
-    text = ""
+    max_pages = max_pages or PDF_MAX_PAGES
+    has_text = False
+    next_page = 0
     
-    try:
-        # Method 1: Try pdfplumber (works best for text-based PDFs)
-        print("Attempting pdfplumber extraction...")
-        file.seek(0)
-        with pdfplumber.open(file) as pdf:
-            page_count = len(pdf.pages)
-            print(f"PDF has {page_count} page(s)")
-            
-            for i, page in enumerate(pdf.pages):
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-                    print(f"Page {i+1}: Extracted {len(page_text)} characters")
-        
-        # If text extracted successfully, clean and return it
-        if text.strip():
-            print(f"✅ pdfplumber succeeded - Total: {len(text)} characters")
-            cleaned_text = clean_duplicate_chars(text)
-            print(f"🧹 Cleaned text - Total: {len(cleaned_text)} characters")
-            return cleaned_text
-        else:
-            print("⚠️ pdfplumber extracted no text")
+    for name in backends or PDF_BACKEND_ORDER:
+        read_pages = EXTRACTION_BACKENDS.get(name)
+        if read_pages is None:
+            logger.warning('Unknown extraction backend: %s', name)
+            continue
         
-    except Exception as e:
-        print(f"❌ pdfplumber failed: {e}")
-    
-    try:
-        # Method 2: Try PyPDF2 (fallback)
-        print("Attempting PyPDF2 extraction...")
-        file.seek(0)
-        pdf_reader = PyPDF2.PdfReader(file)
-        page_count = len(pdf_reader.pages)
-        print(f"PDF has {page_count} page(s)")
-        
-        for i, page in enumerate(pdf_reader.pages):
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-                print(f"Page {i+1}: Extracted {len(page_text)} characters")
+        logger.debug('Attempting %s extraction', name)
+        outcome = 'rejected'
+        pages = 0
+        elapsed = 0.0
+        cleaning = 0.0
+        started = time.perf_counter()
+        try:
+            for i, page_text in read_pages(file, next_page if has_text else start, max_pages):
+                pages += 1
+                next_page = i + 1
+                if page_text:
+                    # Cleaned per page - pages without the 4x artifact are skipped cheaply
+                    clean_started = time.perf_counter()
+                    page_text = clean_duplicate_chars(page_text)
+                    cleaning += time.perf_counter() - clean_started
+                    if not has_text and page_text.strip():
+                        # Probe: the first page with text decides whether this backend is usable
+                        if not looks_parseable(page_text):
+                            logger.info('%s text does not look parseable', name)
+                            break
+                        has_text = True
+                    logger.debug('Page %d: extracted %d characters', i + 1, len(page_text))
+                    # Time spent by the consumer between pages is not the backend's
+                    elapsed += time.perf_counter() - started
+                    started = None
+                    yield page_text + "\n"
+                    started = time.perf_counter()
+            else:
+                if has_text:
+                    outcome = 'succeeded'
+        except GeneratorExit:
+            # Consumer stopped early (all fields found) - this backend did its job
+            outcome = 'succeeded'
+            raise
+        except MemoryError:
+            # Hit the worker's RLIMIT_AS - another backend won't fare better
+            outcome = 'failed'
+            raise
+        except Exception as e:
+            outcome = 'failed'
+            logger.warning('%s extraction failed: %s', name, e)
+        finally:
+            if started is not None:
+                elapsed += time.perf_counter() - started
+            _record(name, outcome, elapsed, pages)
+            metrics.observe_stage('extract', elapsed - cleaning, backend=name)
+            metrics.observe_stage('clean', cleaning)
+            metrics.count_pages(name, pages)
         
-        if text.strip():
-            print(f"✅ PyPDF2 succeeded - Total: {len(text)} characters")
-            cleaned_text = clean_duplicate_chars(text)
-            print(f"🧹 Cleaned text - Total: {len(cleaned_text)} characters")
-            return cleaned_text
-        else:
-            print("⚠️ PyPDF2 extracted no text")
-            
-    except Exception as e:
-        print(f"❌ PyPDF2 failed: {e}")
+        if outcome == 'succeeded':
+            logger.debug('%s extraction succeeded', name)
+            return
+        if outcome == 'rejected':
+            logger.info('%s extracted no usable text', name)
     
     # If we reach here, no method worked
-    if not text.strip():
-        raise Exception(
+    if not has_text:
+        raise NoTextError(
             "Could not extract text from PDF. "
             "The PDF might be image-based (scanned) or corrupted. "
             "Please ensure the PDF contains selectable text."
         )
+
+class TextPageCounter:
+    """
+    Pass page texts through, counting those with any text in text_pages
+
+    Compared with the PDF's page count, this tells a PDF that mixes text
+    pages and scanned ones (see batch_processor.process_pdf_file).
+    """
+
+    def __init__(self, pages):
+        self._pages = pages
+        self.text_pages = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        page_text = next(self._pages)
+        if page_text.strip():
+            self.text_pages += 1
+        return page_text
+
+    def close(self):
+        self._pages.close()
+
+def pdf_page_count(file, info=None):
+    """
+    Return the number of pages in a PDF, capped at PDF_MAX_PAGES
+
+    Read from the page tree root by preflight (info, if the caller already
+    inspected the file); PyPDF2 (which parses page content lazily) counts the
+    pages when the xref can't be followed.
+    """
+    count = (info or inspect_pdf(file)).page_count
+    if count is None:
+        count = len(PyPDF2.PdfReader(file).pages)
+        file.seek(0)
+    return min(count, PDF_MAX_PAGES) if PDF_MAX_PAGES else count
+
+def extract_pdf_data(file, max_pages=None, backends=None):
+    """
+    Extract text from PDF using multiple methods
     
+    Args:
+        file: FileStorage object from Flask request
+        max_pages (int): Read at most this many pages (defaults to PDF_MAX_PAGES)
+        backends (list): Backend names to try, in order (defaults to PDF_BACKEND_ORDER)
+        
+    Returns:
+        str: Extracted text from PDF
+        
+    Raises:
+        Exception: If unable to extract text from PDF
+    """
+    text = ''.join(iter_pdf_pages(file, max_pages, backends))
+    logger.debug('Extracted %d characters (cleaned)', len(text))
     return text
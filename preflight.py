@@ -0,0 +1,419 @@
+"""
+Pre-flight checks on a PDF before it reaches the extraction backends
+
+Only the header and the cross-reference data are read - never page contents -
+so a check takes microseconds however large the file is:
+
+- The %PDF- signature must be in the first 1024 bytes. HTML error pages,
+  images and archives are turned away with a note of what they look like.
+- startxref, at the end of the file, points at the newest cross-reference
+  section: a classic xref table or (PDF 1.5+) an xref stream. Its trailer
+  gives the object count (/Size), /Encrypt and the document /ID.
+- The page count is /Count of the page tree root, reached from /Root through
+  the xref - following /Prev to earlier sections, and into object streams.
+
+An encrypted PDF is opened with the empty password, as a PDF viewer would;
+if that fails it is password-protected and rejected. Damaged xref data is
+not an error here - the backends can often repair it - the page count is
+just unknown (None).
+
+The structural fingerprint is a hash of these facts plus the trailer /ID
+and the xref offset. It is computed from a few KB, so it is cheap to log and
+return, but unlike result_cache.content_key it does not cover the content:
+two files can share a structure and differ in the amount.
+"""
+import hashlib
+import logging
+import os
+import re
+import zlib
+from collections import namedtuple
+
+from pdfminer.pdfdocument import PDFDocument, PDFPasswordIncorrect
+from pdfminer.pdfparser import PDFParser
+
+logger = logging.getLogger(__name__)
+
+# PDFs over these are refused before extraction (413); 0 = no limit
+PREFLIGHT_MAX_PAGES = int(os.environ.get('PREFLIGHT_MAX_PAGES', '2000'))
+PREFLIGHT_MAX_OBJECTS = int(os.environ.get('PREFLIGHT_MAX_OBJECTS', '500000'))
+
+# Where the signature and startxref must be
+HEAD_BYTES = 1024
+TAIL_BYTES = 2048
+# Largest object dictionary or decoded xref/object stream read while counting pages
+MAX_READ_BYTES = 1024 * 1024
+# Cross-reference sections followed through /Prev
+MAX_SECTIONS = 16
+
+# version: header version ('1.7'); page_count: None if the xref could not be followed;
+# object_count: trailer /Size; fingerprint: hex digest of the structure (see above)
+PdfInfo = namedtuple('PdfInfo', 'version size object_count page_count encrypted fingerprint')
+
+
+class PreflightError(Exception):
+    """The file was refused before extraction; status_code is the HTTP status to answer with"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _Damaged(Exception):
+    """The cross-reference data can't be followed - the page count stays unknown"""
+
+
+_STARTXREF_RE = re.compile(rb'startxref\s+(\d+)')
+_OBJ_HEADER_RE = re.compile(rb'\s*(\d+)\s+(\d+)\s+obj\b')
+_SUBSECTION_RE = re.compile(rb'\s*(\d+)\s+(\d+)[ \t]*(?:\r\n|\r|\n)')
+_SIZE_RE = re.compile(rb'/Size\s+(\d+)')
+_PREV_RE = re.compile(rb'/Prev\s+(\d+)')
+_ROOT_RE = re.compile(rb'/Root\s+(\d+)\s+\d+\s+R')
+_PAGES_RE = re.compile(rb'/Pages\s+(\d+)\s+\d+\s+R')
+_COUNT_RE = re.compile(rb'/Count\s+(\d+)(?!\s+\d+\s+R)')
+_LENGTH_RE = re.compile(rb'/Length\s+(\d+)(?!\s+\d+\s+R)')
+_FILTER_RE = re.compile(rb'/Filter\s*\[?\s*/(\w+)\s*\]?')
+_PREDICTOR_RE = re.compile(rb'/Predictor\s+(\d+)')
+_COLUMNS_RE = re.compile(rb'/Columns\s+(\d+)')
+_W_RE = re.compile(rb'/W\s*\[\s*(\d+)\s+(\d+)\s+(\d+)\s*\]')
+_INDEX_RE = re.compile(rb'/Index\s*\[([\d\s]*)\]')
+_N_RE = re.compile(rb'/N\s+(\d+)')
+_FIRST_RE = re.compile(rb'/First\s+(\d+)')
+_ID_RE = re.compile(rb'/ID\s*\[\s*(<[0-9A-Fa-f\s]*>|\((?:\\.|[^\\)])*\))')
+_STREAM_START_RE = re.compile(rb'\s*stream(?:\r\n|\n|\r)')
+
+# What common non-PDF payloads start with, for the error message
+_SIGNATURES = [
+    (b'<!doctype html', 'an HTML page'), (b'<html', 'an HTML page'), (b'<?xml', 'an XML document'),
+    (b'{', 'JSON'), (b'pk\x03\x04', 'a zip archive'), (b'\x89png', 'a PNG image'),
+    (b'\xff\xd8\xff', 'a JPEG image'), (b'gif8', 'a GIF image'),
+]
+
+
+def describe_content(head):
+    """A few words on what a non-PDF payload looks like, from its first bytes"""
+    start = head.lstrip()[:16].lower()
+    if not start:
+        return 'empty file'
+    for signature, description in _SIGNATURES:
+        if start.startswith(signature):
+            return description
+    return 'unrecognised content'
+
+
+def check_signature(head):
+    """
+    Check the first HEAD_BYTES of a file for the PDF signature
+
+    Returns:
+        int: Offset of %PDF- (xref offsets are relative to it)
+
+    Raises:
+        PreflightError: 400 - not a PDF
+    """
+    start = head.find(b'%PDF-')
+    if start < 0:
+        raise PreflightError(f'Not a PDF file: {describe_content(head)}', 400)
+    return start
+
+
+def _dictionary(data, pos):
+    """The << ... >> dictionary starting at or after pos, or None if it doesn't end within data"""
+    start = data.find(b'<<', pos)
+    if start < 0:
+        return None
+    depth = 0
+    i = start
+    while True:
+        opening = data.find(b'<<', i)
+        closing = data.find(b'>>', i)
+        if closing < 0:
+            return None
+        if 0 <= opening < closing:
+            depth += 1
+            i = opening + 2
+        else:
+            depth -= 1
+            i = closing + 2
+            if depth == 0:
+                return data[start:i]
+
+
+class _Reader:
+    """Random access to the file, with the offsets of its cross-reference sections"""
+
+    def __init__(self, file_obj, base):
+        self.file = file_obj
+        self.base = base
+        # Per section: ('table', subsections, trailer) or ('stream', rows, index, widths, trailer)
+        self.sections = []
+        self._object_streams = {}
+
+    def read(self, offset, size):
+        self.file.seek(self.base + offset)
+        return self.file.read(size)
+
+    def dictionary_at(self, offset):
+        """The dictionary of the indirect object at offset, and the chunk it was read from"""
+        size = 4096
+        while True:
+            chunk = self.read(offset, size)
+            header = _OBJ_HEADER_RE.match(chunk)
+            if not header:
+                raise _Damaged(f'no object at offset {offset}')
+            found = _dictionary(chunk, header.end())
+            if found is not None:
+                return found, chunk
+            if len(chunk) < size or size >= MAX_READ_BYTES:
+                raise _Damaged(f'unterminated dictionary at offset {offset}')
+            size *= 16
+
+    def stream_at(self, offset):
+        """Dictionary and decoded data of the stream object at offset"""
+        dictionary, chunk = self.dictionary_at(offset)
+        start = chunk.find(dictionary) + len(dictionary)
+        keyword = _STREAM_START_RE.match(chunk, start)
+        length = _LENGTH_RE.search(dictionary)
+        if not keyword or not length:
+            raise _Damaged(f'unreadable stream at offset {offset}')
+        length = int(length.group(1))
+        if length > MAX_READ_BYTES:
+            raise _Damaged(f'stream at offset {offset} is {length} bytes')
+        data = self.read(offset + keyword.end(), length)
+
+        name = _FILTER_RE.search(dictionary)
+        if name:
+            if name.group(1) not in (b'FlateDecode', b'Fl'):
+                raise _Damaged(f'unsupported filter {name.group(1)!r}')
+            try:
+                # Bounded - a crafted stream can't inflate past MAX_READ_BYTES here
+                data = zlib.decompressobj().decompress(data, MAX_READ_BYTES)
+            except zlib.error as e:
+                raise _Damaged(f'bad stream at offset {offset}: {e}') from e
+        return dictionary, data
+
+    # === Cross-reference sections ===
+
+    def load_section(self, offset):
+        """Read the section at offset; returns its trailer dictionary"""
+        chunk = self.read(offset, 4)
+        if chunk == b'xref':
+            section = self._table_section(offset + 4)
+        else:
+            section = self._stream_section(offset)
+        self.sections.append(section)
+        return section[-1]
+
+    def _table_section(self, pos):
+        subsections = []
+        while True:
+            subsection = _SUBSECTION_RE.match(self.read(pos, 64))
+            if not subsection:
+                break
+            first, count = int(subsection.group(1)), int(subsection.group(2))
+            entries = pos + subsection.end()
+            # Entries are 20 bytes; some writers end them with one byte instead of two
+            sample = self.read(entries, 20)
+            width = 19 if sample[18:19] == b'\n' or (sample[18:19] == b'\r' and sample[19:20] != b'\n') else 20
+            subsections.append((first, count, entries, width))
+            pos = entries + count * width
+        chunk = self.read(pos, 4096)
+        keyword = chunk.find(b'trailer')
+        trailer = _dictionary(chunk, keyword) if keyword >= 0 else None
+        if trailer is None:
+            raise _Damaged('xref table without a trailer')
+        return 'table', subsections, trailer
+
+    def _stream_section(self, offset):
+        trailer, data = self.stream_at(offset)
+        widths = _W_RE.search(trailer)
+        size = _SIZE_RE.search(trailer)
+        if b'/XRef' not in trailer or not widths or not size:
+            raise _Damaged(f'no xref stream at offset {offset}')
+        widths = [int(width) for width in widths.groups()]
+        row = sum(widths)
+
+        predictor = _PREDICTOR_RE.search(trailer)
+        if predictor and int(predictor.group(1)) >= 10:
+            columns = _COLUMNS_RE.search(trailer)
+            if not columns or int(columns.group(1)) != row:
+                raise _Damaged('xref stream predictor does not match its rows')
+            data = _undo_png_up(data, row)
+
+        index = _INDEX_RE.search(trailer)
+        numbers = [int(n) for n in index.group(1).split()] if index else [0, int(size.group(1))]
+        ranges = list(zip(numbers[0::2], numbers[1::2]))
+        return 'stream', data, ranges, widths, trailer
+
+    def locate(self, num):
+        """(1, offset, 0) for an object in the file, (2, stream number, index) for one in an object stream"""
+        for section in self.sections:
+            if section[0] == 'table':
+                for first, count, entries, width in section[1]:
+                    if first <= num < first + count:
+                        entry = self.read(entries + (num - first) * width, 18)
+                        if entry[17:18] != b'n':
+                            return None
+                        return 1, int(entry[:10]), 0
+            else:
+                _, data, ranges, widths, _ = section
+                row_size = sum(widths)
+                row = 0
+                for first, count in ranges:
+                    if first <= num < first + count:
+                        position = (row + num - first) * row_size
+                        fields = []
+                        for width in widths:
+                            fields.append(int.from_bytes(data[position:position + width], 'big'))
+                            position += width
+                        kind = fields[0] if widths[0] else 1
+                        if kind == 0:
+                            return None
+                        return kind, fields[1], fields[2]
+                    row += count
+        return None
+
+    def object_dictionary(self, num):
+        """The dictionary of object num, wherever it is stored"""
+        location = self.locate(num)
+        if location is None:
+            raise _Damaged(f'object {num} is not in the xref')
+        kind, where, index = location
+        if kind == 1:
+            return self.dictionary_at(where)[0]
+
+        if where not in self._object_streams:
+            stream_location = self.locate(where)
+            if stream_location is None or stream_location[0] != 1:
+                raise _Damaged(f'object stream {where} is not in the xref')
+            self._object_streams[where] = self.stream_at(stream_location[1])
+        dictionary, data = self._object_streams[where]
+        count, first = _N_RE.search(dictionary), _FIRST_RE.search(dictionary)
+        if not count or not first:
+            raise _Damaged(f'object stream {where} has no /N or /First')
+        first = int(first.group(1))
+        numbers = [int(n) for n in data[:first].split()]
+        if 2 * index + 1 >= len(numbers):
+            raise _Damaged(f'object stream {where} has no entry {index}')
+        start = first + numbers[2 * index + 1]
+        end = first + numbers[2 * index + 3] if 2 * index + 3 < len(numbers) else len(data)
+        found = _dictionary(data[start:end], 0)
+        if found is None:
+            raise _Damaged(f'object {num} is not a dictionary')
+        return found
+
+
+def _undo_png_up(data, row_size):
+    """Decode PNG-predicted xref stream rows (the 'Up' filter every writer uses)"""
+    stride = row_size + 1
+    if len(data) % stride or set(data[0::stride]) - {0, 2}:
+        raise _Damaged('unsupported xref stream predictor')
+    if not data or set(data[0::stride]) == {0}:
+        return b''.join(data[i + 1:i + stride] for i in range(0, len(data), stride))
+    decoded = bytearray()
+    previous = bytes(row_size)
+    for i in range(0, len(data), stride):
+        current = data[i + 1:i + stride]
+        if data[i] == 2:
+            current = bytes((a + b) & 0xFF for a, b in zip(current, previous))
+        decoded += current
+        previous = current
+    return bytes(decoded)
+
+
+def _structure(reader, xref_offset):
+    """(trailer, page count or None) from the newest section at xref_offset"""
+    trailer = reader.load_section(xref_offset)
+    previous = trailer
+    seen = {xref_offset}
+    try:
+        # Earlier sections too - objects not changed by an update are only listed there
+        while len(reader.sections) < MAX_SECTIONS:
+            prev = _PREV_RE.search(previous)
+            if not prev or int(prev.group(1)) in seen:
+                break
+            seen.add(int(prev.group(1)))
+            previous = reader.load_section(int(prev.group(1)))
+
+        root = _ROOT_RE.search(trailer)
+        if not root:
+            raise _Damaged('trailer has no /Root')
+        pages = _PAGES_RE.search(reader.object_dictionary(int(root.group(1))))
+        if not pages:
+            raise _Damaged('catalog has no /Pages')
+        count = _COUNT_RE.search(reader.object_dictionary(int(pages.group(1))))
+        if not count:
+            raise _Damaged('page tree has no /Count')
+        return trailer, int(count.group(1))
+    except _Damaged as e:
+        logger.info('Page count unknown: %s', e)
+        return trailer, None
+
+
+def _password_protected(file_obj):
+    """True if an encrypted PDF doesn't open with the empty password"""
+    file_obj.seek(0)
+    try:
+        PDFDocument(PDFParser(file_obj), password='')
+    except PDFPasswordIncorrect:
+        return True
+    except Exception as e:
+        # Unsupported security handler or a damaged file - leave it to the backends
+        logger.info('Could not check the PDF password: %s', e)
+    return False
+
+
+def inspect_pdf(file_obj):
+    """
+    Check a PDF's signature, structure and limits without extracting it
+
+    Args:
+        file_obj: Seekable binary file-like object (rewound afterwards)
+
+    Returns:
+        PdfInfo: (version, size, object_count, page_count, encrypted, fingerprint)
+
+    Raises:
+        PreflightError: 400 - not a PDF; 422 - password-protected;
+            413 - over PREFLIGHT_MAX_PAGES or PREFLIGHT_MAX_OBJECTS
+    """
+    try:
+        file_obj.seek(0, os.SEEK_END)
+        size = file_obj.tell()
+        file_obj.seek(0)
+        head = file_obj.read(HEAD_BYTES)
+        base = check_signature(head)
+        version = head[base + 5:base + 8].decode('latin-1')
+
+        file_obj.seek(max(0, size - TAIL_BYTES))
+        tail = file_obj.read(TAIL_BYTES)
+        found = list(_STARTXREF_RE.finditer(tail))
+        trailer, page_count, xref_offset = b'', None, None
+        if found:
+            xref_offset = int(found[-1].group(1))
+            try:
+                trailer, page_count = _structure(_Reader(file_obj, base), xref_offset)
+            except _Damaged as e:
+                logger.info('Cross-reference data unreadable: %s', e)
+        else:
+            logger.info('No startxref - the PDF is truncated or damaged')
+
+        object_count = _SIZE_RE.search(trailer)
+        object_count = int(object_count.group(1)) if object_count else None
+        encrypted = b'/Encrypt' in trailer
+        if encrypted and _password_protected(file_obj):
+            raise PreflightError('PDF is password-protected - send a copy without a password', 422)
+    finally:
+        file_obj.seek(0)
+
+    if PREFLIGHT_MAX_PAGES and page_count is not None and page_count > PREFLIGHT_MAX_PAGES:
+        raise PreflightError(f'PDF has {page_count} pages (maximum {PREFLIGHT_MAX_PAGES})', 413)
+    if PREFLIGHT_MAX_OBJECTS and object_count is not None and object_count > PREFLIGHT_MAX_OBJECTS:
+        raise PreflightError(f'PDF has {object_count} objects (maximum {PREFLIGHT_MAX_OBJECTS})', 413)
+
+    document_id = _ID_RE.search(trailer)
+    digest = hashlib.sha256(b'pdf-structure:')
+    for part in (version, size, object_count, page_count, encrypted, xref_offset,
+                 document_id.group(1) if document_id else b''):
+        digest.update(str(part).encode() + b'|')
+    return PdfInfo(version, size, object_count, page_count, encrypted, digest.hexdigest()[:32])
@@ -0,0 +1,244 @@
+"""
+Raw content-stream text scanner
+Pulls text straight out of page content streams (Tj/TJ/'/" operators) without layout analysis
+
+Only handles simply-encoded PDFs: fonts with embedded CMaps, custom glyph
+encodings, object streams, encryption or image-style filters are declined with
+UnsupportedPDF, so the caller can fall back to a full parser.
+"""
+import base64
+import re
+import zlib
+
+
+class UnsupportedPDF(Exception):
+    """The PDF uses features this scanner does not decode"""
+
+
+# Markers of encodings whose glyph codes don't map directly to Latin-1 text
+_UNSUPPORTED_MARKERS = [b'/ObjStm', b'/Encrypt', b'/ToUnicode', b'/Identity-H', b'/Identity-V', b'/Differences']
+
+_OBJ_RE = re.compile(rb'(\d+)\s+\d+\s+obj\b(.*?)\bendobj', re.DOTALL)
+_REF_RE = re.compile(rb'(\d+)\s+\d+\s+R')
+_ROOT_RE = re.compile(rb'/Root\s+(\d+)\s+\d+\s+R')
+_PAGES_RE = re.compile(rb'/Pages\s+(\d+)\s+\d+\s+R')
+_KIDS_RE = re.compile(rb'/Kids\s*\[([^\]]*)\]')
+_CONTENTS_RE = re.compile(rb'/Contents\s*(\[[^\]]*\]|\d+\s+\d+\s+R)')
+_TYPE_PAGES_RE = re.compile(rb'/Type\s*/Pages\b')
+_FILTER_RE = re.compile(rb'/Filter\s*(\[[^\]]*\]|/\w+)')
+_STREAM_RE = re.compile(rb'stream\r?\n(.*?)\r?\n?endstream', re.DOTALL)
+_FILTER_NAME_RE = re.compile(rb'/(\w+)')
+_WHITESPACE_RE = re.compile(rb'\s')
+
+# Content stream tokens: literal strings, hex strings, array brackets, names, numbers, operators
+_TOKEN_RE = re.compile(
+    rb'\((?:\\.|[^\\)])*\)'
+    rb'|<[0-9A-Fa-f\s]*>'
+    rb'|\[|\]'
+    rb'|/[^\s/\[\]()<>{}%]+'
+    rb'|[-+]?(?:\d+\.?\d*|\.\d+)'
+    rb"|[A-Za-z'\"*]+",
+    re.DOTALL,
+)
+_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f',
+            b'(': b'(', b')': b')', b'\\': b'\\'}
+_ESCAPE_RE = re.compile(rb'\\([0-7]{1,3}|\r\n|\n|\r|.)', re.DOTALL)
+
+# TJ kerning below this (thousandths of an em) is treated as a word gap
+_KERNING_SPACE = -200
+
+
+def _unescape(raw):
+    def replace(match):
+        seq = match.group(1)
+        if seq[:1].isdigit():
+            return bytes([int(seq, 8) & 0xFF])
+        if seq in (b'\r\n', b'\n', b'\r'):
+            return b''  # line continuation
+        return _ESCAPES.get(seq, seq)
+    return _ESCAPE_RE.sub(replace, raw).decode('latin-1')
+
+
+def _decode_string(token):
+    if token[:1] == b'(':
+        return _unescape(token[1:-1])
+    hex_digits = _WHITESPACE_RE.sub(b'', token[1:-1])
+    if len(hex_digits) % 2:
+        hex_digits += b'0'
+    return bytes.fromhex(hex_digits.decode('ascii')).decode('latin-1')
+
+
+def content_stream_text(content):
+    """
+    Extract text from one decoded content stream
+
+    Args:
+        content (bytes): Decompressed content stream
+
+    Returns:
+        str: Text, one line per text line in the stream
+    """
+    lines = []
+    line = []
+    operands = []
+    array = None
+
+    def newline():
+        if line:
+            lines.append(''.join(line))
+            line.clear()
+
+    for token in _TOKEN_RE.findall(content):
+        first = token[:1]
+        if first in (b'(', b'<'):
+            (array if array is not None else operands).append(_decode_string(token))
+        elif token == b'[':
+            array = []
+        elif token == b']':
+            operands.append(array)
+            array = None
+        elif array is not None:
+            # Numbers inside a TJ array are kerning adjustments
+            try:
+                array.append(float(token))
+            except ValueError:
+                pass
+        elif first == b'/' or first in b'+-.0123456789':
+            operands.append(token)
+        else:
+            op = token
+            if op == b'Tj' and operands and isinstance(operands[-1], str):
+                line.append(operands[-1])
+            elif op == b'TJ' and operands and isinstance(operands[-1], list):
+                for item in operands[-1]:
+                    if isinstance(item, str):
+                        line.append(item)
+                    elif item < _KERNING_SPACE:
+                        line.append(' ')
+            elif op in (b"'", b'"'):
+                newline()
+                if operands and isinstance(operands[-1], str):
+                    line.append(operands[-1])
+            elif op in (b'T*', b'ET'):
+                newline()
+            elif op in (b'Td', b'TD') and len(operands) >= 2:
+                try:
+                    if float(operands[-1]) != 0:
+                        newline()
+                    elif float(operands[-2]) > 0 and line:
+                        line.append(' ')
+                except ValueError:
+                    pass
+            elif op == b'Tm':
+                newline()
+            operands = []
+
+    newline()
+    return '\n'.join(lines)
+
+
+def _parse_objects(data):
+    return {int(num): body for num, body in _OBJ_RE.findall(data)}
+
+
+def _flate(raw):
+    try:
+        return zlib.decompress(raw)
+    except zlib.error:
+        # Some writers pad the stream; decompressobj tolerates trailing bytes
+        return zlib.decompressobj().decompress(raw)
+
+
+def _ascii85(raw):
+    raw = _WHITESPACE_RE.sub(b'', raw)
+    if raw.endswith(b'~>'):
+        raw = raw[:-2]
+    return base64.a85decode(raw)
+
+
+def _ascii_hex(raw):
+    raw = _WHITESPACE_RE.sub(b'', raw).rstrip(b'>')
+    if len(raw) % 2:
+        raw += b'0'
+    return bytes.fromhex(raw.decode('ascii'))
+
+
+_FILTERS = {
+    b'FlateDecode': _flate, b'Fl': _flate,
+    b'ASCII85Decode': _ascii85, b'A85': _ascii85,
+    b'ASCIIHexDecode': _ascii_hex, b'AHx': _ascii_hex,
+}
+
+
+def _stream_data(body):
+    match = _STREAM_RE.search(body)
+    if not match:
+        return b''
+    data = match.group(1)
+    filters = _FILTER_RE.search(body[:match.start()])
+    if not filters:
+        return data
+    for name in _FILTER_NAME_RE.findall(filters.group(1)):
+        decode = _FILTERS.get(name)
+        if decode is None:
+            raise UnsupportedPDF(f'Unsupported stream filter: {name.decode()}')
+        data = decode(data)
+    return data
+
+
+def _page_objects(objects, data):
+    """Return page object bodies in document order by walking the page tree"""
+    root = _ROOT_RE.search(data)
+    if not root or int(root.group(1)) not in objects:
+        raise UnsupportedPDF('Document catalog not found')
+    pages_ref = _PAGES_RE.search(objects[int(root.group(1))])
+    if not pages_ref:
+        raise UnsupportedPDF('Page tree not found')
+
+    pages = []
+    stack = [int(pages_ref.group(1))]
+    seen = set()
+    while stack:
+        num = stack.pop()
+        if num in seen or num not in objects:
+            continue
+        seen.add(num)
+        body = objects[num]
+        if _TYPE_PAGES_RE.search(body):
+            kids = _KIDS_RE.search(body)
+            if kids:
+                # Reversed so the first kid is popped first
+                stack.extend(int(ref) for ref in reversed(_REF_RE.findall(kids.group(1))))
+        else:
+            pages.append(body)
+    return pages
+
+
+def iter_page_texts(data, start=0, max_pages=None):
+    """
+    Yield (page index, text) for each page of a PDF
+
+    Args:
+        data (bytes): Whole PDF file
+        start (int): First page index to yield
+        max_pages (int): Stop before this page index
+
+    Raises:
+        UnsupportedPDF: The PDF needs a full parser
+    """
+    for marker in _UNSUPPORTED_MARKERS:
+        if marker in data:
+            raise UnsupportedPDF(f'{marker.decode()} is not supported')
+
+    objects = _parse_objects(data)
+    pages = _page_objects(objects, data)
+
+    for i, page in enumerate(pages[start:max_pages], start):
+        contents = _CONTENTS_RE.search(page)
+        chunks = []
+        if contents:
+            for ref in _REF_RE.findall(contents.group(1)):
+                body = objects.get(int(ref))
+                if body is not None:
+                    chunks.append(_stream_data(body))
+        yield i, content_stream_text(b'\n'.join(chunks))
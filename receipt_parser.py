@@ -1,17 +1,440 @@
+import hashlib
+import json
+import logging
+import os
 import re
+import time
+from collections import namedtuple
 from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
 
-def parse_receipt_data(text):
+import metrics
+from receipt_result import Receipt, parse_date, parse_time, to_cents
+
+logger = logging.getLogger(__name__)
+
+# Per-bank parser profiles (bank names, keywords and bank-specific field patterns).
+# Edit this file - or point the variable at another one - to add a bank without a code change.
+BANK_PROFILES_PATH = os.environ.get(
+    'BANK_PROFILES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bank_profiles.json'))
+
+# All patterns are compiled once at import time; parse_receipt_data only runs them.
+
+# === TRANSACTION ID EXTRACTION ===
+# Pattern: REF: 1234567890 or Transaction No: TX-99 (bank-specific formats live in the profiles)
+# Each entry: (compiled pattern, group holding the ID).
+# Longest label first - 'Reference' alone would read 'Reference ID: 123' as the ID 'ID'.
+TRANS_ID_PATTERNS = [
+    (re.compile(r'(?:Reference ID|Reference|REF)[:\s]+([A-Z0-9-]+)', re.IGNORECASE), 1),
+    (re.compile(r'Transaction\s+(?:No|Number|ID)[:\s]+([A-Z0-9-]+)', re.IGNORECASE), 1),
+    (re.compile(r'Receipt\s+(?:No|Number)[:\s]+([A-Z0-9-]+)', re.IGNORECASE), 1),
+]
+
+# === AMOUNT EXTRACTION ===
+# Pattern: RM 100.00 or RM100.00 or MYR 100 or Amount: 100.00
+# Handle cases where "Amount" and "RM 100.00" are on separate lines
+AMOUNT_PATTERNS = [
+    re.compile(r'Amount[:\s]*\n?\s*RM\s*(\d+(?:[,.]\d+)*(?:\.\d{2})?)', re.IGNORECASE | re.MULTILINE),  # Amount\nRM 100.00
+    re.compile(r'RM\s*(\d+(?:[,.]\d+)*(?:\.\d{2})?)', re.IGNORECASE | re.MULTILINE),  # RM 100.00 or RM100.00
+    re.compile(r'MYR\s*(\d+(?:[,.]\d+)*(?:\.\d{2})?)', re.IGNORECASE | re.MULTILINE),  # MYR 100.00
+    re.compile(r'Total[:\s]+RM\s*(\d+(?:[,.]\d+)*(?:\.\d{2})?)', re.IGNORECASE | re.MULTILINE),  # Total: RM 100.00
+]
+
+# === DATE EXTRACTION ===
+# Pattern: 03/12/2025 or 2025-12-03 or 03 Dec 2025 or 03-Dec-2025
+DATE_PATTERNS = [
+    re.compile(r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})', re.IGNORECASE),  # 03/12/2025 or 03-12-2025
+    re.compile(r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})', re.IGNORECASE),    # 2025-12-03
+    re.compile(r'(\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{4})', re.IGNORECASE),  # 03 Dec 2025
+    re.compile(r'(\d{1,2}[-](?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[-]\d{4})', re.IGNORECASE)  # 03-Dec-2025
+]
+
+# === TIME EXTRACTION ===
+# Pattern: 09:37:45 or 09:37 AM or 21:30
+TIME_PATTERNS = [
+    re.compile(r'(\d{1,2}:\d{2}:\d{2})', re.IGNORECASE),  # 09:37:45
+    re.compile(r'(\d{1,2}:\d{2}\s*[AP]M)', re.IGNORECASE),  # 09:37 AM
+    re.compile(r'Time[:\s]+(\d{1,2}:\d{2}(?::\d{2})?)', re.IGNORECASE)  # Time: 09:37
+]
+
+# === ACCOUNT NUMBER EXTRACTION ===
+# Account numbers often have spaces like "5641 9177 5091"
+SPACED_ACCOUNT_RE = re.compile(r'\b\d{4}\s+\d{3,4}\s+\d{4}\b')
+ACCOUNT_RE = re.compile(r'\b\d{10,16}\b')
+
+# Generic extractors per field, as (compiled pattern, group) pairs.
+# They run after the detected bank's own patterns, as the fallback.
+GENERIC_EXTRACTORS = {
+    'transaction_id': TRANS_ID_PATTERNS,
+    'amount': [(pattern, 1) for pattern in AMOUNT_PATTERNS],
+    'date': [(pattern, 1) for pattern in DATE_PATTERNS],
+    'time': [(pattern, 1) for pattern in TIME_PATTERNS],
+    'receiver_account': [(SPACED_ACCOUNT_RE, 0)],
+}
+
+# === BANK PROFILES ===
+# extractors: field -> tuple of (compiled pattern, group), the bank's own patterns
+#             followed by the generic ones, so each field lookup is a single ordered scan
+# layout:     field -> tuple of LayoutRule, the bank's own followed by the default ones
+#             (used by layout_extractor, which reads values next to labels on the page)
+BankProfile = namedtuple('BankProfile', 'name keywords extractors layout')
+# label: lower-cased label words; where: 'right' (same line) or 'below' (next line);
+# pattern, group: what to take from the neighbouring words (None = the field's default)
+LayoutRule = namedtuple('LayoutRule', 'label where pattern group')
+# banks: BankProfile list in detection priority order; any_bank: the profile used when
+# no bank is detected (every bank's own patterns and rules, then the generic ones);
+# digest: short hash of the profiles file
+ProfileSet = namedtuple('ProfileSet', 'banks any_bank digest')
+
+LAYOUT_POSITIONS = ('right', 'below')
+
+
+def _compile_pattern(source, field, entry):
+    try:
+        pattern = re.compile(entry['pattern'], re.IGNORECASE | re.MULTILINE)
+    except (KeyError, TypeError, re.error) as e:
+        raise ValueError(f'{source}: bad {field} pattern {entry!r}: {e}') from e
+    group = entry.get('group', 1 if pattern.groups else 0)
+    if not 0 <= group <= pattern.groups:
+        raise ValueError(f'{source}: {field} pattern {entry["pattern"]!r} has no group {group}')
+    return pattern, group
+
+
+def _check_field(source, field):
+    if field not in GENERIC_EXTRACTORS:
+        raise ValueError(f'{source}: unknown field {field!r} (expected one of {", ".join(GENERIC_EXTRACTORS)})')
+
+
+def _compile_extractors(source, fields):
+    compiled = {}
+    for field, entries in fields.items():
+        _check_field(source, field)
+        compiled[field] = [_compile_pattern(source, field, entry) for entry in entries]
+    return compiled
+
+
+def _compile_layout(source, layout):
+    compiled = {}
+    for field, entries in layout.items():
+        _check_field(source, field)
+        compiled[field] = []
+        for entry in entries:
+            label = tuple(str(entry.get('label', '')).lower().split())
+            if not label or entry.get('where') not in LAYOUT_POSITIONS:
+                raise ValueError(f'{source}: {field} layout rule {entry!r} needs a label and '
+                                 f'"where" ({" or ".join(LAYOUT_POSITIONS)})')
+            pattern, group = _compile_pattern(source, field, entry) if 'pattern' in entry else (None, None)
+            compiled[field].append(LayoutRule(label, entry['where'], pattern, group))
+    return compiled
+
+
+def _build_profile(name, keywords, patterns, rules, default_rules):
+    extractors = {field: tuple(patterns.get(field, ())) + tuple(generic)
+                  for field, generic in GENERIC_EXTRACTORS.items()}
+    layout = {field: tuple(rules.get(field, ())) + tuple(default_rules.get(field, ()))
+              for field in GENERIC_EXTRACTORS}
+    return BankProfile(name, keywords, extractors, layout)
+
+
+def load_profiles(path):
+    """
+    Load and compile bank parser profiles from a JSON file
+
+    Args:
+        path (str): File with a "banks" list and an optional default "layout";
+            each bank has a name and optional keywords, per-field pattern lists
+            ("fields") and layout rules ("layout") - see bank_profiles.json
+
+    Returns:
+        ProfileSet: (banks, any_bank, digest)
+
+    Raises:
+        ValueError: If the file is not valid JSON or a profile is malformed
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    try:
+        data = json.loads(content)
+        banks = list(data['banks'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f'{path}: expected a JSON object with a "banks" list ({e})') from e
+
+    default_rules = _compile_layout(f'{path} (default layout)', data.get('layout', {}))
+    profiles = []
+    all_patterns, all_rules = {}, {}
+    for bank in banks:
+        name = bank.get('name')
+        if not name:
+            raise ValueError(f'{path}: every bank profile needs a name')
+        keywords = tuple(keyword.lower() for keyword in bank.get('keywords', [name]))
+        patterns = _compile_extractors(name, bank.get('fields', {}))
+        rules = _compile_layout(name, bank.get('layout', {}))
+        profiles.append(_build_profile(name, keywords, patterns, rules, default_rules))
+        for field, pairs in patterns.items():
+            all_patterns.setdefault(field, []).extend(pairs)
+        for field, field_rules in rules.items():
+            all_rules.setdefault(field, []).extend(field_rules)
+
+    any_bank = _build_profile(None, (), all_patterns, all_rules, default_rules)
+    return ProfileSet(profiles, any_bank, hashlib.sha256(content).hexdigest()[:12])
+
+
+PROFILES, ANY_BANK, _profiles_hash = load_profiles(BANK_PROFILES_PATH)
+
+# Bump whenever parsing or extraction output can change, so cached results are not reused.
+# The profiles file's hash is part of it, so editing that file invalidates cached results too.
+PARSER_VERSION = f'1.3.2+{_profiles_hash}'
+
+# === BANK DETECTION ===
+# Listed in priority order: when several banks are mentioned, the first one listed wins
+BANKS = [profile.name for profile in PROFILES]
+# Lower-cased once at load; matched against the lower-cased receipt text
+_BANK_KEYWORDS = [(keyword, profile) for profile in PROFILES for keyword in profile.keywords]
+
+# === STATUS DETECTION ===
+# Checked in priority order: any success keyword beats any failed keyword, etc.
+STATUS_KEYWORDS = [
+    (keyword, status)
+    for status, keywords in [
+        ('successful', ['successful', 'completed', 'approved', 'success', 'paid']),
+        ('failed', ['failed', 'rejected', 'declined', 'cancelled']),
+        ('pending', ['pending', 'processing', 'waiting']),
+    ]
+    for keyword in keywords
+]
+def _find_keyword(text_lower, keywords):
+    """
+    Return the first (keyword, value) pair whose keyword occurs in text_lower
+
+    Substring checks run in C and, for a dozen short keywords, are faster
+    than a combined alternation regex in CPython's re engine.
+    """
+    for keyword, value in keywords:
+        if keyword in text_lower:
+            return keyword, value
+    return None
+
+
+def _search(extractors, text, trace=None):
+    """Return the group of the first matching (pattern, group) pair, or None"""
+    for pattern, group in extractors:
+        match = pattern.search(text)
+        if match:
+            if trace is not None:
+                trace.append((pattern, group, match))
+            return match.group(group)
+    return None
+
+
+def detect_bank(text_lower):
+    """Return the BankProfile of the highest-priority bank mentioned in text_lower, or None"""
+    found = _find_keyword(text_lower, _BANK_KEYWORDS)
+    return found[1] if found else None
+
+
+# Amounts round half up to cents, as receipt_result.to_cents does
+_CENT = Decimal('0.01')
+
+# The finders below take an optional trace list: when given, the (pattern, group, match)
+# that produced the value is appended to it (see explain_fields)
+
+
+def find_transaction_id(text, profile=ANY_BANK, trace=None):
+    """Return the transaction ID from the first matching pattern, or None"""
+    return _search(profile.extractors['transaction_id'], text, trace)
+
+
+def find_amount(text, profile=ANY_BANK, trace=None):
+    """Return the amount as a Decimal with 2 places, or None"""
+    for pattern, group in profile.extractors['amount']:
+        match = pattern.search(text)
+        if match:
+            # Clean amount (remove commas, keep dots for decimals)
+            amount_str = match.group(group).replace(',', '')
+            try:
+                # Exact: no float rounding on the way to cents
+                amount = Decimal(amount_str).quantize(_CENT, rounding=ROUND_HALF_UP)
+            except InvalidOperation:
+                continue
+            if trace is not None:
+                trace.append((pattern, group, match))
+            return amount
+    return None
+
+
+def find_date(text, profile=ANY_BANK, trace=None):
+    """Return the transaction date string, or None"""
+    return _search(profile.extractors['date'], text, trace)
+
+
+def find_time(text, profile=ANY_BANK, trace=None):
+    """Return the transaction time string, or None"""
+    return _search(profile.extractors['time'], text, trace)
+
+
+def find_receiver_account(text, profile=ANY_BANK, trace=None):
+    """Return the beneficiary account number without spaces, or None"""
+    # The bank's labelled patterns first, then any space-separated account number
+    account = _search(profile.extractors['receiver_account'], text, trace)
+    if account:
+        return account.replace(' ', '')
+
+    # Try continuous digits, skipping company registration numbers and dates
+    for match in ACCOUNT_RE.finditer(text):
+        account = match.group(0)
+        if not ('196' in account or '200' in account):
+            if trace is not None:
+                trace.append((ACCOUNT_RE, 0, match))
+            return account
+    return None
+
+
+# Field -> finder(text, profile), in extraction order
+FIELD_FINDERS = {
+    'transaction_id': find_transaction_id,
+    'amount': find_amount,
+    'date': find_date,
+    'time': find_time,
+    'receiver_account': find_receiver_account,
+}
+
+# Fields that make a receipt complete: once all are found, later pages are not read
+REQUIRED_FIELDS = [(field, FIELD_FINDERS[field]) for field in ('transaction_id', 'amount', 'date', 'receiver_account')]
+
+# Characters from the end of the previous page searched again with the next page,
+# so a label and its value split by a page break are still found
+PAGE_OVERLAP = 200
+
+
+class PageScan:
+    """
+    Which REQUIRED_FIELDS are still missing from the pages read so far
+
+    Each page is searched together with the last lines (at most PAGE_OVERLAP
+    characters) of the text before it, never the whole prefix again, so
+    reading n pages costs O(n). The bank is detected the same way until one
+    is found; its profile is then used for the rest of the pages.
+
+    - profile: the detected BankProfile, or None so far
+    - missing: (field, finder) pairs not found in any page yet
+    """
+
+    def __init__(self):
+        self.profile = None
+        self.missing = list(REQUIRED_FIELDS)
+        self._tail = ''
+
+    def add(self, page_text):
+        """Search one more page; returns the fields still missing"""
+        window = self._tail + page_text
+        if self.profile is None:
+            self.profile = detect_bank(window.lower())
+        profile = self.profile or ANY_BANK
+        self.missing = [(field, finder) for field, finder in self.missing if finder(window, profile) is None]
+
+        tail = window[-PAGE_OVERLAP:]
+        if len(window) > PAGE_OVERLAP:
+            # From a line start, so a number cut in half isn't read as a shorter one
+            tail = tail[tail.find('\n') + 1:]
+        self._tail = tail
+        return self.missing
+
+# === PROVENANCE ===
+# Confidence in a value by how it was found. A value that fails its sanity
+# check (a date or time in no known format, a zero amount) gets half.
+CONFIDENCE = {
+    'layout': 0.95,    # read next to its label (layout_extractor)
+    'profile': 0.9,    # the detected bank's own pattern
+    'keyword': 0.9,    # bank and status keywords
+    'generic': 0.75,   # a generic pattern, or any bank's when no bank was detected
+    'default': 0.6,    # status assumed from the amount
+    'fallback': 0.4,   # the account number read from any 10-16 digit run
+}
+
+_SANITY_CHECKS = {
+    'amount': lambda value: value > 0,
+    'date': lambda value: parse_date(value) is not None,
+    'time': lambda value: parse_time(value) is not None,
+}
+
+
+def _provenance(source, value, field=None, pattern=None, span=None):
+    confidence = CONFIDENCE[source]
+    check = _SANITY_CHECKS.get(field)
+    if check is not None and not check(value):
+        confidence /= 2
+    return {'source': source, 'pattern': pattern, 'span': span, 'confidence': confidence}
+
+
+def _pattern_source(field, pattern, group, profile):
+    """'profile', 'generic' or 'fallback' for the pattern a finder reported"""
+    extractors = profile.extractors[field]
+    if (pattern, group) not in extractors:
+        return 'fallback'
+    if profile is ANY_BANK or extractors.index((pattern, group)) >= len(extractors) - len(GENERIC_EXTRACTORS[field]):
+        return 'generic'
+    return 'profile'
+
+
+def _keyword_span(text_lower, keyword):
+    start = text_lower.find(keyword)
+    return [start, start + len(keyword)]
+
+
+def explain_fields(result, text, traces, known, profile, status_keyword):
+    """
+    Build a receipt's provenance section from what parse_receipt_data recorded
+
+    Returns:
+        dict: {'confidence': lowest confidence among REQUIRED_FIELDS (0 if one
+              is missing), 'fields': {field: {'source', 'pattern', 'span',
+              'confidence'} or None if not found}}; spans index the parsed text
+    """
+    text_lower = text.lower()
+    fields = {}
+    for field in FIELD_FINDERS:
+        value = result.amount if field == 'amount' else getattr(result, field)
+        if value is None:
+            fields[field] = None
+        elif known.get(field) is not None:
+            start = text.find(str(known[field]))
+            fields[field] = _provenance('layout', value, field,
+                                        span=[start, start + len(str(known[field]))] if start >= 0 else None)
+        else:
+            pattern, group, match = traces[field][-1]
+            fields[field] = _provenance(_pattern_source(field, pattern, group, profile), value, field,
+                                        pattern.pattern, list(match.span(group)))
+
+    fields['bank'] = None
+    if result.bank:
+        found = _find_keyword(text_lower, _BANK_KEYWORDS)
+        fields['bank'] = _provenance('keyword', result.bank, pattern=found[0], span=_keyword_span(text_lower, found[0]))
+    fields['status'] = None
+    if status_keyword:
+        fields['status'] = _provenance('keyword', result.status, pattern=status_keyword,
+                                       span=_keyword_span(text_lower, status_keyword))
+    elif result.status:
+        fields['status'] = _provenance('default', result.status)
+
+    confidence = min((fields[field]['confidence'] if fields[field] else 0.0) for field, _ in REQUIRED_FIELDS)
+    return {'confidence': confidence, 'fields': fields}
+
+
+def parse_receipt_data(text, known=None, explain=False):
     """
     Parse receipt text to extract structured transaction data
-    
+
     Args:
         text (str): Extracted text from PDF receipt
-        
+        known (dict): Field values already extracted another way (e.g. by
+            layout_extractor); only the missing fields are searched for in text
+        explain (bool): Also record how each field was found, in
+            result.provenance (see explain_fields); off, nothing is recorded
+
     Returns:
-        dict: Structured receipt information including:
+        Receipt: Structured receipt information (item access gives the JSON values):
             - transaction_id: Transaction reference number
-            - amount: Transaction amount (float)
+            - amount: Transaction amount (integer cents in amount_cents)
             - date: Transaction date
             - time: Transaction time
             - sender_account: Sender account number
@@ -20,178 +443,91 @@ def parse_receipt_data(text):
             - status: Transaction status
             - raw_text: Original extracted text (first 500 chars)
     """
-    
-    # Initialize result
-    result = {
-        'transaction_id': None,
-        'amount': None,
-        'date': None,
-        'time': None,
-        'sender_account': None,
-        'receiver_account': None,
-        'bank': None,
-        'status': None,
-        'raw_text': text[:500] if text else None  # First 500 chars for debugging
-    }
-    
-    print("🔍 Parsing receipt data...")
-    
+
+    # First 500 chars of the text kept for debugging
+    result = Receipt(raw_text=text[:500] if text else None)
+
+    # Lower-case once; bank and status keywords are matched against this copy
+    text_lower = text.lower()
+
     # === BANK DETECTION ===
-    banks = [
-        'Maybank', 'CIMB', 'Public Bank', 'RHB', 'Hong Leong', 
-        'AmBank', 'Bank Islam', 'HSBC', 'Standard Chartered',
-        'Alliance Bank', 'Affin Bank', 'UOB', 'OCBC'
-    ]
-    
-    for bank in banks:
-        if bank.lower() in text.lower():
-            result['bank'] = bank
-            print(f"✅ Bank detected: {bank}")
-            break
-    
-    # === TRANSACTION ID EXTRACTION ===
-    # Pattern: M2U_20251203_0937 or 290121492M or REF: 1234567890
-    trans_id_patterns = [
-        r'M2U_\d+_\d+',  # Maybank M2U format
-        r'\b\d{9,12}[A-Z]\b',  # Maybank format: 290121492M (9-12 digits + letter)
-        r'(?:REF|Reference|Reference ID)[:\s]+([A-Z0-9-]+)',
-        r'Transaction\s+(?:No|Number|ID)[:\s]+([A-Z0-9-]+)',
-        r'Receipt\s+(?:No|Number)[:\s]+([A-Z0-9-]+)'
-    ]
-    
-    for pattern in trans_id_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            if 'M2U' in pattern or r'\b\d{9,12}[A-Z]\b' == pattern:
-                result['transaction_id'] = match.group(0)
-            else:
-                result['transaction_id'] = match.group(1)
-            print(f"✅ Transaction ID: {result['transaction_id']}")
-            break
-    
-    # === AMOUNT EXTRACTION ===
-    # Pattern: RM 100.00 or RM100.00 or MYR 100 or Amount: 100.00
-    # Handle cases where "Amount" and "RM 100.00" are on separate lines
-    amount_patterns = [
-        r'Amount[:\s]*\n?\s*RM\s*(\d+(?:[,.]\d+)*(?:\.\d{2})?)',  # Amount\nRM 100.00
-        r'RM\s*(\d+(?:[,.]\d+)*(?:\.\d{2})?)',  # RM 100.00 or RM100.00
-        r'MYR\s*(\d+(?:[,.]\d+)*(?:\.\d{2})?)',  # MYR 100.00
-        r'Total[:\s]+RM\s*(\d+(?:[,.]\d+)*(?:\.\d{2})?)',  # Total: RM 100.00
-    ]
-    
-    for pattern in amount_patterns:
-        match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
-        if match:
-            # Clean amount (remove commas, keep dots for decimals)
-            amount_str = match.group(1).replace(',', '')
-            try:
-                amount_value = float(amount_str)
-                # Store as float, but ensure 2 decimal places
-                result['amount'] = round(amount_value, 2)
-                print(f"✅ Amount: RM {result['amount']:.2f}")
-                break
-            except ValueError:
-                continue
-    
-    # === DATE EXTRACTION ===
-    # Pattern: 03/12/2025 or 2025-12-03 or 03 Dec 2025 or 03-Dec-2025
-    date_patterns = [
-        r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',  # 03/12/2025 or 03-12-2025
-        r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})',    # 2025-12-03
-        r'(\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{4})',  # 03 Dec 2025
-        r'(\d{1,2}[-](?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[-]\d{4})'  # 03-Dec-2025
-    ]
-    
-    for pattern in date_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            result['date'] = match.group(1)
-            print(f"✅ Date: {result['date']}")
-            break
-    
-    # === TIME EXTRACTION ===
-    # Pattern: 09:37:45 or 09:37 AM or 21:30
-    time_patterns = [
-        r'(\d{1,2}:\d{2}:\d{2})',  # 09:37:45
-        r'(\d{1,2}:\d{2}\s*[AP]M)',  # 09:37 AM
-        r'Time[:\s]+(\d{1,2}:\d{2}(?::\d{2})?)'  # Time: 09:37
-    ]
-    
-    for pattern in time_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            result['time'] = match.group(1)
-            print(f"✅ Time: {result['time']}")
-            break
-    
-    # === ACCOUNT NUMBER EXTRACTION ===
-    # Look for beneficiary account number (often has spaces like "5641 9177 5091")
-    beneficiary_pattern = r'Beneficiary account number[:\s]*\n?\s*(\d{4}\s*\d{4}\s*\d{4}|\d{10,16})'
-    beneficiary_match = re.search(beneficiary_pattern, text, re.IGNORECASE | re.MULTILINE)
-    
-    if beneficiary_match:
-        # Remove spaces from account number
-        account = beneficiary_match.group(1).replace(' ', '')
-        result['receiver_account'] = account
-        print(f"✅ Beneficiary account: {account}")
+    # Fields are then extracted with the bank's profile; generic patterns are its fallback
+    profile = detect_bank(text_lower)
+    if profile:
+        result.bank = profile.name
+        logger.debug('Bank detected: %s', result.bank)
     else:
-        # Fallback: Look for any account numbers (10-16 digits, may have spaces)
-        # First try to find space-separated format
-        space_accounts = re.findall(r'\b\d{4}\s+\d{3,4}\s+\d{4}\b', text)
-        if space_accounts:
-            result['receiver_account'] = space_accounts[0].replace(' ', '')
-            print(f"✅ Account found: {result['receiver_account']}")
+        profile = ANY_BANK
+
+    # === FIELD EXTRACTION ===
+    # Transaction ID, amount, date, time and receiver account
+    known = known or {}
+    traces = {field: [] for field in FIELD_FINDERS} if explain else {}
+    for field, finder in FIELD_FINDERS.items():
+        value = known.get(field)
+        if value is None:
+            value = finder(text, profile, traces.get(field))
+        if field == 'amount':
+            result.amount_cents = to_cents(value)
         else:
-            # Try continuous digits
-            accounts = re.findall(r'\b\d{10,16}\b', text)
-            # Filter out company registration numbers and dates
-            valid_accounts = [acc for acc in accounts if not ('196' in acc or '200' in acc)]
-            if valid_accounts:
-                result['receiver_account'] = valid_accounts[0]
-                print(f"✅ Account found: {result['receiver_account']}")
-    
+            setattr(result, field, value)
+
     # === STATUS DETECTION ===
-    success_keywords = ['successful', 'completed', 'approved', 'success', 'paid']
-    failed_keywords = ['failed', 'rejected', 'declined', 'cancelled']
-    pending_keywords = ['pending', 'processing', 'waiting']
-    
-    text_lower = text.lower()
-    
-    for keyword in success_keywords:
-        if keyword in text_lower:
-            result['status'] = 'successful'
-            print(f"✅ Status: successful (keyword: {keyword})")
-            break
-    
-    if not result['status']:
-        for keyword in failed_keywords:
-            if keyword in text_lower:
-                result['status'] = 'failed'
-                print(f"❌ Status: failed (keyword: {keyword})")
-                break
-    
-    if not result['status']:
-        for keyword in pending_keywords:
-            if keyword in text_lower:
-                result['status'] = 'pending'
-                print(f"⏳ Status: pending (keyword: {keyword})")
-                break
-    
+    found = _find_keyword(text_lower, STATUS_KEYWORDS)
+    keyword = None
+    if found:
+        keyword, result.status = found
+        logger.debug('Status %s (keyword: %s)', result.status, keyword)
+
     # Default to successful if amount is present
-    if not result['status'] and result['amount']:
-        result['status'] = 'successful'
-        print("✅ Status: successful (default, amount present)")
-    
+    if not result.status and result.amount_cents:
+        result.status = 'successful'
+        logger.debug('Status successful (default, amount present)')
+
     # === SUMMARY ===
-    print("\n📊 Parsing Results:")
-    print(f"   Bank: {result['bank']}")
-    print(f"   Transaction ID: {result['transaction_id']}")
-    if result['amount'] is not None:
-        print(f"   Amount: RM {result['amount']:.2f}")
-    else:
-        print(f"   Amount: RM {result['amount']}")
-    print(f"   Date: {result['date']}")
-    print(f"   Time: {result['time']}")
-    print(f"   Status: {result['status']}")
-    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('Parsed receipt', extra={
+            'fields': {key: value for key, value in result.items() if key != 'raw_text'}
+        })
+
+    if explain:
+        result.provenance = explain_fields(result, text, traces, known, profile, keyword)
+    return result
+
+
+def parse_receipt_pages(pages, explain=False):
+    """
+    Parse a receipt from page texts, reading only as many pages as needed
+
+    Pages are consumed one at a time (e.g. from pdf_processor.iter_pdf_pages)
+    and no further pages are requested once every field in REQUIRED_FIELDS
+    has been found with the detected bank's profile, so a multi-page
+    statement usually costs one page. Each page is searched once (see
+    PageScan), and the pages read are parsed together once at the end.
+
+    Args:
+        pages: Iterable of page texts
+        explain (bool): Record field provenance (see parse_receipt_data)
+
+    Returns:
+        Receipt: Same as parse_receipt_data, for the pages that were read
+    """
+    page_texts = []
+    scan = PageScan()
+    # Parse time only - time spent extracting the next page is the extractor's
+    parsing = 0.0
+
+    for page_text in pages:
+        started = time.perf_counter()
+        page_texts.append(page_text)
+        missing = scan.add(page_text)
+        parsing += time.perf_counter() - started
+        if not missing:
+            logger.debug('All required fields found after %d page(s)', len(page_texts))
+            break
+
+    started = time.perf_counter()
+    result = parse_receipt_data(''.join(page_texts), explain=explain)
+    metrics.observe_stage('parse', parsing + time.perf_counter() - started)
+    metrics.count_fields(result, [field for field in result if field != 'raw_text'])
     return result
@@ -0,0 +1,166 @@
+"""
+Compact typed result of parsing one receipt
+
+Receipt replaces the 9-key dict parse_receipt_data used to build for every
+receipt: a slotted dataclass has no per-instance __dict__, so a result costs
+about a third of the dict's memory (raw_text aside) and pickles smaller on its
+way back from the extraction workers. The amount is kept as integer cents -
+exact, unlike the rounded float - and read as a Decimal.
+
+Item access (receipt['amount'], .get, .keys, dict(receipt)) gives the JSON
+values the dicts had - amount as a number, date and time as printed on the
+receipt - so the API's response shape, the caches and the job store are
+unchanged. json_default serializes a Receipt straight from its slots.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Optional
+
+# In JSON (and item access) order
+FIELDS = ('transaction_id', 'amount', 'date', 'time', 'sender_account', 'receiver_account', 'bank', 'status',
+          'raw_text')
+
+# Receipt date formats, tried in order (day first - Malaysian receipts)
+DATE_FORMATS = ['%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%Y-%m-%d', '%Y/%m/%d', '%d %b %Y', '%d %B %Y', '%d-%b-%Y']
+TIME_FORMATS = ['%H:%M:%S', '%H:%M', '%I:%M %p', '%I:%M%p', '%I:%M:%S %p']
+
+_CENT = Decimal('0.01')
+
+
+def to_cents(value):
+    """
+    Convert an amount to integer cents, rounding half up
+
+    Args:
+        value: str ('1,250.50'), Decimal, int or float; None passes through
+
+    Returns:
+        int or None: Cents, or None if value is missing or not a number
+    """
+    if value is None:
+        return None
+    if isinstance(value, float):
+        value = repr(value)
+    try:
+        amount = Decimal(str(value).replace(',', '')).quantize(_CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        return None
+    return int(amount * 100)
+
+
+def _parse(text, formats):
+    text = ' '.join(text.split())
+    for fmt in formats:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_date(text):
+    """Return the receipt date as a datetime.date, or None if missing or in no known format"""
+    parsed = _parse(text, DATE_FORMATS) if text else None
+    return parsed.date() if parsed else None
+
+
+def parse_time(text):
+    """Return the receipt time as a datetime.time, or None if missing or in no known format"""
+    parsed = _parse(text.upper(), TIME_FORMATS) if text else None
+    return parsed.time() if parsed else None
+
+
+@dataclass(slots=True)
+class Receipt:
+    """
+    Structured transaction data from one receipt
+
+    - amount_cents: amount in cents (see the amount property for a Decimal)
+    - date, time: as printed; parsed_date / parsed_time give date and time objects
+    - raw_text: first 500 characters of the extracted text, for debugging
+    - provenance: how each field was found, when parsed with explain=True
+      (see receipt_parser.explain_fields); not one of FIELDS, and only in
+      to_dict when set
+    """
+    transaction_id: Optional[str] = None
+    amount_cents: Optional[int] = None
+    date: Optional[str] = None
+    time: Optional[str] = None
+    sender_account: Optional[str] = None
+    receiver_account: Optional[str] = None
+    bank: Optional[str] = None
+    status: Optional[str] = None
+    raw_text: Optional[str] = None
+    provenance: Optional[dict] = None
+
+    @property
+    def amount(self):
+        """Amount as a Decimal with 2 places, or None"""
+        return None if self.amount_cents is None else Decimal(self.amount_cents).scaleb(-2)
+
+    @property
+    def parsed_date(self):
+        return parse_date(self.date)
+
+    @property
+    def parsed_time(self):
+        return parse_time(self.time)
+
+    def __reduce__(self):
+        # Values only: each result sent back from a pool worker is pickled on its own,
+        # and the default slots state would repeat every field name
+        return Receipt, tuple(getattr(self, name) for name in self.__slots__)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a Receipt from a result dict (e.g. one read back from the JSON cache or job store)"""
+        values = {key: data.get(key) for key in FIELDS if key != 'amount'}
+        return cls(amount_cents=to_cents(data.get('amount')), provenance=data.get('provenance'), **values)
+
+    # Mapping view, with the JSON values
+
+    def __getitem__(self, key):
+        if key == 'amount':
+            return None if self.amount_cents is None else self.amount_cents / 100
+        if key not in FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return value
+
+    def keys(self):
+        return FIELDS
+
+    def items(self):
+        return [(key, self[key]) for key in FIELDS]
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __contains__(self, key):
+        return key in FIELDS
+
+    def to_dict(self):
+        """The result as a plain dict of JSON values"""
+        data = {key: self[key] for key in FIELDS}
+        if self.provenance is not None:
+            data['provenance'] = self.provenance
+        return data
+
+
+def json_default(obj):
+    """json.dumps default= hook: serializes Receipts (and Decimals) found anywhere in the value"""
+    if isinstance(obj, Receipt):
+        return obj.to_dict()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
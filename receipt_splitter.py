@@ -0,0 +1,313 @@
+"""
+Splitting one PDF that holds several receipts into one record per receipt
+
+Customers often merge transfer receipts into a single PDF. parse_receipt_data
+takes the first match for each field, so only the first receipt would be
+returned. split_pages cuts the extracted text into segments instead:
+
+- Each page is divided into blocks at the places a receipt can start: the
+  top of the page, a line naming a bank (the receipt banner), and a line
+  repeating the document's first line (its header).
+- Walking the blocks in order, a transaction ID that differs from the current
+  segment's starts a new segment. It begins at the surest start since the
+  previous ID - a repeated header, else the top of a page, else the last
+  banner - so a "thank you for banking with ..." footer stays with its
+  receipt. Blocks without an ID (statement and continuation pages) stay with
+  the segment before them, so a one-receipt PDF is still one record.
+
+Each page is scanned once - the banner regex, the header lookup and the ID
+patterns each see every character once - and every segment is parsed on its
+own text only, so the cost grows linearly with the page count.
+
+On the pool, a PDF longer than SPLIT_CHUNK_PAGES is extracted in page ranges
+by several workers at once, and its segments are parsed in parallel batches.
+The PDF is written to one temporary file that every range job opens, rather
+than pickled into each job.
+Receipts must start on a new page, after a bank banner or at a repeated header
+to be told apart; two receipts inside one block are read as one.
+"""
+import logging
+import math
+import os
+import re
+import tempfile
+import time
+from functools import partial
+from io import BytesIO
+
+import metrics
+import ocr
+from admission import gate_slot
+from pdf_processor import NoTextError, TextPageCounter, iter_pdf_pages, pdf_page_count
+from preflight import PreflightError
+from receipt_parser import PROFILES, find_transaction_id, parse_receipt_data
+from result_cache import RESULT_VERSION
+
+logger = logging.getLogger(__name__)
+
+# PDFs with more pages are extracted by several workers, this many pages each
+SPLIT_CHUNK_PAGES = int(os.environ.get('SPLIT_CHUNK_PAGES', '50'))
+
+# Segments parsed per pool job
+PARSE_BATCH_SIZE = 100
+
+# Split results are cached apart from single-receipt results for the same PDF
+SPLIT_VERSION = f'{RESULT_VERSION}/split'
+
+# Any bank keyword - a line naming a bank is where a receipt's banner can be
+_BANNER_RE = re.compile('|'.join(re.escape(keyword) for profile in PROFILES for keyword in profile.keywords),
+                        re.IGNORECASE)
+
+
+def flag_requested(value):
+    """True if a request flag such as 'split' or 'explain' (form, query or JSON value) is on"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return value is True
+
+
+# How surely a block start is the top of a receipt; a new receipt is cut at the surest one
+_BANNER, _PAGE, _HEADER = 1, 2, 3
+
+
+def _block_starts(page, header):
+    """Sorted (offset, kind) pairs for the places in page where a receipt could start"""
+    starts = {0: _PAGE}
+    for match in _BANNER_RE.finditer(page):
+        offset = page.rfind('\n', 0, match.start()) + 1
+        starts[offset] = max(starts.get(offset, _BANNER), _BANNER)
+    if header:
+        position = page.find(header)
+        while position != -1:
+            line_start = page.rfind('\n', 0, position) + 1
+            if not page[line_start:position].strip():
+                starts[line_start] = _HEADER
+            position = page.find(header, position + len(header))
+    return sorted(starts.items())
+
+
+def _cut(kinds):
+    """Index of the last of the surest block starts in kinds"""
+    surest = max(kinds)
+    return len(kinds) - 1 - kinds[::-1].index(surest)
+
+
+def split_pages(pages):
+    """
+    Split page texts into one text per receipt
+
+    Args:
+        pages: Iterable of page texts (e.g. from pdf_processor.iter_pdf_pages)
+
+    Returns:
+        list: Segment texts in document order; empty if there were no pages
+    """
+    header = None
+    segments = []
+    current_id = None
+    # Blocks since the current segment's last ID, and how each one started
+    pending = []
+    kinds = []
+
+    for page in pages:
+        if header is None:
+            header = next((line.strip() for line in page.splitlines() if line.strip()), None)
+        starts = _block_starts(page, header)
+        ends = [offset for offset, _ in starts[1:]] + [len(page)]
+        for (begin, kind), end in zip(starts, ends):
+            block = page[begin:end]
+            block_id = find_transaction_id(block)
+            pending.append(block)
+            kinds.append(kind)
+            if block_id is None:
+                continue
+            if not segments:
+                segments.append(pending)
+            elif block_id == current_id:
+                segments[-1].extend(pending)
+            else:
+                # A new receipt: it starts at the surest block start since the last ID
+                cut = _cut(kinds)
+                segments[-1].extend(pending[:cut])
+                segments.append(pending[cut:])
+            current_id = block_id
+            pending = []
+            kinds = []
+
+    # Trailing blocks without an ID (or a document without any) belong to the last receipt
+    if pending:
+        if segments:
+            segments[-1].extend(pending)
+        else:
+            segments.append(pending)
+    logger.debug('Split into %d receipt(s)', len(segments))
+    return [''.join(blocks) for blocks in segments]
+
+
+def parse_segments(texts, explain=False):
+    """
+    Parse segment texts, one receipt each (runs inside a pool worker)
+
+    Returns:
+        dict: {'success': True, 'receipts': [Receipt, ...]}; with explain, provenance
+        spans index each receipt's own segment text
+    """
+    started = time.perf_counter()
+    receipts = [parse_receipt_data(text, explain=explain) for text in texts]
+    metrics.observe_stage('parse', time.perf_counter() - started)
+    for receipt in receipts:
+        metrics.count_fields(receipt, [field for field in receipt if field != 'raw_text'])
+    return {'success': True, 'receipts': receipts}
+
+
+def split_pdf_bytes(data, explain=False, info=None):
+    """
+    Extract, split and parse a PDF of at most SPLIT_CHUNK_PAGES pages (runs inside a pool worker)
+
+    Longer PDFs are only counted here and left to process_pdf_receipts. The
+    page count comes from info (the PDF's preflight.inspect_pdf result) when
+    the caller already has it.
+
+    Returns:
+        dict: {'success': True, 'receipts': [...]}, {'success': True, 'page_count': n}
+        for a long PDF, or {'success': False, 'error': '...'}; with OCR on, a
+        scanned PDF's error - or the receipts of a PDF with some pages lacking
+        a text layer - also has an 'ocr_job' for BatchProcessor to hand on
+    """
+    metrics.count_bytes(len(data))
+    file_obj = BytesIO(data)
+    try:
+        try:
+            page_count = pdf_page_count(file_obj, info)
+        except PreflightError:
+            raise
+        except Exception as e:
+            # The extraction backends may still read it - extract it all here
+            logger.info('Could not count pages: %s', e)
+            page_count = None
+        if page_count is not None and page_count > SPLIT_CHUNK_PAGES:
+            return {'success': True, 'page_count': page_count}
+        pages = TextPageCounter(iter_pdf_pages(file_obj))
+        outcome = parse_segments(split_pages(pages), explain)
+        if ocr.OCR_ENABLED and page_count and pages.text_pages < page_count:
+            # Mixed: a scanned page may hold a receipt of its own
+            outcome['ocr_job'] = _ocr_job(data, explain)
+        return outcome
+    except MemoryError:
+        raise
+    except PreflightError as e:
+        metrics.count_error('too_large' if e.status_code == 413 else 'invalid_pdf')
+        return {'success': False, 'error': str(e)}
+    except NoTextError as e:
+        outcome = {'success': False, 'error': f'Failed to process receipt: {str(e)}'}
+        if ocr.OCR_ENABLED:
+            # Scanned - handed on to the OCR pool (see BatchProcessor.call)
+            outcome['ocr_job'] = _ocr_job(data, explain)
+        else:
+            metrics.count_error('extraction')
+        return outcome
+    except Exception as e:
+        metrics.count_error('extraction')
+        return {'success': False, 'error': f'Failed to process receipt: {str(e)}'}
+
+
+def ocr_split_pdf_bytes(data, explain=False):
+    """Split and parse a scanned PDF with OCR (runs inside an OCR pool worker)"""
+    try:
+        return parse_segments(split_pages(ocr.iter_ocr_pages(data)), explain)
+    except MemoryError:
+        raise
+    except Exception as e:
+        metrics.count_error('ocr')
+        return {'success': False, 'error': f'Failed to process scanned receipt: {str(e)}'}
+
+
+def _ocr_job(data, explain):
+    return partial(ocr_split_pdf_bytes, explain=True) if explain else ocr_split_pdf_bytes, data
+
+
+def extract_page_range(job):
+    """
+    Extract the pages [start, stop) of a PDF (runs inside a pool worker)
+
+    Args:
+        job (tuple): (path of the PDF file, start, stop)
+
+    Returns:
+        dict: {'success': True, 'pages': [page text, ...]} (a range without text has no pages),
+        or {'success': False, 'error': '...'} if the range could not be read
+    """
+    path, start, stop = job
+    try:
+        with open(path, 'rb') as f:
+            return {'success': True, 'pages': list(iter_pdf_pages(f, stop, start=start))}
+    except MemoryError:
+        raise
+    except NoTextError as e:
+        # Backend errors are handled inside iter_pdf_pages - this range just has no text
+        logger.info('Pages %d-%d: %s', start + 1, stop, e)
+        return {'success': True, 'pages': []}
+    except Exception as e:
+        # Anything else would silently drop this range's receipts - fail the PDF instead
+        metrics.count_error('extraction')
+        return {'success': False, 'error': f'Failed to process receipt: pages {start + 1}-{stop}: {str(e)}'}
+
+
+def process_pdf_receipts(processor, data, explain=False, gate=None, ocr_gate=None, info=None):
+    """
+    Extract and parse every receipt in one PDF on a BatchProcessor's pool
+
+    Args:
+        processor (BatchProcessor): Pool to run on
+        data (bytes): PDF file content
+        explain (bool): Record each receipt's field provenance
+        gate (AdmissionGate): Held while extracting and parsing, released before any OCR; a long
+            PDF holds one slot per worker its range and parse jobs can occupy
+        ocr_gate (AdmissionGate): Held while the OCR pool reads a scanned PDF
+        info (PdfInfo): The PDF's preflight.inspect_pdf result, if already checked - it is not checked again
+
+    Returns:
+        dict: {'success': True, 'receipts': [Receipt, ...]} or {'success': False, 'error': '...'}
+
+    Raises:
+        WorkerAborted: The first job (which handles the whole of a short PDF) was aborted
+        Rejected: A gate turned the PDF away (503)
+    """
+    outcome = processor.call(partial(split_pdf_bytes, explain=explain, info=info), data, gate, ocr_gate)
+    if not outcome['success'] or 'receipts' in outcome:
+        return outcome
+
+    page_count = outcome['page_count']
+    # The range and parse jobs run on up to pool_size workers at once - the gate counts each of them
+    weight = min(math.ceil(page_count / SPLIT_CHUNK_PAGES), processor.pool_size)
+    with gate_slot(gate, weight):
+        return _process_long_pdf(processor, data, page_count, explain)
+
+
+def _process_long_pdf(processor, data, page_count, explain):
+    """Extract a long PDF in page ranges on several workers, then parse its segments in batches"""
+    # Each range job gets the file's path, not its own copy of the PDF
+    with tempfile.NamedTemporaryFile(prefix='pdf-receipt-split-', suffix='.pdf') as f:
+        f.write(data)
+        f.flush()
+        ranges = [(f.name, start, min(start + SPLIT_CHUNK_PAGES, page_count))
+                  for start in range(0, page_count, SPLIT_CHUNK_PAGES)]
+        logger.debug('Extracting %d pages in %d ranges', page_count, len(ranges))
+        pages = []
+        for result in processor.run([(extract_page_range, job) for job in ranges]):
+            if not result['success']:
+                return result
+            pages.extend(result['pages'])
+    if not pages:
+        metrics.count_error('extraction')
+        return {'success': False, 'error': 'Failed to process receipt: Could not extract text from PDF'}
+
+    texts = split_pages(pages)
+    batches = [texts[i:i + PARSE_BATCH_SIZE] for i in range(0, len(texts), PARSE_BATCH_SIZE)]
+    receipts = []
+    parse = partial(parse_segments, explain=True) if explain else parse_segments
+    for result in processor.run([(parse, batch) for batch in batches]):
+        if not result['success']:
+            return result
+        receipts.extend(result['receipts'])
+    return {'success': True, 'receipts': receipts}
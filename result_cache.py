@@ -0,0 +1,143 @@
+"""
+Content-hash result cache for processed receipts
+Re-uploads of the same PDF return the stored result instead of re-running extraction
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import ocr
+from pdf_processor import EXTRACTION_MODE
+from receipt_parser import PARSER_VERSION
+from receipt_result import json_default
+
+CHUNK_SIZE = 64 * 1024
+
+# Results depend on the parser version and on the extraction mode they were produced with, and on
+# whether (and how) OCR reads the scanned pages of PDFs that mix them with text pages
+_OCR_STATE = f'ocr{ocr.OCR_VERSION}' if ocr.OCR_ENABLED else 'no-ocr'
+RESULT_VERSION = f'{PARSER_VERSION}/{EXTRACTION_MODE}/{_OCR_STATE}'
+
+
+def content_key(file_obj, version=RESULT_VERSION):
+    """
+    Build a cache key from the PDF bytes and the parser version
+
+    Reads the file in chunks and rewinds it afterwards, so the same
+    file object can still be passed to extract_pdf_data.
+
+    Args:
+        file_obj: Seekable binary file-like object
+        version (str): Parser version the result was produced with
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    digest = hashlib.sha256(f'v{version}:'.encode())
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of parsed receipt results
+
+    - Memory tier: size-bounded LRU, per worker process
+    - Disk tier (optional): one JSON file per key, shared by all workers
+      on the host and kept across restarts
+    """
+
+    def __init__(self, max_entries=256, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f'{key}.json')
+
+    def _remember(self, key, value):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached result for key, or None on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return self._entries[key]
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                    value = json.load(f)
+            except (OSError, ValueError):
+                value = None
+
+            if value is not None:
+                with self._lock:
+                    self._remember(key, value)
+                    self._stats['disk_hits'] += 1
+                return value
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, key, value):
+        """Store a result in memory and, if enabled, on disk"""
+        with self._lock:
+            self._remember(key, value)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file first so other workers never read a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(value, f, default=json_default)
+                os.replace(tmp_path, path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def clear(self):
+        """Drop the memory tier and reset counters (disk entries are kept)"""
+        with self._lock:
+            self._entries.clear()
+            for name in self._stats:
+                self._stats[name] = 0
+
+    def stats(self):
+        """Hit/miss counters and current memory tier size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['hits'] = stats['memory_hits'] + stats['disk_hits']
+            stats['entries'] = len(self._entries)
+            stats['max_entries'] = self.max_entries
+            stats['disk_enabled'] = bool(self.disk_dir)
+        return stats
+
+
+def cache_from_env():
+    """Create the cache configured by RESULT_CACHE_SIZE / RESULT_CACHE_DIR"""
+    return ResultCache(
+        max_entries=int(os.environ.get('RESULT_CACHE_SIZE', '256')),
+        disk_dir=os.environ.get('RESULT_CACHE_DIR') or None,
+    )
@@ -0,0 +1,96 @@
+"""
+Structured, leveled logging for the API
+One JSON object per line, tagged with the request ID of the request being served
+
+Hot-path detail (per page, per field) is logged at DEBUG with lazy %-style
+arguments, so it costs a level check when LOG_LEVEL is INFO or higher.
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+
+# Minimum level emitted (DEBUG, INFO, WARNING, ERROR)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# 'json' for log pipelines, 'text' for reading in a terminal
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+
+# ID of the request being served in this thread / task (None outside a request)
+request_id = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed via extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+def new_request_id(incoming=None):
+    """
+    Start a request: adopt the caller's X-Request-ID if sane, else generate one
+
+    Returns:
+        str: The request ID now set for this context
+    """
+    if incoming and len(incoming) <= 128 and incoming.isprintable():
+        rid = incoming
+    else:
+        rid = uuid.uuid4().hex
+    request_id.set(rid)
+    return rid
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON, including any extra={...} fields"""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        entry['pid'] = record.process
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+_TEXT_FORMAT = '%(asctime)s %(levelname)-7s [%(request_id)s] %(name)s: %(message)s'
+_configured = False
+
+
+def configure_logging(level=None, fmt=None, stream=None):
+    """
+    Install the root handler (once per process; later calls only change the level)
+
+    Args:
+        level (str): Log level (defaults to LOG_LEVEL)
+        fmt (str): 'json' or 'text' (defaults to LOG_FORMAT)
+        stream: Where to write (defaults to stderr)
+    """
+    global _configured
+    root = logging.getLogger()
+    root.setLevel(level or LOG_LEVEL)
+    if _configured:
+        return
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.addFilter(_RequestIdFilter())
+    if (fmt or LOG_FORMAT) == 'text':
+        handler.setFormatter(logging.Formatter(_TEXT_FORMAT))
+    else:
+        handler.setFormatter(JsonFormatter())
+    root.addHandler(handler)
+    _configured = True
@@ -0,0 +1,112 @@
+"""
+Tests for rate limiting and load shedding (admission.py)
+"""
+import threading
+import time
+from io import BytesIO
+
+import pytest
+
+import app as api
+from admission import AdmissionGate, RateLimiter, Rejected, client_key
+
+
+def test_bucket_allows_a_burst_then_refills(tmp_path):
+    limiter = RateLimiter(str(tmp_path / 'rate.sqlite3'), per_minute=60, burst=3)
+    for _ in range(3):
+        limiter.check('client', now=1000.0)
+
+    with pytest.raises(Rejected) as rejected:
+        limiter.check('client', now=1000.0)
+    assert rejected.value.status_code == 429 and rejected.value.retry_after == 1
+
+    limiter.check('other', now=1000.0)
+    limiter.check('client', now=1001.0)
+
+
+def test_buckets_are_shared_through_the_database(tmp_path):
+    path = str(tmp_path / 'rate.sqlite3')
+    first, second = RateLimiter(path, per_minute=60, burst=2), RateLimiter(path, per_minute=60, burst=2)
+
+    first.check('client', now=1000.0)
+    second.check('client', now=1000.0)
+    with pytest.raises(Rejected):
+        first.check('client', now=1000.0)
+
+    RateLimiter(path, per_minute=0, burst=1).check('client')  # disabled
+
+
+def test_gate_bounds_in_flight_and_sheds_when_the_line_is_full():
+    gate = AdmissionGate(max_in_flight=1, max_queue=1, max_wait=5)
+    release = threading.Event()
+    entered = []
+
+    def hold():
+        with gate.slot():
+            entered.append(time.perf_counter())
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    while not entered:
+        time.sleep(0.01)
+    waiter = threading.Thread(target=hold)
+    waiter.start()
+    while gate.stats()['waiting'] == 0:
+        time.sleep(0.01)
+
+    with pytest.raises(Rejected) as rejected:
+        with gate.slot():
+            pass
+    assert rejected.value.status_code == 503
+
+    release.set()
+    holder.join()
+    waiter.join()
+    assert len(entered) == 2
+    assert gate.stats()['in_flight'] == 0 and gate.stats()['shed'] == 1
+
+
+def test_gate_sheds_when_the_estimated_wait_is_too_long():
+    gate = AdmissionGate(max_in_flight=1, max_queue=10, max_wait=2)
+    gate.average_seconds = 3.0
+    with gate.slot():
+        with pytest.raises(Rejected) as rejected:
+            with gate.slot():
+                pass
+    assert rejected.value.retry_after == 3
+
+
+def test_gate_counts_every_slot_a_weighted_request_holds():
+    gate = AdmissionGate(max_in_flight=3, max_queue=0, max_wait=5)
+    with gate.slot(2):
+        assert gate.stats()['in_flight'] == 2
+        with pytest.raises(Rejected):
+            with gate.slot(2):
+                pass
+        with gate.slot():
+            assert gate.stats()['in_flight'] == 3
+    # More slots than the gate has are capped, so such a request can still get in
+    with gate.slot(10):
+        assert gate.stats()['in_flight'] == 3
+    assert gate.stats()['in_flight'] == 0
+
+
+def test_client_key_uses_the_address_the_proxy_saw():
+    assert client_key('6.6.6.6, 203.0.113.9', '10.0.0.1') == '203.0.113.9'
+    assert client_key(None, '10.0.0.1') == '10.0.0.1'
+
+
+def test_endpoint_answers_429_and_503_with_retry_after(monkeypatch, tmp_path, receipt_pdf):
+    monkeypatch.setattr(api, 'rate_limiter', RateLimiter(str(tmp_path / 'rate.sqlite3'), per_minute=6, burst=1))
+    busy = AdmissionGate(max_in_flight=1, max_queue=0, max_wait=5)
+    busy.in_flight = 1
+    monkeypatch.setattr(api, 'admission_gate', busy)
+    client = api.app.test_client()
+
+    shed = client.post('/process-receipt', data={'file': (BytesIO(receipt_pdf), 'receipt.pdf')})
+    limited = client.post('/process-receipt', data={'file': (BytesIO(receipt_pdf), 'receipt.pdf')})
+
+    assert shed.status_code == 503 and shed.headers['Retry-After'] == '1'
+    assert limited.status_code == 429 and limited.headers['Retry-After'] == '10'
+    assert limited.get_json()['success'] is False
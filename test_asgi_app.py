@@ -0,0 +1,102 @@
+"""
+Tests for the ASGI variant of the API
+"""
+import asyncio
+
+import pytest
+from starlette.testclient import TestClient
+
+import asgi_app
+from batch_processor import BatchProcessor
+from dedup_index import DedupIndex
+from downloader import DownloadCache, DownloadError, download_pdf_async, new_async_client
+from result_cache import ResultCache
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    processor = BatchProcessor(pool_size=1)
+    monkeypatch.setattr(asgi_app, 'batch_processor', processor)
+    monkeypatch.setattr(asgi_app, 'result_cache', ResultCache(max_entries=8))
+    monkeypatch.setattr(asgi_app, 'dedup_index', DedupIndex(str(tmp_path / 'dedup.sqlite3')))
+    monkeypatch.setattr('downloader.download_cache', DownloadCache(str(tmp_path)))
+    with TestClient(asgi_app.app) as client:
+        yield client
+    processor.shutdown()
+
+
+def test_upload_matches_flask_contract(client, receipt_pdf):
+    first = client.post('/process-receipt', files={'file': ('receipt.pdf', receipt_pdf, 'application/pdf')})
+    second = client.post('/process-receipt', files={'file': ('receipt.pdf', receipt_pdf, 'application/pdf')})
+
+    assert first.status_code == 200
+    assert first.json()['data']['transaction_id'] == 'M2U_20251203_0937'
+    assert [first.headers['X-Cache'], second.headers['X-Cache']] == ['MISS', 'HIT']
+    assert first.json()['duplicate_of'] is None
+    assert second.json()['duplicate_of'] == first.headers['X-Request-ID']
+
+
+def test_file_url_is_downloaded_asynchronously(client, http_server, receipt_pdf):
+    http_server.files['/cdn/receipt.pdf'] = receipt_pdf
+
+    response = client.post('/process-receipt', json={'file_url': http_server.url + '/cdn/receipt.pdf'})
+    assert response.status_code == 200
+    assert response.json()['data']['amount'] == 100.0
+
+    response = client.post('/process-receipt', data={'file_url': http_server.url + '/missing.pdf'})
+    assert response.status_code == 400
+    assert response.json()['success'] is False
+
+
+def test_bad_requests(client):
+    assert client.post('/process-receipt', data={}).status_code == 400
+    response = client.post('/process-receipt', files={'file': ('notes.txt', b'hello', 'text/plain')})
+    assert 'Invalid file type' in response.json()['error']
+    assert client.get('/health').json()['status'] == 'healthy'
+
+
+def test_concurrent_async_downloads_share_one_client(http_server, tmp_path):
+    for n in range(20):
+        http_server.files[f'/chunked/{n}.pdf'] = b'%PDF' + bytes([n]) * 10_000
+
+    async def fetch_all():
+        async with new_async_client() as http:
+            files = await asyncio.gather(*[
+                download_pdf_async(f'{http_server.url}/chunked/{n}.pdf', http, cache=DownloadCache(None))
+                for n in range(20)
+            ])
+            with pytest.raises(DownloadError) as excinfo:
+                await download_pdf_async(http_server.url + '/chunked/0.pdf', http, max_bytes=1000,
+                                         cache=DownloadCache(None))
+        return [f.read() for f in files], excinfo.value.status_code
+
+    bodies, status_code = asyncio.run(fetch_all())
+    assert bodies == [http_server.files[f'/chunked/{n}.pdf'] for n in range(20)]
+    assert status_code == 413
+
+
+def test_chunked_upload_without_content_length_is_cut_off_at_the_limit(client, monkeypatch):
+    monkeypatch.setattr(asgi_app, 'MAX_UPLOAD_BYTES', 10_000)
+    boundary = 'receipt-boundary'
+    chunks = [(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="big.pdf"\r\n'
+               'Content-Type: application/pdf\r\n\r\n%PDF').encode()] + [b'x' * 4096] * 100
+    received, sent = [], []
+
+    # Straight through the ASGI interface: the test client would buffer the whole body before sending it
+    async def receive():
+        received.append(chunks[len(received)])
+        return {'type': 'http.request', 'body': received[-1], 'more_body': len(received) < len(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+             'scheme': 'http', 'path': '/process-receipt', 'raw_path': b'/process-receipt', 'query_string': b'',
+             'root_path': '', 'client': ('127.0.0.1', 1234), 'server': ('testserver', 80),
+             'headers': [(b'content-type', f'multipart/form-data; boundary={boundary}'.encode())]}
+    asyncio.run(asgi_app.app(scope, receive, send))
+
+    assert sent[0]['status'] == 413
+    assert b'"success":false' in sent[1]['body'].replace(b' ', b'')
+    # Refused as the body streamed in, not after all of it was buffered
+    assert len(received) < len(chunks)
@@ -0,0 +1,94 @@
+"""
+Tests for the parallel batch endpoint
+"""
+from io import BytesIO
+
+import pytest
+
+import app as api
+from batch_processor import BatchProcessor, process_pdf_bytes
+from conftest import make_pdf
+from result_cache import ResultCache
+
+
+@pytest.fixture
+def client(monkeypatch):
+    processor = BatchProcessor(pool_size=2, max_pending=2)
+    monkeypatch.setattr(api, 'batch_processor', processor)
+    monkeypatch.setattr(api, 'result_cache', ResultCache(max_entries=8))
+    yield api.app.test_client()
+    processor.shutdown()
+
+
+def test_run_keeps_input_order():
+    processor = BatchProcessor(pool_size=2, max_pending=1)
+    try:
+        pdfs = [make_pdf([[f'Amount RM {n}.00']]) for n in range(1, 6)]
+        results = processor.run([(process_pdf_bytes, pdf) for pdf in pdfs])
+    finally:
+        processor.shutdown()
+
+    assert [r['data']['amount'] for r in results] == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_imap_streams_with_bounded_lookahead():
+    processor = BatchProcessor(pool_size=2, max_pending=2)
+    pulled = []
+
+    def jobs():
+        for n in range(1, 7):
+            pulled.append(n)
+            yield process_pdf_bytes, make_pdf([[f'Amount RM {n}.00']])
+
+    try:
+        amounts = []
+        for result in processor.imap(jobs()):
+            # Never more than max_pending jobs taken beyond the ones already yielded
+            assert len(pulled) <= len(amounts) + 1 + 2
+            amounts.append(result['data']['amount'])
+    finally:
+        processor.shutdown()
+
+    assert amounts == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+
+
+def test_batch_endpoint_reports_per_item_errors(client, receipt_pdf):
+    files = [
+        (BytesIO(receipt_pdf), 'first.pdf'),
+        (BytesIO(b'not a pdf'), 'notes.txt'),
+        (BytesIO(b'%PDF-1.4 garbage'), 'broken.pdf'),
+        (BytesIO(make_pdf([['CIMB Clicks', 'RM 25.50']])), 'second.pdf'),
+    ]
+    response = client.post('/process-receipts/batch', data={'files': files},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [r['filename'] for r in results] == ['first.pdf', 'notes.txt', 'broken.pdf', 'second.pdf']
+    assert [r['success'] for r in results] == [True, False, False, True]
+    assert results[0]['data']['transaction_id'] == 'M2U_20251203_0937'
+    assert 'Invalid file type' in results[1]['error']
+    assert results[3]['data']['bank'] == 'CIMB'
+
+
+def test_batch_endpoint_rejects_empty_request(client):
+    response = client.post('/process-receipts/batch', json={'file_urls': []})
+    assert response.status_code == 400
+
+
+def test_batch_endpoint_enforces_max_files(client, monkeypatch):
+    monkeypatch.setattr(api, 'BATCH_MAX_FILES', 2)
+    response = client.post('/process-receipts/batch', json={'file_urls': ['a', 'b', 'c']})
+    assert response.status_code == 413
+
+
+def test_explain_adds_provenance_to_the_response(client, receipt_pdf):
+    plain = client.post('/process-receipt', data={'file': (BytesIO(receipt_pdf), 'receipt.pdf')})
+    explained = client.post('/process-receipt?explain=true', data={'file': (BytesIO(receipt_pdf), 'receipt.pdf')})
+
+    assert 'provenance' not in plain.get_json()['data']
+    # Cached apart from the plain result, which has no provenance
+    assert explained.headers['X-Cache'] == 'MISS'
+    provenance = explained.get_json()['data']['provenance']
+    assert provenance['fields']['amount']['source'] == 'generic'
+    assert 0 < provenance['confidence'] <= 1
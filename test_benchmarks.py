@@ -0,0 +1,32 @@
+"""
+Tests for the synthetic corpus and benchmark suite (kept tiny - they guard against bit rot, not speed)
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import corpus  # noqa: E402
+import receipt_parser  # noqa: E402
+import run_benchmarks  # noqa: E402
+
+
+def test_corpus_is_reproducible_and_covers_banks_and_kinds():
+    items = corpus.generate_corpus(40, seed=3, statement_ratio=0.3, artifact_ratio=0.3)
+    again = corpus.generate_corpus(40, seed=3, statement_ratio=0.3, artifact_ratio=0.3)
+
+    assert [item.pdf for item in items] == [item.pdf for item in again]
+    assert {item.bank for item in items} == set(receipt_parser.BANKS)
+    assert {item.kind for item in items} == {'receipt', 'statement', 'artifact'}
+    assert all(item.pages > 1 for item in items if item.kind == 'statement')
+
+
+def test_suite_reports_percentiles_and_accuracy():
+    report = run_benchmarks.run(13, seed=1, stages={'extract', 'clean', 'parse', 'layout'})
+
+    assert report['meta']['corpus']['count'] == 13
+    assert set(report['results']) == {'extract', 'clean', 'parse', 'layout'}
+    for result in report['results'].values():
+        assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms'] <= result['max_ms']
+    assert report['results']['parse']['accuracy'] == 1.0
+    assert report['results']['layout']['accuracy'] == 1.0
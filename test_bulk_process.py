@@ -0,0 +1,162 @@
+"""
+Tests for the bulk offline CLI (bulk_process.py)
+"""
+import csv
+import io
+import json
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+import bulk_process
+from batch_processor import BatchProcessor
+from conftest import make_pdf
+
+NAMES = [f'r{n}.pdf' for n in range(1, 6)]
+
+
+@pytest.fixture
+def processor():
+    processor = BatchProcessor(pool_size=2, max_pending=2)
+    yield processor
+    processor.shutdown()
+
+
+@pytest.fixture
+def pdfs():
+    return {name: make_pdf([['Maybank2u', f'Amount RM {n}.00']]) for n, name in enumerate(NAMES, 1)}
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_directory_glob_zip_and_tar_sources(tmp_path, pdfs):
+    folder = tmp_path / 'receipts'
+    (folder / 'sub').mkdir(parents=True)
+    (folder / 'notes.txt').write_text('not a receipt')
+    with zipfile.ZipFile(tmp_path / 'receipts.zip', 'w') as archive, \
+            tarfile.open(tmp_path / 'receipts.tar.gz', 'w:gz') as tar:
+        for name, pdf in pdfs.items():
+            (folder / 'sub' / name).write_bytes(pdf)
+            archive.writestr(f'sub/{name}', pdf)
+            info = tarfile.TarInfo(f'sub/{name}')
+            info.size = len(pdf)
+            tar.addfile(info, io.BytesIO(pdf))
+
+    expected = [(os.path.join('sub', name), pdfs[name]) for name in NAMES]
+    members = list(bulk_process.iter_members(str(folder)))
+    assert [(m.name, m.data) for m in members] == expected
+    for archive in ('receipts.zip', 'receipts.tar.gz'):
+        members = list(bulk_process.iter_members(str(tmp_path / archive)))
+        assert [(m.name, m.data) for m in members] == [(f'sub/{name}', pdfs[name]) for name in NAMES]
+    members = list(bulk_process.iter_members(str(folder / '**' / '*.pdf')))
+    assert [m.data for m in members] == [pdfs[name] for name in NAMES]
+
+
+def test_oversized_members_are_reported_in_order(tmp_path, pdfs, processor):
+    big = make_pdf([['Amount RM 9.00', 'x' * 5000]])
+    with zipfile.ZipFile(tmp_path / 'receipts.zip', 'w') as archive:
+        archive.writestr('big.pdf', big)
+        for name in NAMES[:2]:
+            archive.writestr(name, pdfs[name])
+        archive.writestr('also-big.pdf', big)
+
+    output = tmp_path / 'out.jsonl'
+    counts = bulk_process.run(str(tmp_path / 'receipts.zip'), str(output), processor=processor,
+                              max_bytes=len(big) - 1)
+
+    items = read_jsonl(output)
+    assert [item['file'] for item in items] == ['big.pdf', 'r1.pdf', 'r2.pdf', 'also-big.pdf']
+    assert [item['success'] for item in items] == [False, True, True, False]
+    assert 'too large' in items[0]['error']
+    assert counts == {'done': 4, 'succeeded': 2, 'failed': 2, 'resumed_at': 0}
+
+
+def test_csv_output(tmp_path, pdfs, processor):
+    for name, pdf in pdfs.items():
+        (tmp_path / name).write_bytes(pdf)
+
+    output = tmp_path / 'out.csv'
+    bulk_process.run(str(tmp_path), str(output), fmt='csv', processor=processor)
+
+    with open(output, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['file'] for row in rows] == NAMES
+    assert rows[0]['bank'] == 'Maybank' and rows[0]['amount'] == '1.0'
+    assert 'raw_text' not in rows[0]
+
+
+def test_crashed_run_resumes_from_checkpoint(tmp_path, pdfs, processor, monkeypatch):
+    for name, pdf in pdfs.items():
+        (tmp_path / name).write_bytes(pdf)
+    output = tmp_path / 'out.jsonl'
+    iter_members = bulk_process.iter_members
+
+    def crash_after_four(source, max_bytes):
+        members = iter_members(source, max_bytes)
+        for _ in range(4):
+            yield next(members)
+        raise RuntimeError('killed')
+
+    monkeypatch.setattr(bulk_process, 'iter_members', crash_after_four)
+    with pytest.raises(RuntimeError):
+        bulk_process.run(str(tmp_path), str(output), processor=processor, checkpoint_every=2)
+    assert json.loads((tmp_path / 'out.jsonl.checkpoint').read_text())['done'] == 2
+
+    monkeypatch.setattr(bulk_process, 'iter_members', iter_members)
+    counts = bulk_process.run(str(tmp_path), str(output), processor=processor, checkpoint_every=2)
+
+    assert counts['resumed_at'] == 2 and counts['done'] == 5
+    assert [item['file'] for item in read_jsonl(output)] == NAMES
+    assert not (tmp_path / 'out.jsonl.checkpoint').exists()
+
+
+def test_checkpoint_for_another_source_is_refused(tmp_path, processor):
+    output = tmp_path / 'out.jsonl'
+    output.write_text('')
+    bulk_process.save_checkpoint(f'{output}.checkpoint', {'source': '/elsewhere', 'format': 'jsonl',
+                                                          'done': 1, 'succeeded': 1, 'failed': 0,
+                                                          'output_bytes': 0})
+
+    with pytest.raises(ValueError, match='delete it to start over'):
+        bulk_process.run(str(tmp_path), str(output), processor=processor)
+
+
+def test_zip_member_with_a_wrong_declared_size_is_an_error(tmp_path, pdfs, processor):
+    with zipfile.ZipFile(tmp_path / 'receipts.zip', 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('lying.pdf', make_pdf([['Amount RM 9.00', 'x' * 5000]]))
+        archive.writestr('r1.pdf', pdfs['r1.pdf'])
+    # Understate lying.pdf's size in its local and central directory headers
+    data = bytearray((tmp_path / 'receipts.zip').read_bytes())
+    for signature, offset in ((b'PK\x03\x04', 22), (b'PK\x01\x02', 24)):
+        start = data.find(signature) + offset
+        data[start:start + 4] = (100).to_bytes(4, 'little')
+    (tmp_path / 'receipts.zip').write_bytes(bytes(data))
+
+    output = tmp_path / 'out.jsonl'
+    counts = bulk_process.run(str(tmp_path / 'receipts.zip'), str(output), processor=processor, max_bytes=1000)
+
+    items = read_jsonl(output)
+    assert [(item['file'], item['success']) for item in items] == [('lying.pdf', False), ('r1.pdf', True)]
+    assert 'Damaged archive member' in items[0]['error']
+    assert counts['failed'] == 1
+
+
+def test_checkpoint_without_its_output_starts_over(tmp_path, pdfs, processor):
+    folder = tmp_path / 'receipts'
+    folder.mkdir()
+    for name, pdf in pdfs.items():
+        (folder / name).write_bytes(pdf)
+    output = tmp_path / 'out.jsonl'
+    bulk_process.save_checkpoint(f'{output}.checkpoint', {'source': str(folder), 'format': 'jsonl',
+                                                          'done': 3, 'succeeded': 3, 'failed': 0,
+                                                          'output_bytes': 300})
+
+    counts = bulk_process.run(str(folder), str(output), processor=processor)
+
+    assert counts == {'done': 5, 'succeeded': 5, 'failed': 0, 'resumed_at': 0}
+    assert [item['file'] for item in read_jsonl(output)] == NAMES
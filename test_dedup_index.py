@@ -0,0 +1,91 @@
+"""
+Tests for the duplicate receipt index
+"""
+import json
+from io import BytesIO
+
+import pytest
+
+import app as api
+from batch_processor import BatchProcessor
+from conftest import make_pdf
+from dedup_index import DedupIndex, main, normalize_date, receipt_key
+from job_queue import JobStore, JobWorker
+from result_cache import ResultCache
+
+RECEIPT = {'bank': 'Maybank', 'transaction_id': 'M2U_20251203_0937', 'amount': 100.0, 'date': '03/12/2025'}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return DedupIndex(str(tmp_path / 'dedup.sqlite3'))
+
+
+def test_key_normalizes_id_amount_and_date():
+    assert receipt_key(RECEIPT) == ('Maybank', 'M2U_20251203_0937', 10000, '2025-12-03')
+    # Re-exports of the same transfer format things differently
+    assert receipt_key({**RECEIPT, 'transaction_id': 'm2u_20251203_0937 ', 'amount': '100.00',
+                        'date': '3 Dec 2025'}) == receipt_key(RECEIPT)
+    assert normalize_date('2025-12-03') == normalize_date('03-Dec-2025') == '2025-12-03'
+    assert normalize_date('Someday') == 'someday'
+    assert receipt_key({**RECEIPT, 'transaction_id': None}) is None
+    assert receipt_key({**RECEIPT, 'amount': None}) is None
+
+
+def test_check_records_first_submission_and_reports_later_ones(index):
+    assert index.check(RECEIPT, 'req-1') is None
+    assert index.check({**RECEIPT, 'date': '2025-12-03'}, 'req-2') == 'req-1'
+    # Same submission checked again (requeued job) is not a duplicate of itself
+    assert index.check(RECEIPT, 'req-1') is None
+    assert index.check({**RECEIPT, 'amount': 100.01}, 'req-3') is None
+    assert index.lookup({**RECEIPT, 'amount': 100.01}) == 'req-3'
+    assert index.lookup({**RECEIPT, 'bank': 'CIMB'}) is None
+
+
+def test_bulk_import_command(index, tmp_path, monkeypatch, capsys):
+    history = tmp_path / 'history.jsonl'
+    history.write_text('\n'.join(json.dumps(record) for record in [
+        {**RECEIPT, 'id': 'ticket-7'},
+        {**RECEIPT, 'id': 'ticket-8'},
+        {'bank': 'CIMB', 'transaction_id': None, 'amount': 5},
+    ]) + '\n')
+    csv_file = tmp_path / 'history.csv'
+    csv_file.write_text('bank,transaction_id,amount,date\nCIMB,CB-77,12.50,2025-01-02\n')
+
+    monkeypatch.setattr('sys.argv', ['dedup_index.py', 'import', str(history), str(csv_file), '--db', index.db_path])
+    assert main() == 0
+
+    assert '1 imported, 1 already indexed, 1 skipped' in capsys.readouterr().out
+    assert index.check(RECEIPT, 'req-1') == 'ticket-7'
+    assert index.lookup({'bank': 'CIMB', 'transaction_id': 'CB-77', 'amount': 12.5, 'date': '02/01/2025'}) == 'import:1'
+
+
+def test_duplicate_of_in_api_responses(index, receipt_pdf, monkeypatch, tmp_path):
+    processor = BatchProcessor(pool_size=1)
+    monkeypatch.setattr(api, 'batch_processor', processor)
+    monkeypatch.setattr(api, 'result_cache', ResultCache(max_entries=0))
+    monkeypatch.setattr(api, 'dedup_index', index)
+    client = api.app.test_client()
+    # Different bytes, same transfer
+    reexport = make_pdf([['Maybank2u', 'Reference ID: M2U_20251203_0937', 'Date 3 Dec 2025',
+                          'Amount', 'RM 100.00', 'Exported again']])
+
+    try:
+        first = client.post('/process-receipt', data={'file': (BytesIO(receipt_pdf), 'receipt.pdf')},
+                            content_type='multipart/form-data')
+        batch = client.post('/process-receipts/batch', content_type='multipart/form-data', data={
+            'files': [(BytesIO(reexport), 'again.pdf'), (BytesIO(b'%PDF broken'), 'broken.pdf')]
+        })
+
+        store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+        job_id = store.enqueue(payload=reexport)
+        assert JobWorker(store, processor, dedup=index).run_once()
+    finally:
+        processor.shutdown()
+
+    assert first.get_json()['duplicate_of'] is None
+    original = first.headers['X-Request-ID']
+    again, broken = batch.get_json()['results']
+    assert again['duplicate_of'] == original
+    assert 'duplicate_of' not in broken
+    assert store.get(job_id)['duplicate_of'] == original
@@ -0,0 +1,140 @@
+"""
+Tests for streaming, size-limited URL downloads
+"""
+import os
+from io import BytesIO
+
+import pytest
+
+import app as api
+from downloader import DownloadCache, DownloadError, download_pdf
+from result_cache import ResultCache
+
+
+def test_small_download_stays_in_memory(http_server):
+    http_server.files['/small.pdf'] = b'%PDF' + b'x' * 1000
+
+    with download_pdf(http_server.url + '/small.pdf', spool_max_memory=4096) as f:
+        assert not f._rolled
+        assert f.read() == http_server.files['/small.pdf']
+
+
+def test_large_download_spills_to_disk(http_server):
+    http_server.files['/chunked/big.pdf'] = b'%PDF' + b'x' * 100_000
+
+    with download_pdf(http_server.url + '/chunked/big.pdf', spool_max_memory=4096) as f:
+        assert f._rolled
+        assert f.read() == http_server.files['/chunked/big.pdf']
+
+
+@pytest.mark.parametrize('path', ['/declared.pdf', '/chunked/undeclared.pdf'])
+def test_oversized_download_is_rejected(http_server, path):
+    http_server.files[path] = b'x' * 50_000
+
+    with pytest.raises(DownloadError) as excinfo:
+        download_pdf(http_server.url + path, max_bytes=10_000)
+    assert excinfo.value.status_code == 413
+
+
+def test_missing_file_is_a_client_error(http_server):
+    with pytest.raises(DownloadError) as excinfo:
+        download_pdf(http_server.url + '/missing.pdf')
+    assert excinfo.value.status_code == 400
+    assert 'status 404' in str(excinfo.value)
+
+
+def test_process_receipt_from_url(http_server, receipt_pdf, monkeypatch):
+    monkeypatch.setattr(api, 'result_cache', ResultCache(max_entries=8))
+    http_server.files['/receipt.pdf'] = receipt_pdf
+
+    response = api.app.test_client().post('/process-receipt', data={'file_url': http_server.url + '/receipt.pdf'})
+
+    assert response.status_code == 200
+    assert response.get_json()['data']['amount'] == 100.0
+
+
+def test_upload_over_max_content_length_is_rejected(monkeypatch):
+    monkeypatch.setitem(api.app.config, 'MAX_CONTENT_LENGTH', 1000)
+
+    response = api.app.test_client().post('/process-receipt', data={'file': (BytesIO(b'x' * 5000), 'big.pdf')},
+                                          content_type='multipart/form-data')
+
+    assert response.status_code == 413
+    assert response.get_json()['success'] is False
+
+
+def test_repeat_download_revalidates_and_serves_304_from_cache(http_server, tmp_path):
+    cache = DownloadCache(str(tmp_path), max_entries=4)
+    http_server.files['/cdn/receipt.pdf'] = b'%PDF-1.4 receipt'
+    url = http_server.url + '/cdn/receipt.pdf'
+
+    with download_pdf(url, cache=cache) as first:
+        assert first.read() == b'%PDF-1.4 receipt'
+    with download_pdf(url, cache=cache) as second:
+        assert second.read() == b'%PDF-1.4 receipt'
+
+    assert 'If-None-Match' not in http_server.requests[0]
+    assert http_server.requests[1]['If-None-Match'] == cache.validators(url)['etag']
+    assert http_server.requests[1]['If-Modified-Since'] == 'Wed, 03 Dec 2025 09:37:45 GMT'
+
+
+def test_changed_file_is_downloaded_again(http_server, tmp_path):
+    cache = DownloadCache(str(tmp_path), max_entries=4)
+    url = http_server.url + '/cdn/receipt.pdf'
+
+    http_server.files['/cdn/receipt.pdf'] = b'%PDF old'
+    download_pdf(url, cache=cache).close()
+    http_server.files['/cdn/receipt.pdf'] = b'%PDF new'
+
+    with download_pdf(url, cache=cache) as f:
+        assert f.read() == b'%PDF new'
+
+
+def test_cache_evicts_oldest_entries(http_server, tmp_path):
+    cache = DownloadCache(str(tmp_path), max_entries=2)
+    for name in ('a', 'b', 'c'):
+        http_server.files[f'/cdn/{name}.pdf'] = name.encode() * 10
+        download_pdf(f'{http_server.url}/cdn/{name}.pdf', cache=cache).close()
+
+    assert len([p for p in os.listdir(tmp_path) if p.endswith('.pdf')]) == 2
+
+
+def test_cache_is_bounded_by_total_bytes(http_server, tmp_path):
+    cache = DownloadCache(str(tmp_path), max_entries=10, max_bytes=2500)
+    for name in ('a', 'b', 'c'):
+        http_server.files[f'/cdn/{name}.pdf'] = name.encode() * 1000
+        download_pdf(f'{http_server.url}/cdn/{name}.pdf', cache=cache).close()
+
+    assert cache.validators(f'{http_server.url}/cdn/a.pdf') is None
+    assert cache.validators(f'{http_server.url}/cdn/c.pdf') is not None
+    assert sum(os.path.getsize(tmp_path / p) for p in os.listdir(tmp_path) if p.endswith('.pdf')) <= 2500
+
+
+def test_revalidatable_download_is_served_from_the_spool(http_server, tmp_path):
+    cache = DownloadCache(str(tmp_path), max_entries=4, max_bytes=1000)
+    http_server.files['/cdn/small.pdf'] = b'%PDF' + b'x' * 100
+    http_server.files['/cdn/big.pdf'] = b'%PDF' + b'x' * 5000
+
+    with download_pdf(http_server.url + '/cdn/small.pdf', spool_max_memory=4096, cache=cache) as f:
+        assert not f._rolled
+        assert f.read() == http_server.files['/cdn/small.pdf']
+    with download_pdf(http_server.url + '/cdn/big.pdf', spool_max_memory=4096, cache=cache) as f:
+        assert f.read() == http_server.files['/cdn/big.pdf']
+
+    assert cache.validators(http_server.url + '/cdn/small.pdf') is not None
+    # Larger than the whole cache, so it is not kept
+    assert cache.validators(http_server.url + '/cdn/big.pdf') is None
+
+
+def test_session_reuses_connections_and_retries_transient_errors(http_server, tmp_path):
+    cache = DownloadCache(None)
+    http_server.files['/a.pdf'] = b'%PDF a'
+    http_server.files['/b.pdf'] = b'%PDF b'
+    http_server.fail_first['/b.pdf'] = 1
+
+    for path in ('/a.pdf', '/b.pdf', '/a.pdf'):
+        download_pdf(http_server.url + path, cache=cache).close()
+
+    # One retried 503 plus three successful fetches, all over one keep-alive connection
+    assert len(http_server.requests) == 4
+    assert len(http_server.client_ports) == 1
@@ -0,0 +1,94 @@
+"""
+Tests for the SQLite-backed job queue
+"""
+import os
+import runpy
+import time
+from io import BytesIO
+
+import pytest
+
+import app as api
+from batch_processor import BatchProcessor
+from job_queue import DONE, FAILED, QUEUED, RUNNING, JobStore, JobWorker
+from result_cache import ResultCache
+
+
+@pytest.fixture
+def processor():
+    processor = BatchProcessor(pool_size=1)
+    yield processor
+    processor.shutdown()
+
+
+def test_claim_is_fifo_and_exclusive(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    first = store.enqueue(payload=b'one')
+    second = store.enqueue(payload=b'two')
+
+    assert store.claim_next()['id'] == first
+    assert store.claim_next()['id'] == second
+    assert store.claim_next() is None
+    assert store.get(first)['status'] == RUNNING
+
+
+def test_queue_survives_reopen_and_requeues_stale_jobs(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    job_id = JobStore(db_path).enqueue(payload=b'%PDF')
+    JobStore(db_path).claim_next()
+
+    reopened = JobStore(db_path)
+    assert reopened.requeue_stale(older_than=-1) == 1
+    assert reopened.get(job_id)['status'] == QUEUED
+
+
+def test_worker_stores_result_and_error(tmp_path, processor, receipt_pdf):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    good = store.enqueue(payload=receipt_pdf)
+    bad = store.enqueue(payload=b'not a pdf')
+    worker = JobWorker(store, processor)
+
+    assert worker.run_once() and worker.run_once()
+    assert not worker.run_once()
+
+    assert store.get(good)['status'] == DONE
+    assert store.get(good)['data']['amount'] == 100.0
+    assert store.get(bad)['status'] == FAILED
+    assert 'Not a PDF file' in store.get(bad)['error']
+
+
+def test_jobs_endpoints(tmp_path, processor, receipt_pdf, monkeypatch):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    worker = JobWorker(store, processor, poll_interval=0.05)
+    monkeypatch.setattr(api, 'job_store', store)
+    monkeypatch.setattr(api, 'job_worker', worker)
+    monkeypatch.setattr(api, 'result_cache', ResultCache(max_entries=8))
+    client = api.app.test_client()
+
+    try:
+        created = client.post('/jobs', data={'file': (BytesIO(receipt_pdf), 'receipt.pdf')},
+                              content_type='multipart/form-data')
+        assert created.status_code == 202
+        job_id = created.get_json()['job_id']
+
+        deadline = time.time() + 30
+        job = client.get(f'/jobs/{job_id}').get_json()
+        while job['status'] in (QUEUED, RUNNING) and time.time() < deadline:
+            time.sleep(0.05)
+            job = client.get(f'/jobs/{job_id}').get_json()
+    finally:
+        worker.stop()
+
+    assert job['status'] == DONE
+    assert job['data']['transaction_id'] == 'M2U_20251203_0937'
+    assert client.get('/jobs/unknown').status_code == 404
+
+
+def test_gunicorn_workers_start_the_job_worker_before_any_request(monkeypatch):
+    started = []
+    monkeypatch.setattr(api.job_worker, 'start', lambda: started.append(True))
+    hooks = runpy.run_path(os.path.join(os.path.dirname(__file__), 'gunicorn.conf.py'))
+
+    hooks['post_worker_init'](worker=None)
+
+    assert started == [True]
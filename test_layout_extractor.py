@@ -0,0 +1,114 @@
+"""
+Tests for layout_extractor (EXTRACTION_MODE=layout)
+"""
+from io import BytesIO
+
+import batch_processor
+import receipt_parser
+from conftest import make_pdf
+from layout_extractor import PageLayout, parse_layout, read_field
+from receipt_parser import ANY_BANK
+
+CIMB_RECEIPT = [
+    'CIMB Clicks',
+    'Transfer Successful',
+    'Reference ID: 1234567890',
+    'Transaction Date 2025-12-03',
+    'Amount',
+    'RM 1,250.50',
+    'To Account',
+    '8000 1234 5678',
+]
+
+
+def word(text, x0, top, width=None):
+    return {'text': text, 'x0': x0, 'x1': x0 + (width or len(text) * 6), 'top': top, 'bottom': top + 10}
+
+
+def test_page_layout_reads_values_right_of_and_below_labels():
+    layout = PageLayout([
+        word('Amount', 50, 100), word('Date:', 300, 100.5),
+        word('RM', 50, 114), word('12.00', 68, 114), word('03/12/2025', 300, 114),
+        word('Reference', 50, 140), word('No:', 110, 140), word('AB-1234', 140, 140),
+    ])
+
+    assert layout.text == 'Amount Date:\nRM 12.00 03/12/2025\nReference No: AB-1234\n'
+    [hit] = layout.find_label(('reference', 'no'))
+    assert layout.neighbour(hit, 'right') == 'AB-1234'
+    # Only the words under the label, not the next column's
+    [hit] = layout.find_label(('amount',))
+    assert layout.neighbour(hit, 'below') == 'RM 12.00'
+    [hit] = layout.find_label(('date',))
+    assert layout.neighbour(hit, 'below') == '03/12/2025'
+
+    assert read_field(layout, 'amount', ANY_BANK.layout['amount']) == 12.0
+    assert read_field(layout, 'transaction_id', ANY_BANK.layout['transaction_id']) == 'AB-1234'
+
+
+def test_parse_layout_reads_labelled_fields():
+    result = parse_layout(BytesIO(make_pdf([CIMB_RECEIPT])))
+
+    assert result['bank'] == 'CIMB'
+    assert result['transaction_id'] == '1234567890'
+    assert result['date'] == '2025-12-03'
+    assert result['amount'] == 1250.5
+    assert result['receiver_account'] == '800012345678'
+    assert result['status'] == 'successful'
+
+
+def test_bank_layout_rules_and_text_fallback():
+    result = parse_layout(BytesIO(make_pdf([[
+        'Maybank2u', 'M2U_20251203_0937', 'Date 03/12/2025 09:37:45', 'Total: RM10.00',
+        'Beneficiary account number', '5641 9177 5091',
+    ]])))
+
+    # No label next to the ID: found by the Maybank profile's patterns instead
+    assert result['transaction_id'] == 'M2U_20251203_0937'
+    assert result['time'] == '09:37:45'
+    assert result['amount'] == 10.0
+    assert result['receiver_account'] == '564191775091'
+
+
+def test_parse_layout_stops_after_the_page_with_all_fields():
+    pages = [CIMB_RECEIPT] + [[f'Statement page {n}'] for n in range(2, 6)]
+    result = parse_layout(BytesIO(make_pdf(pages)))
+
+    assert 'Statement page' not in result['raw_text']
+
+
+def test_parse_layout_searches_each_page_once(monkeypatch):
+    searched = []
+
+    def counting(finder):
+        def count(text, profile):
+            searched.append(len(text))
+            return finder(text, profile)
+        return count
+
+    monkeypatch.setattr(receipt_parser, 'REQUIRED_FIELDS',
+                        [(field, counting(finder)) for field, finder in receipt_parser.REQUIRED_FIELDS])
+    # No transaction ID anywhere, so every page is read
+    pages = [[f'Statement page {n}', f'RM {n}.00 on 03/12/2025', 'To 1234567890'] + ['Opening balance'] * 20
+             for n in range(40)]
+
+    result = parse_layout(BytesIO(make_pdf(pages)))
+
+    assert result['transaction_id'] is None
+    # Searching the whole prefix again for every page would be ~20 times the text
+    assert sum(searched) <= 2 * sum(len('\n'.join(lines)) + 1 for lines in pages)
+
+
+def test_parse_layout_returns_none_without_usable_words():
+    assert parse_layout(BytesIO(make_pdf([[]]))) is None
+    assert parse_layout(BytesIO(b'%PDF-1.4 garbage')) is None
+
+
+def test_layout_mode_falls_back_to_text_backends(monkeypatch):
+    monkeypatch.setattr(batch_processor, 'EXTRACTION_MODE', 'layout')
+    calls = []
+    monkeypatch.setattr(batch_processor, 'parse_layout', lambda file, explain=False: calls.append(file) and None)
+
+    outcome = batch_processor.process_pdf_bytes(make_pdf([CIMB_RECEIPT]))
+
+    assert len(calls) == 1
+    assert outcome['success'] and outcome['data']['amount'] == 1250.5
@@ -0,0 +1,75 @@
+"""
+Tests for the /metrics endpoint
+"""
+import multiprocessing
+from io import BytesIO
+
+import pytest
+from prometheus_client.parser import text_string_to_metric_families
+
+import app as api
+import metrics
+from batch_processor import BatchProcessor
+from result_cache import ResultCache
+
+
+def scrape(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    samples = {}
+    for family in text_string_to_metric_families(response.get_data(as_text=True)):
+        for sample in family.samples:
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return samples
+
+
+def value(samples, name, **labels):
+    return samples.get((name, tuple(sorted(labels.items()))), 0)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    processor = BatchProcessor(pool_size=1)
+    monkeypatch.setattr(api, 'batch_processor', processor)
+    monkeypatch.setattr(api, 'result_cache', ResultCache(max_entries=8))
+    yield api.app.test_client()
+    processor.shutdown()
+
+
+def test_pipeline_stages_fields_and_errors_are_counted(client, receipt_pdf):
+    before = scrape(client)
+
+    client.post('/process-receipt', data={'file': (BytesIO(receipt_pdf), 'receipt.pdf')},
+                content_type='multipart/form-data')
+    client.post('/process-receipt', data={'file': (BytesIO(b'%PDF-1.4 garbage'), 'broken.pdf')},
+                content_type='multipart/form-data')
+    client.post('/process-receipt', data={})
+    after = scrape(client)
+
+    def delta(name, **labels):
+        return value(after, name, **labels) - value(before, name, **labels)
+
+    assert delta('receipt_requests_total', endpoint='/process-receipt', status='200') == 1
+    assert delta('receipt_requests_total', endpoint='/process-receipt', status='500') == 1
+    assert delta('receipt_errors_total', type='extraction') == 1
+    assert delta('receipt_errors_total', type='bad_request') == 1
+    assert delta('receipt_bytes_processed_total') == len(receipt_pdf) + len(b'%PDF-1.4 garbage')
+    assert delta('receipt_pages_total', backend='raw') == 1
+    # Samples recorded inside the extraction worker reach the web process
+    assert delta('receipt_stage_seconds_count', stage='extract', backend='raw') >= 1
+    assert delta('receipt_stage_seconds_count', stage='parse', backend='') == 1
+    assert delta('receipt_stage_seconds_count', stage='serialize', backend='') == 1
+    assert delta('receipt_fields_total', field='amount', found='true') == 1
+    assert delta('receipt_fields_total', field='sender_account', found='false') == 1
+
+
+def count_in_other_process():
+    metrics.count_error('from_other_worker')
+
+
+def test_samples_from_other_processes_are_summed(client):
+    process = multiprocessing.get_context('fork').Process(target=count_in_other_process)
+    process.start()
+    process.join()
+
+    assert value(scrape(client), 'receipt_errors_total', type='from_other_worker') == 1
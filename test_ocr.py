@@ -0,0 +1,184 @@
+"""
+Tests for the OCR fallback for scanned PDFs (ocr.py)
+
+Tesseract itself is replaced by a small script that prints a known receipt
+text and counts its runs, so these tests don't need it installed.
+"""
+import sys
+from contextlib import contextmanager
+from io import BytesIO
+
+import PyPDF2
+import pytest
+from PIL import Image, ImageDraw
+
+import ocr
+import receipt_splitter
+from admission import AdmissionGate
+from batch_processor import BatchProcessor, process_pdf_bytes
+from conftest import make_pdf
+from result_cache import ResultCache
+from worker_pool import SupervisedPool
+
+RECEIPT_TEXT = 'Maybank2u\nTransfer Successful\nReference: SC1001\nAmount RM 42.50\n'
+
+
+def scanned_pdf(lines, resolution=200):
+    """An image-only PDF: the text is drawn into a picture, with no text layer"""
+    image = Image.new('L', (1000, 700), 255)
+    draw = ImageDraw.Draw(image)
+    for number, line in enumerate(lines):
+        draw.text((40, 40 + number * 30), line, fill=0)
+    pdf = BytesIO()
+    image.save(pdf, 'PDF', resolution=resolution)
+    return pdf.getvalue()
+
+
+@pytest.fixture
+def fake_tesseract(monkeypatch, tmp_path):
+    """Point ocr.py at a fake tesseract; returns a function giving its run count"""
+    runs = tmp_path / 'runs'
+    script = tmp_path / 'tesseract'
+    script.write_text(
+        f'#!{sys.executable}\n'
+        'import sys\n'
+        'sys.stdin.buffer.read()\n'
+        f'with open({str(runs)!r}, "a") as f:\n'
+        '    f.write("x")\n'
+        f'sys.stdout.write({RECEIPT_TEXT!r})\n'
+    )
+    script.chmod(0o755)
+    # Patched before any pool forks, so the workers see it too
+    monkeypatch.setattr(ocr, 'TESSERACT_CMD', str(script))
+    monkeypatch.setattr(ocr, 'OCR_ENABLED', True)
+    monkeypatch.setattr(ocr, '_cache', ResultCache(max_entries=8, disk_dir=str(tmp_path / 'cache')))
+    return lambda: len(runs.read_text()) if runs.exists() else 0
+
+
+@pytest.fixture
+def processor():
+    # Forked rather than started from the fork server, so workers see fake_tesseract's patches
+    processor = BatchProcessor(pool_size=1, ocr_pool=SupervisedPool(1, timeout=30, start_method='fork'),
+                               start_method='fork')
+    yield processor
+    processor.shutdown()
+
+
+def test_scanned_pdf_is_handed_to_the_ocr_pool(fake_tesseract, processor):
+    outcome = processor.call(process_pdf_bytes, scanned_pdf(['scan']))
+
+    assert outcome['success'] is True and 'ocr_job' not in outcome
+    assert outcome['data']['transaction_id'] == 'SC1001'
+    assert fake_tesseract() == 1
+    assert processor.stats()['ocr']['size'] == 1
+
+
+def mixed_pdf(text_lines):
+    """A text page followed by a scanned page"""
+    writer = PyPDF2.PdfWriter()
+    for pdf in (make_pdf([text_lines]), scanned_pdf(['scan'])):
+        for page in PyPDF2.PdfReader(BytesIO(pdf)).pages:
+            writer.add_page(page)
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def test_scanned_pages_of_a_mixed_pdf_are_ocred_for_missing_fields(fake_tesseract, processor):
+    outcome = processor.call(process_pdf_bytes, mixed_pdf(['Maybank2u', 'Amount RM 10.00', 'Date 03/12/2025',
+                                                           'To Account 1234567890']))
+
+    assert outcome['success'] is True and 'ocr_job' not in outcome
+    assert outcome['data']['transaction_id'] == 'SC1001'
+    assert outcome['data'].amount_cents == 1000
+    assert fake_tesseract() == 1
+
+
+def test_mixed_pdf_with_every_field_in_its_text_skips_ocr(fake_tesseract, processor):
+    outcome = processor.call(process_pdf_bytes, mixed_pdf(['Maybank2u', 'Reference: AB1234', 'Amount RM 10.00',
+                                                           'Date 03/12/2025', 'To Account 1234567890']))
+
+    assert outcome['data']['transaction_id'] == 'AB1234'
+    assert fake_tesseract() == 0
+
+
+def test_ocr_runs_after_the_extraction_slot_is_released(fake_tesseract, processor, monkeypatch):
+    gate, ocr_gate = AdmissionGate(1, 0, 10), AdmissionGate(1, 0, 60)
+    in_flight = []
+    ocr_slot = ocr_gate.slot
+
+    @contextmanager
+    def recording_slot(weight=1):
+        in_flight.append(gate.in_flight)
+        with ocr_slot(weight):
+            yield
+
+    monkeypatch.setattr(ocr_gate, 'slot', recording_slot)
+    outcome = processor.call(process_pdf_bytes, scanned_pdf(['scan']), gate, ocr_gate)
+
+    assert outcome['data']['transaction_id'] == 'SC1001'
+    # The extraction slot was free again while OCR ran, and OCR's time went into its own gate's average
+    assert in_flight == [0]
+    assert gate.stats()['in_flight'] == ocr_gate.stats()['in_flight'] == 0
+    assert ocr_gate.average_seconds != 1.0
+
+
+def test_the_same_page_image_is_ocred_once(fake_tesseract, processor):
+    pdf = scanned_pdf(['scan'])
+    first = processor.call(process_pdf_bytes, pdf)
+    second = processor.call(process_pdf_bytes, pdf)
+
+    assert first['data']['transaction_id'] == second['data']['transaction_id'] == 'SC1001'
+    assert fake_tesseract() == 1
+
+
+def test_ocr_pages_per_pdf_are_capped(fake_tesseract, monkeypatch):
+    image_pages = [Image.new('L', (200, 200), shade) for shade in (250, 240, 230)]
+    pdf = BytesIO()
+    image_pages[0].save(pdf, 'PDF', save_all=True, append_images=image_pages[1:])
+
+    pages = list(ocr.iter_ocr_pages(pdf.getvalue(), max_ocr_pages=2))
+
+    assert pages == [RECEIPT_TEXT + '\n'] * 2
+    assert fake_tesseract() == 2
+
+
+def test_text_pages_after_the_ocr_page_limit_are_still_read(fake_tesseract):
+    writer = PyPDF2.PdfWriter()
+    for pdf in [scanned_pdf([f'scan {n}']) for n in range(3)] + [make_pdf([['Reference: TX9001']])]:
+        for page in PyPDF2.PdfReader(BytesIO(pdf)).pages:
+            writer.add_page(page)
+    pdf = BytesIO()
+    writer.write(pdf)
+
+    pages = list(ocr.iter_ocr_pages(pdf.getvalue(), max_ocr_pages=2))
+
+    assert pages[:2] == [RECEIPT_TEXT + '\n'] * 2
+    assert len(pages) == 3 and 'TX9001' in pages[2]
+    assert fake_tesseract() == 2
+
+
+def test_split_requests_fall_back_to_ocr(fake_tesseract, processor):
+    outcome = receipt_splitter.process_pdf_receipts(processor, scanned_pdf(['scan']))
+
+    assert outcome['success'] is True
+    assert [receipt['transaction_id'] for receipt in outcome['receipts']] == ['SC1001']
+
+
+def test_pages_render_at_their_scan_resolution():
+    import pypdfium2
+
+    for resolution, expected in ((200, 200), (72, ocr.MIN_DPI), (600, ocr.MAX_DPI)):
+        pdf = pypdfium2.PdfDocument(scanned_pdf(['scan'], resolution))
+        try:
+            assert ocr.page_dpi(pdf[0]) == pytest.approx(expected)
+        finally:
+            pdf.close()
+
+
+def test_scanned_pdf_fails_as_before_without_ocr(monkeypatch):
+    monkeypatch.setattr(ocr, 'OCR_ENABLED', False)
+    outcome = process_pdf_bytes(scanned_pdf(['scan']))
+
+    assert outcome == {'success': False, 'error': outcome['error']}
+    assert 'Could not extract text from PDF' in outcome['error']
@@ -0,0 +1,116 @@
+"""
+Tests for pdf_processor
+"""
+import random
+from io import BytesIO
+
+import pytest
+
+import pdf_processor
+from conftest import make_pdf
+from pdf_processor import clean_duplicate_chars, extract_pdf_data, iter_pdf_pages
+
+
+def reference_clean(text):
+    """The original character-by-character implementation"""
+    if not text:
+        return text
+    result = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if i + 3 < len(text) and all(text[i+j] == char for j in range(4)):
+            result.append(char)
+            i += 4
+        else:
+            result.append(char)
+            i += 1
+    return ''.join(result)
+
+
+def test_clean_duplicate_chars_examples():
+    assert clean_duplicate_chars('RRRRMMMM    11110000....00000000') == 'RM 10.00'
+    assert clean_duplicate_chars('Hello world') == 'Hello world'
+    assert clean_duplicate_chars('aaaaa\n\n\n\n') == 'aa\n'
+    assert clean_duplicate_chars('') == ''
+    assert clean_duplicate_chars(None) is None
+
+
+def test_clean_duplicate_chars_matches_reference_implementation():
+    rng = random.Random(1234)
+    for _ in range(2000):
+        # Small alphabet and random run lengths hit all the edge cases (runs of 3, 5, 7, 8...)
+        text = ''.join(rng.choice('ab1.\n ') * rng.randint(1, 9) for _ in range(rng.randint(0, 12)))
+        assert clean_duplicate_chars(text) == reference_clean(text), repr(text)
+
+    for _ in range(500):
+        # Mix of fully 4x-duplicated lines (the real artifact) and plain lines
+        lines = [''.join(rng.choice('RM10.') * (4 if dup else 1) for _ in range(rng.randint(0, 6)))
+                 for dup in (rng.random() < 0.5 for _ in range(rng.randint(1, 5)))]
+        text = '\n'.join(lines)
+        assert clean_duplicate_chars(text) == reference_clean(text), repr(text)
+
+
+def test_extract_cleans_each_page():
+    duplicated = ''.join(c * 4 for c in 'RM 100.00')
+    pdf = make_pdf([['Maybank', 'Ref 000123'], [duplicated]])
+
+    text = extract_pdf_data(BytesIO(pdf))
+
+    assert text == 'Maybank\nRef 000123\nRM 100.00\n'
+
+
+def test_iter_pdf_pages_is_lazy_and_honours_max_pages():
+    pdf = make_pdf([[f'Page {n}'] for n in range(1, 6)])
+
+    pages = iter_pdf_pages(BytesIO(pdf))
+    assert next(pages) == 'Page 1\n'
+    pages.close()
+
+    assert list(iter_pdf_pages(BytesIO(pdf), max_pages=2)) == ['Page 1\n', 'Page 2\n']
+    assert extract_pdf_data(BytesIO(pdf), max_pages=3) == 'Page 1\nPage 2\nPage 3\n'
+
+
+def test_iter_pdf_pages_raises_when_no_text():
+    with pytest.raises(Exception, match='Could not extract text'):
+        list(iter_pdf_pages(BytesIO(make_pdf([[]]))))
+
+
+def test_backend_order_and_stats(monkeypatch):
+    monkeypatch.setattr(pdf_processor, '_backend_stats', {})
+    pdf = make_pdf([['Maybank', 'RM 100.00']])
+
+    assert extract_pdf_data(BytesIO(pdf), backends=['raw']) == 'Maybank\nRM 100.00\n'
+
+    stats = pdf_processor.backend_stats()
+    assert list(stats) == ['raw']
+    assert stats['raw']['succeeded'] == 1
+    assert stats['raw']['pages'] == 1
+
+
+def test_unparseable_probe_falls_through_to_next_backend(monkeypatch):
+    monkeypatch.setattr(pdf_processor, '_backend_stats', {})
+    monkeypatch.setitem(pdf_processor.EXTRACTION_BACKENDS, 'garbage',
+                        lambda file, start, max_pages: iter([(0, '\x01\x02\x03 ###')]))
+    pdf = make_pdf([['CIMB Clicks']])
+
+    text = extract_pdf_data(BytesIO(pdf), backends=['garbage', 'raw'])
+
+    assert text == 'CIMB Clicks\n'
+    stats = pdf_processor.backend_stats()
+    assert stats['garbage']['rejected'] == 1
+    assert stats['raw']['succeeded'] == 1
+
+
+def test_unsupported_pdf_falls_back_to_full_parser(monkeypatch):
+    monkeypatch.setattr(pdf_processor, '_backend_stats', {})
+    pdf = make_pdf([['Public Bank']]).replace(b'/Type /Font', b'/Type /Font /Differences [1 /a]')
+
+    assert extract_pdf_data(BytesIO(pdf), backends=['raw', 'pypdf2']).strip() == 'Public Bank'
+    assert pdf_processor.backend_stats()['raw']['failed'] == 1
+
+
+def test_looks_parseable():
+    assert pdf_processor.looks_parseable('Transfer RM 100.00')
+    assert not pdf_processor.looks_parseable('   ')
+    assert not pdf_processor.looks_parseable('\x00\x01\x02\x03\x04 abc')
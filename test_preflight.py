@@ -0,0 +1,163 @@
+"""
+Tests for the pre-extraction PDF checks and structural fingerprint (preflight.py)
+"""
+import zlib
+from io import BytesIO
+
+import PyPDF2
+import pytest
+
+import app as api
+import batch_processor
+import pdf_processor
+import preflight
+from batch_processor import process_pdf_bytes
+from conftest import make_pdf
+from preflight import PreflightError, inspect_pdf
+from result_cache import ResultCache
+
+
+def xref_stream_pdf(page_count):
+    """PDF 1.5 layout: catalog and page tree in an object stream, indexed by a predicted xref stream"""
+    out = bytearray(b'%PDF-1.5\n')
+    kids = ' '.join(f'{n} 0 R' for n in range(3, 3 + page_count))
+    packed = [b'<< /Type /Catalog /Pages 2 0 R >>', f'<< /Type /Pages /Kids [{kids}] /Count {page_count} >>'.encode()]
+    offsets = {}
+    for n in range(3, 3 + page_count):
+        offsets[n] = len(out)
+        out += f'{n} 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>\nendobj\n'.encode()
+
+    header = b'1 0 2 %d ' % (len(packed[0]) + 1)
+    stream = zlib.compress(header + packed[0] + b' ' + packed[1])
+    objstm = 3 + page_count
+    offsets[objstm] = len(out)
+    out += (b'%d 0 obj\n<< /Type /ObjStm /N 2 /First %d /Filter /FlateDecode /Length %d >>\nstream\n'
+            % (objstm, len(header), len(stream)) + stream + b'\nendstream\nendobj\n')
+
+    xref = objstm + 1
+    offsets[xref] = len(out)
+    rows = [(0, 0, 255), (2, objstm, 0), (2, objstm, 1)] + [(1, offsets[n], 0) for n in range(3, xref + 1)]
+    raw, previous = b'', bytes(4)
+    for kind, field, index in rows:
+        row = bytes([kind]) + field.to_bytes(2, 'big') + bytes([index])
+        raw += b'\x02' + bytes((a - b) & 0xFF for a, b in zip(row, previous))
+        previous = row
+    stream = zlib.compress(raw)
+    out += (b'%d 0 obj\n<< /Type /XRef /Size %d /W [1 2 1] /Root 1 0 R /Filter /FlateDecode '
+            b'/DecodeParms << /Columns 4 /Predictor 12 >> /Length %d >>\nstream\n' % (xref, xref + 1, len(stream))
+            + stream + b'\nendstream\nendobj\n')
+    out += b'startxref\n%d\n%%%%EOF\n' % offsets[xref]
+    return bytes(out)
+
+
+def encrypted_pdf(user_password):
+    writer = PyPDF2.PdfWriter()
+    for page in PyPDF2.PdfReader(BytesIO(make_pdf([['Secret receipt']]))).pages:
+        writer.add_page(page)
+    writer.encrypt(user_password, 'owner')
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def test_page_count_comes_from_the_page_tree():
+    pdf = BytesIO(make_pdf([['one'], ['two'], ['three']]))
+
+    info = inspect_pdf(pdf)
+
+    assert (info.version, info.page_count, info.encrypted) == ('1.4', 3, False)
+    assert pdf.tell() == 0
+
+
+def test_xref_streams_and_object_streams_are_followed():
+    assert inspect_pdf(BytesIO(xref_stream_pdf(4))).page_count == 4
+
+
+def test_damaged_xref_leaves_the_page_count_unknown():
+    pdf = make_pdf([['one']])
+    assert inspect_pdf(BytesIO(pdf[:len(pdf) // 2])).page_count is None
+
+
+@pytest.mark.parametrize('content, description', [
+    (b'<!DOCTYPE html><html><body>Not found</body></html>', 'an HTML page'),
+    (b'PK\x03\x04 zipped', 'a zip archive'),
+    (b'', 'empty file'),
+])
+def test_non_pdfs_are_named(content, description):
+    with pytest.raises(PreflightError) as excinfo:
+        inspect_pdf(BytesIO(content))
+    assert excinfo.value.status_code == 400
+    assert str(excinfo.value) == f'Not a PDF file: {description}'
+
+
+def test_password_protected_pdfs_are_refused():
+    with pytest.raises(PreflightError) as excinfo:
+        inspect_pdf(BytesIO(encrypted_pdf('secret')))
+    assert excinfo.value.status_code == 422
+
+    # Encrypted only against editing - it opens without a password, so it is read as usual
+    info = inspect_pdf(BytesIO(encrypted_pdf('')))
+    assert info.encrypted and info.page_count == 1
+
+
+def test_page_limit(monkeypatch):
+    monkeypatch.setattr(preflight, 'PREFLIGHT_MAX_PAGES', 2)
+
+    with pytest.raises(PreflightError) as excinfo:
+        inspect_pdf(BytesIO(make_pdf([['one'], ['two'], ['three']])))
+    assert excinfo.value.status_code == 413
+    assert '3 pages' in str(excinfo.value)
+
+
+def test_fingerprint_is_stable_and_follows_the_structure():
+    pdf = make_pdf([['one'], ['two']])
+
+    assert inspect_pdf(BytesIO(pdf)).fingerprint == inspect_pdf(BytesIO(pdf)).fingerprint
+    assert inspect_pdf(BytesIO(pdf)).fingerprint != inspect_pdf(BytesIO(make_pdf([['one']]))).fingerprint
+
+
+def test_worker_reports_non_pdfs_without_extracting():
+    assert process_pdf_bytes(b'<html>Login required</html>') == {
+        'success': False, 'error': 'Not a PDF file: an HTML page'}
+
+
+def test_endpoint_refuses_before_extraction(monkeypatch, receipt_pdf, http_server):
+    monkeypatch.setattr(api, 'result_cache', ResultCache(max_entries=8))
+    http_server.files['/expired.pdf'] = b'<!doctype html><title>Link expired</title>'
+    client = api.app.test_client()
+
+    refused = client.post('/process-receipt', data={'file_url': http_server.url + '/expired.pdf'})
+    locked = client.post('/process-receipt', data={'file': (BytesIO(encrypted_pdf('secret')), 'locked.pdf')},
+                         content_type='multipart/form-data')
+    accepted = client.post('/process-receipt', data={'file': (BytesIO(receipt_pdf), 'receipt.pdf')},
+                           content_type='multipart/form-data')
+
+    assert refused.status_code == 400
+    assert refused.get_json() == {'success': False, 'error': 'Not a PDF file: an HTML page'}
+    assert locked.status_code == 422
+    assert accepted.status_code == 200
+    assert accepted.get_json()['fingerprint'] == inspect_pdf(BytesIO(receipt_pdf)).fingerprint
+
+
+def test_endpoint_preflights_each_pdf_once(monkeypatch, receipt_pdf):
+    class InProcess:
+        """Runs jobs in this process, so the patched inspect_pdf below is the one they see"""
+        def call(self, func, arg, gate=None, ocr_gate=None):
+            return func(arg)
+
+    def inspected_again(file_obj):
+        raise AssertionError('inspect_pdf ran again after the request preflight')
+
+    monkeypatch.setattr(batch_processor, 'inspect_pdf', inspected_again)
+    monkeypatch.setattr(pdf_processor, 'inspect_pdf', inspected_again)
+    monkeypatch.setattr(api, 'batch_processor', InProcess())
+    monkeypatch.setattr(api, 'result_cache', ResultCache(max_entries=8))
+    client = api.app.test_client()
+
+    single = client.post('/process-receipt', data={'file': (BytesIO(receipt_pdf), 'receipt.pdf')},
+                         content_type='multipart/form-data')
+    split = client.post('/process-receipt', data={'file': (BytesIO(receipt_pdf), 'receipt.pdf'), 'split': 'true'},
+                        content_type='multipart/form-data')
+
+    assert single.status_code == 200 and single.get_json()['data']['transaction_id']
+    assert split.status_code == 200 and len(split.get_json()['receipts']) == 1
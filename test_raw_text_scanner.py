@@ -0,0 +1,44 @@
+"""
+Tests for the raw content-stream text scanner
+"""
+import zlib
+
+import pytest
+
+from conftest import make_pdf
+from raw_text_scanner import UnsupportedPDF, content_stream_text, iter_page_texts
+
+
+def test_text_operators():
+    content = (
+        b'BT /F1 12 Tf 72 720 Td (Amount:) Tj 60 0 Td (RM 5.00) Tj 0 -14 Td '
+        b'[(Tr) 20 (ans) -400 (fer)] TJ T* (Paren \\(1\\) and \\\\ slash) Tj '
+        b"(next line) ' <4D5942> Tj ET"
+    )
+    assert content_stream_text(content) == 'Amount: RM 5.00\nTrans fer\nParen (1) and \\ slash\nnext lineMYB'
+
+
+def test_pages_in_document_order():
+    pdf = make_pdf([['First page'], ['Second page'], ['Third page']])
+
+    assert list(iter_page_texts(pdf)) == [(0, 'First page'), (1, 'Second page'), (2, 'Third page')]
+    assert list(iter_page_texts(pdf, start=1, max_pages=2)) == [(1, 'Second page')]
+
+
+def test_flate_compressed_content():
+    content = zlib.compress(b'BT (Compressed RM 9.99) Tj ET')
+    pdf = (
+        b'%%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n'
+        b'2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj\n'
+        b'3 0 obj << /Type /Page /Parent 2 0 R /Contents 4 0 R >> endobj\n'
+        b'4 0 obj << /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream\nendobj\n'
+        b'trailer << /Root 1 0 R >>\n%%%%EOF\n'
+    ) % (len(content), content)
+
+    assert list(iter_page_texts(pdf)) == [(0, 'Compressed RM 9.99')]
+
+
+def test_declines_fonts_it_cannot_decode():
+    pdf = make_pdf([['Hello']]).replace(b'/BaseFont /Helvetica', b'/BaseFont /X /Encoding /Identity-H')
+    with pytest.raises(UnsupportedPDF):
+        list(iter_page_texts(pdf))
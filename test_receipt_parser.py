@@ -0,0 +1,182 @@
+"""
+Tests for receipt_parser.parse_receipt_data
+"""
+import json
+
+import pytest
+
+import receipt_parser
+from receipt_parser import CONFIDENCE, find_transaction_id, load_profiles, parse_receipt_data, parse_receipt_pages
+
+
+def test_maybank_transfer():
+    text = (
+        'Maybank2u\nTransfer Successful\nReference ID: M2U_20251203_0937\n'
+        'Date 03/12/2025 09:37:45\nAmount\nRM 1,250.50\n'
+        'Beneficiary account number\n5641 9177 5091\n'
+    )
+    result = parse_receipt_data(text)
+
+    assert result['bank'] == 'Maybank'
+    assert result['transaction_id'] == 'M2U_20251203_0937'
+    assert result['amount'] == 1250.5
+    assert result['date'] == '03/12/2025'
+    assert result['time'] == '09:37:45'
+    assert result['receiver_account'] == '564191775091'
+    assert result['status'] == 'successful'
+    assert result['raw_text'] == text[:500]
+
+
+def test_bank_list_order_wins_over_text_order():
+    # Bank Islam appears first in the text, but Maybank is earlier in the bank list
+    assert parse_receipt_data('Bank Islam transfer via MAYBANK')['bank'] == 'Maybank'
+    assert parse_receipt_data('paid to OCBC from uob account')['bank'] == 'UOB'
+
+
+def test_status_priority_and_default():
+    assert parse_receipt_data('Payment pending, previously failed')['status'] == 'failed'
+    assert parse_receipt_data('Failed once, now completed')['status'] == 'successful'
+    assert parse_receipt_data('Waiting for approval')['status'] == 'pending'
+    assert parse_receipt_data('Total MYR 15')['status'] == 'successful'
+    assert parse_receipt_data('Nothing here')['status'] is None
+
+
+def test_transaction_id_formats():
+    assert parse_receipt_data('Ref 290121492M')['transaction_id'] == '290121492M'
+    assert parse_receipt_data('Reference: AB-1234')['transaction_id'] == 'AB-1234'
+    assert parse_receipt_data('Transaction No: TX-99')['transaction_id'] == 'TX-99'
+
+
+def test_amounts_round_half_up_like_to_cents():
+    result = parse_receipt_data('Amount: RM 0.125')
+    assert str(result.amount) == '0.13'
+    assert result.amount_cents == 13
+
+
+def test_account_fallback_skips_registration_numbers():
+    result = parse_receipt_data('Reg 196001000142\nTo 1234567890\n')
+    assert result['receiver_account'] == '1234567890'
+
+
+def test_parse_receipt_pages_stops_once_required_fields_found():
+    read = []
+
+    def pages():
+        for text in ['Maybank\nRef M2U_1_2 on 03/12/2025\nRM 10.00\n', 'Beneficiary account number 1234567890\n',
+                     'Statement page 3\n', 'Statement page 4\n']:
+            read.append(text)
+            yield text
+
+    result = parse_receipt_pages(pages())
+
+    assert len(read) == 2
+    assert result['receiver_account'] == '1234567890'
+    assert result['amount'] == 10.0
+
+
+def test_parse_receipt_pages_reads_everything_when_fields_missing():
+    result = parse_receipt_pages(iter(['CIMB\n', 'RM 5.00\n', 'nothing else\n']))
+    assert result['bank'] == 'CIMB'
+    assert result['amount'] == 5.0
+    assert result['raw_text'] == 'CIMB\nRM 5.00\nnothing else\n'
+
+
+def test_fields_split_by_a_page_break_are_found():
+    read = []
+
+    def pages():
+        for text in ['Maybank\nRM 10.00 on 03/12/2025\nTo 1234567890\nReference:\n', 'AB1234\n', 'Page 3\n']:
+            read.append(text)
+            yield text
+
+    assert parse_receipt_pages(pages())['transaction_id'] == 'AB1234'
+    assert len(read) == 2
+
+
+def test_parse_receipt_pages_searches_each_page_once(monkeypatch):
+    searched = []
+
+    def counting(finder):
+        def count(text, profile):
+            searched.append(len(text))
+            return finder(text, profile)
+        return count
+
+    monkeypatch.setattr(receipt_parser, 'REQUIRED_FIELDS',
+                        [(field, counting(finder)) for field, finder in receipt_parser.REQUIRED_FIELDS])
+    # No transaction ID anywhere, so every page is read
+    pages = [f'Statement page {n}\nRM {n}.00 on 03/12/2025\nTo 1234567890\n' + 'Opening balance\n' * 20
+             for n in range(300)]
+
+    result = parse_receipt_pages(iter(pages))
+
+    assert result['transaction_id'] is None
+    # Searching the whole prefix again for every page would be ~150 times the text
+    assert sum(searched) <= 2 * len(''.join(pages))
+
+
+def test_bank_specific_patterns_only_run_for_that_bank():
+    text = 'CIMB Clicks\nBatch 290121492M\nReference: CB-77\nTo Account\n1234 5678 9012\n'
+    result = parse_receipt_data(text)
+    assert result['transaction_id'] == 'CB-77'
+    assert result['receiver_account'] == '123456789012'
+    # The same receipt from Maybank uses the Maybank ID format
+    assert parse_receipt_data(text.replace('CIMB Clicks', 'Maybank2u'))['transaction_id'] == '290121492M'
+
+
+def test_profiles_load_from_data_file(tmp_path):
+    path = tmp_path / 'profiles.json'
+    path.write_text(json.dumps({'banks': [
+        {'name': 'Bank Rakyat', 'keywords': ['bank rakyat', 'irakyat'],
+         'fields': {'transaction_id': [{'pattern': r'iRakyat No\. (\w+)'}]}},
+        {'name': 'CIMB'},
+    ]}))
+    (rakyat, cimb), _, digest = load_profiles(str(path))
+
+    assert rakyat.keywords == ('bank rakyat', 'irakyat')
+    assert find_transaction_id('iRakyat No. ABC123', rakyat) == 'ABC123'
+    # Generic patterns are the fallback for every profile
+    assert find_transaction_id('Reference: X-1', rakyat) == 'X-1'
+    assert find_transaction_id('iRakyat No. ABC123', cimb) is None
+    assert len(digest) == 12
+
+
+@pytest.mark.parametrize('banks, message', [
+    ([{'fields': {}}], 'needs a name'),
+    ([{'name': 'X', 'fields': {'iban': []}}], 'unknown field'),
+    ([{'name': 'X', 'fields': {'amount': [{'pattern': '(unclosed'}]}}], 'bad amount pattern'),
+    ([{'name': 'X', 'fields': {'date': [{'pattern': 'no groups', 'group': 1}]}}], 'has no group 1'),
+])
+def test_malformed_profiles_are_rejected(tmp_path, banks, message):
+    path = tmp_path / 'profiles.json'
+    path.write_text(json.dumps({'banks': banks}))
+    with pytest.raises(ValueError, match=message):
+        load_profiles(str(path))
+
+
+def test_explain_records_pattern_span_and_confidence():
+    text = (
+        'Maybank2u\nTransfer Successful\nReference ID: M2U_20251203_0937\n'
+        'Date 03/12/2025 09:37:45\nAmount\nRM 1,250.50\n'
+        'Beneficiary account number\n5641 9177 5091\n'
+    )
+    result = parse_receipt_data(text, explain=True)
+    fields = result.provenance['fields']
+
+    transaction_id = fields['transaction_id']
+    assert transaction_id['source'] == 'profile' and transaction_id['pattern'] == r'M2U_\d+_\d+'
+    assert text[slice(*transaction_id['span'])] == 'M2U_20251203_0937'
+    assert fields['amount']['source'] == 'generic' and text[slice(*fields['amount']['span'])] == '1,250.50'
+    assert fields['bank'] == {'source': 'keyword', 'pattern': 'maybank', 'span': [0, 7],
+                              'confidence': CONFIDENCE['keyword']}
+    assert result.provenance['confidence'] == CONFIDENCE['generic']
+    assert parse_receipt_data(text).provenance is None
+
+
+def test_explain_lowers_confidence_for_guesses_and_missing_fields():
+    result = parse_receipt_data('Paid RM 0.00 on 31/31/2025 to 1234567890123', explain=True)
+    fields = result.provenance['fields']
+
+    assert fields['amount']['confidence'] == fields['date']['confidence'] == CONFIDENCE['generic'] / 2
+    assert fields['receiver_account']['source'] == 'fallback'
+    assert fields['transaction_id'] is None and result.provenance['confidence'] == 0.0
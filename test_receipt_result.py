@@ -0,0 +1,61 @@
+"""
+Tests for the Receipt result model
+"""
+import json
+import pickle
+from datetime import date, time
+from decimal import Decimal
+
+from receipt_parser import parse_receipt_data
+from receipt_result import Receipt, json_default, parse_date, parse_time, to_cents
+from result_cache import ResultCache
+
+TEXT = 'Maybank2u\nTransfer Successful\nReference ID: AB12345\nDate 03 Dec 2025 9:37 pm\nAmount RM 1,234.56\n'
+
+
+def test_amounts_are_exact_cents():
+    assert to_cents('1,234.56') == 123456
+    assert to_cents(Decimal('0.105')) == 11  # half up
+    assert to_cents(0.1 + 0.2) == 30
+    assert to_cents(19.99) == 1999
+    assert to_cents('n/a') is None and to_cents(None) is None
+
+    receipt = parse_receipt_data(TEXT)
+    assert receipt.amount_cents == 123456
+    assert receipt.amount == Decimal('1234.56')
+
+
+def test_parsed_date_and_time():
+    receipt = parse_receipt_data(TEXT)
+
+    assert receipt.date == '03 Dec 2025' and receipt.parsed_date == date(2025, 12, 3)
+    assert receipt.time == '9:37 pm' and receipt.parsed_time == time(21, 37)
+    assert parse_date('2025-12-03') == date(2025, 12, 3)
+    assert parse_time('09:37:45') == time(9, 37, 45)
+    assert parse_date('sometime') is None and parse_time(None) is None
+
+
+def test_item_access_gives_the_json_values():
+    receipt = parse_receipt_data(TEXT)
+
+    assert receipt['amount'] == 1234.56 and receipt.get('bank') == 'Maybank'
+    assert receipt.get('missing', 'x') == 'x'
+    assert list(dict(receipt)) == ['transaction_id', 'amount', 'date', 'time', 'sender_account',
+                                   'receiver_account', 'bank', 'status', 'raw_text']
+    assert json.loads(json.dumps({'data': receipt}, default=json_default))['data'] == receipt.to_dict()
+    assert Receipt.from_dict(receipt.to_dict()) == receipt
+
+
+def test_receipt_is_compact_and_pickles_by_value():
+    receipt = parse_receipt_data(TEXT)
+
+    assert not hasattr(receipt, '__dict__')
+    assert pickle.loads(pickle.dumps(receipt)) == receipt
+    assert len(pickle.dumps(receipt)) < len(pickle.dumps(receipt.to_dict()))
+
+
+def test_disk_cache_stores_receipts_as_json(tmp_path):
+    receipt = parse_receipt_data(TEXT)
+    ResultCache(max_entries=0, disk_dir=str(tmp_path)).set('abcd', receipt)
+
+    assert ResultCache(disk_dir=str(tmp_path)).get('abcd') == receipt.to_dict()
@@ -0,0 +1,111 @@
+"""
+Tests for splitting PDFs that hold several receipts
+"""
+import os
+from io import BytesIO
+
+import pytest
+
+import app as api
+import receipt_splitter
+from admission import AdmissionGate
+from batch_processor import BatchProcessor
+from conftest import make_pdf
+from dedup_index import DedupIndex
+from result_cache import ResultCache
+
+
+def receipt(bank, ref, amount):
+    return [bank, 'Transfer Successful', f'Reference: {ref}', 'Date 03/12/2025', f'Amount RM {amount}',
+            f'Thank you for banking with {bank}']
+
+
+@pytest.fixture
+def processor():
+    # Forked rather than started from the fork server, so workers see the tests' patches
+    processor = BatchProcessor(pool_size=2, max_pending=2, start_method='fork')
+    yield processor
+    processor.shutdown()
+
+
+def test_receipts_are_cut_at_their_banner_and_keep_their_footer():
+    first, second = receipt('Maybank2u', 'AB1001', '10.00'), receipt('CIMB Clicks', 'CB2002', '20.00')
+    pages = ['\n'.join(first + second) + '\n', 'Page 2 of 2\n']
+
+    texts = receipt_splitter.split_pages(pages)
+
+    assert texts == ['\n'.join(first) + '\n', '\n'.join(second) + '\nPage 2 of 2\n']
+
+
+def test_pages_without_a_new_id_stay_with_their_receipt():
+    pages = ['Maybank2u\nReference: AB1001\nAmount RM 10.00\n', 'Statement page 2\n', 'Reference: AB1001\n']
+    assert receipt_splitter.split_pages(pages) == [''.join(pages)]
+    assert receipt_splitter.split_pages(['No IDs here\n', 'at all\n']) == ['No IDs here\nat all\n']
+    assert receipt_splitter.split_pages([]) == []
+
+
+def test_repeated_header_starts_a_receipt_on_the_same_page():
+    page = ('Transfer Receipt\nReference: T1\nAmount RM 1.00\nFooter line\n'
+            'Transfer Receipt\nReference: T2\nAmount RM 2.00\n')
+
+    texts = receipt_splitter.split_pages([page])
+
+    assert [text.splitlines()[0] for text in texts] == ['Transfer Receipt', 'Transfer Receipt']
+    assert texts[0].endswith('Footer line\n')
+
+
+def test_long_pdfs_are_extracted_in_parallel_ranges(processor, monkeypatch):
+    pages = [receipt('Maybank2u', f'AB{n:04d}', f'{n}.00') for n in range(1, 8)]
+    pages.insert(3, ['Statement continuation'])
+    pdf = make_pdf(pages)
+    whole = receipt_splitter.split_pdf_bytes(pdf)
+    # Patched before the pool forks, so the workers see it too
+    monkeypatch.setattr(receipt_splitter, 'SPLIT_CHUNK_PAGES', 3)
+    jobs, held = [], []
+    gate = AdmissionGate(max_in_flight=4, max_queue=0, max_wait=5)
+    run = processor.run
+    monkeypatch.setattr(processor, 'run', lambda batch: jobs.extend(batch) or held.append(gate.in_flight) or run(batch))
+
+    ranged = receipt_splitter.process_pdf_receipts(processor, pdf, gate=gate)
+
+    ranges = [arg for func, arg in jobs if func is receipt_splitter.extract_page_range]
+    assert [arg[1:] for arg in ranges] == [(0, 3), (3, 6), (6, 8)]
+    # Every range reads one shared copy of the PDF, removed afterwards
+    assert len({arg[0] for arg in ranges}) == 1 and not os.path.exists(ranges[0][0])
+    assert [r.transaction_id for r in ranged['receipts']] == [f'AB{n:04d}' for n in range(1, 8)]
+    assert [r.amount_cents for r in ranged['receipts']] == [n * 100 for n in range(1, 8)]
+    assert ranged['receipts'] == whole['receipts']
+    # Range and parse jobs ran two at a time (the pool size), holding a gate slot each
+    assert held == [2, 2] and gate.in_flight == 0
+
+
+def test_unreadable_page_ranges_fail_instead_of_dropping_receipts(tmp_path):
+    blank = tmp_path / 'blank.pdf'
+    blank.write_bytes(make_pdf([[], []]))
+
+    assert receipt_splitter.extract_page_range((str(blank), 0, 2)) == {'success': True, 'pages': []}
+    missing = receipt_splitter.extract_page_range((str(tmp_path / 'gone.pdf'), 0, 2))
+    assert missing['success'] is False and 'pages 1-2' in missing['error']
+
+
+def test_split_endpoint_returns_every_receipt(monkeypatch, tmp_path, processor):
+    monkeypatch.setattr(api, 'batch_processor', processor)
+    monkeypatch.setattr(api, 'result_cache', ResultCache(max_entries=8))
+    monkeypatch.setattr(api, 'dedup_index', DedupIndex(str(tmp_path / 'dedup.sqlite3')))
+    client = api.app.test_client()
+    pdf = make_pdf([receipt('Maybank2u', 'AB1001', '10.00') + receipt('CIMB Clicks', 'CB2002', '20.00'),
+                    receipt('Maybank2u', 'AB1001', '10.00')])
+
+    single = client.post('/process-receipt', data={'file': (BytesIO(pdf), 'merged.pdf')})
+    split = client.post('/process-receipt', data={'file': (BytesIO(pdf), 'merged.pdf'), 'split': 'true'})
+    again = client.post('/process-receipt?split=1', data={'file': (BytesIO(pdf), 'merged.pdf')})
+
+    assert 'receipts' not in single.get_json()
+    body = split.get_json()
+    assert split.headers['X-Cache'] == 'MISS' and again.headers['X-Cache'] == 'HIT'
+    assert [item['data']['transaction_id'] for item in body['receipts']] == ['AB1001', 'CB2002', 'AB1001']
+    assert body['data'] == body['receipts'][0]['data']
+    # The first receipt was already seen unsplit; the third repeats it within the PDF
+    assert body['receipts'][0]['duplicate_of'] == single.headers['X-Request-ID']
+    assert body['receipts'][1]['duplicate_of'] is None
+    assert body['receipts'][2]['duplicate_of'] is not None
@@ -0,0 +1,64 @@
+"""
+Tests for the content-hash result cache
+"""
+from io import BytesIO
+
+import app as api
+from dedup_index import DedupIndex
+from result_cache import ResultCache, content_key
+
+
+def test_content_key_rewinds_and_depends_on_version():
+    f = BytesIO(b'%PDF-1.4 receipt')
+    key = content_key(f)
+    assert f.tell() == 0
+    assert key == content_key(BytesIO(b'%PDF-1.4 receipt'))
+    assert key != content_key(BytesIO(b'%PDF-1.4 receipt'), version='0')
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    cache.set('a', {'n': 1})
+    cache.set('b', {'n': 2})
+    cache.get('a')
+    cache.set('c', {'n': 3})
+
+    assert cache.get('b') is None
+    assert cache.get('a') == {'n': 1}
+    assert cache.get('c') == {'n': 3}
+    stats = cache.stats()
+    assert stats['entries'] == 2
+    assert stats['memory_hits'] == 3
+    assert stats['misses'] == 1
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    ResultCache(max_entries=4, disk_dir=str(tmp_path)).set('abcd', {'amount': 100.0})
+
+    fresh = ResultCache(max_entries=4, disk_dir=str(tmp_path))
+    assert fresh.get('abcd') == {'amount': 100.0}
+    assert fresh.get('abcd') == {'amount': 100.0}
+    stats = fresh.stats()
+    assert stats['disk_hits'] == 1
+    assert stats['memory_hits'] == 1
+
+
+def test_process_receipt_serves_repeat_upload_from_cache(receipt_pdf, monkeypatch, tmp_path):
+    monkeypatch.setattr(api, 'result_cache', ResultCache(max_entries=8))
+    monkeypatch.setattr(api, 'dedup_index', DedupIndex(str(tmp_path / 'dedup.sqlite3')))
+    client = api.app.test_client()
+
+    def upload():
+        return client.post('/process-receipt', data={'file': (BytesIO(receipt_pdf), 'receipt.pdf')},
+                           content_type='multipart/form-data')
+
+    first = upload()
+    second = upload()
+
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert first.get_json()['data'] == second.get_json()['data']
+    # The second upload is the same receipt, submitted again
+    assert first.get_json()['duplicate_of'] is None
+    assert second.get_json()['duplicate_of'] == first.headers['X-Request-ID']
+    assert second.get_json()['data']['transaction_id'] == 'M2U_20251203_0937'
@@ -0,0 +1,72 @@
+"""
+Tests for structured logging
+"""
+import io
+import json
+import logging
+
+import pytest
+
+import app as api
+from result_cache import ResultCache
+from structured_log import JsonFormatter, new_request_id, request_id
+
+
+@pytest.fixture
+def log_stream():
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(lambda record: setattr(record, 'request_id', request_id.get()) or True)
+    root = logging.getLogger()
+    old_level = root.level
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    yield stream
+    root.removeHandler(handler)
+    root.setLevel(old_level)
+
+
+def lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_json_lines_carry_request_id_and_extra_fields(log_stream):
+    new_request_id('abc123')
+    logging.getLogger('receipts').info('Processed %d pages', 3, extra={'bank': 'Maybank'})
+
+    entry = lines(log_stream)[-1]
+    assert entry['message'] == 'Processed 3 pages'
+    assert entry['level'] == 'INFO'
+    assert entry['request_id'] == 'abc123'
+    assert entry['bank'] == 'Maybank'
+
+
+def test_invalid_incoming_request_id_is_replaced():
+    assert new_request_id('ok-id') == 'ok-id'
+    assert len(new_request_id('x' * 500)) == 32
+    assert new_request_id('bad\nid') != 'bad\nid'
+
+
+def test_debug_arguments_are_not_formatted_at_info(log_stream):
+    formatted = []
+
+    class Expensive:
+        def __str__(self):
+            formatted.append(True)
+            return 'expensive'
+
+    logging.getLogger('pdf_processor').debug('Page text: %s', Expensive())
+    assert formatted == []
+    assert lines(log_stream) == []
+
+
+def test_request_summary_line_and_header(log_stream, monkeypatch):
+    monkeypatch.setattr(api, 'result_cache', ResultCache(max_entries=8))
+    response = api.app.test_client().get('/health', headers={'X-Request-ID': 'chatbot-42'})
+
+    assert response.headers['X-Request-ID'] == 'chatbot-42'
+    summary = [entry for entry in lines(log_stream) if entry['logger'] == 'app']
+    assert summary[-1]['message'] == 'GET /health 200'
+    assert summary[-1]['request_id'] == 'chatbot-42'
+    assert summary[-1]['duration_ms'] >= 0
@@ -0,0 +1,131 @@
+"""
+Tests for the startup warmup and the /ready endpoint
+"""
+from io import BytesIO
+
+import threading
+
+import pytest
+from starlette.testclient import TestClient
+
+import app as api
+import asgi_app
+import metrics
+import pdf_processor
+import warmup
+from receipt_parser import parse_receipt_data
+
+
+@pytest.fixture
+def fresh_state(monkeypatch):
+    # The apps' own warmup, started at import, must not finish into the fresh state
+    warmup.warm_up()
+    monkeypatch.setattr(warmup, '_state', {'ready': False, 'seconds': None, 'backends': {}, 'errors': {}})
+    monkeypatch.setattr(warmup, '_thread', None)
+
+
+def test_warmup_receipt_parses():
+    text = pdf_processor.extract_pdf_data(BytesIO(warmup.write_pdf([warmup.WARMUP_RECEIPT])))
+    result = parse_receipt_data(text)
+
+    assert result['bank'] == 'Maybank'
+    assert result['transaction_id'] == 'M2U_20250101_0937'
+    assert result['amount'] == 1234.56
+
+
+def test_warm_up_runs_every_backend_without_recording_traffic(fresh_state, monkeypatch):
+    recorded = []
+    monkeypatch.setattr(metrics, '_apply', lambda *sample: recorded.append(sample))
+    pdf_processor.drain_backend_stats()
+
+    status = warmup.warm_up()
+
+    assert status['ready'] and status['errors'] == {}
+    assert set(status['backends']) == set(pdf_processor.PDF_BACKEND_ORDER)
+    assert recorded == []
+    assert pdf_processor.backend_stats() == {}
+    # Once per process
+    assert warmup.warm_up()['seconds'] == status['seconds']
+
+
+def test_failing_backend_is_reported_but_service_is_ready(fresh_state, monkeypatch):
+    def broken(file, start, max_pages):
+        raise RuntimeError('no fonts')
+        yield
+
+    monkeypatch.setitem(pdf_processor.EXTRACTION_BACKENDS, 'broken', broken)
+    monkeypatch.setattr(warmup, 'PDF_BACKEND_ORDER', ['broken', 'raw'])
+
+    status = warmup.warm_up()
+
+    assert status['ready']
+    assert 'Could not extract text' in status['errors']['broken']
+    assert 'raw' not in status['errors']
+
+
+def test_ready_endpoint_is_503_until_warmed_up(fresh_state):
+    client = api.app.test_client()
+
+    response = client.get('/ready')
+    assert response.status_code == 503
+    assert response.get_json()['ready'] is False
+
+    warmup.warm_up()
+    response = client.get('/ready')
+    assert response.status_code == 200
+    assert response.get_json()['ready'] is True
+
+
+def test_ready_is_503_while_the_background_warmup_runs(fresh_state, monkeypatch):
+    release = threading.Event()
+
+    def slow(file, start, max_pages):
+        release.wait(10)
+        yield 'Warmup page\n'
+
+    monkeypatch.setitem(pdf_processor.EXTRACTION_BACKENDS, 'slow', slow)
+    monkeypatch.setattr(warmup, 'PDF_BACKEND_ORDER', ['slow'])
+    client = api.app.test_client()
+
+    thread = warmup.start_warm_up()
+    assert warmup.start_warm_up() is thread
+    # Requests are served meanwhile
+    assert client.get('/ready').status_code == 503
+    assert client.get('/health').status_code == 200
+
+    release.set()
+    thread.join(10)
+    assert client.get('/ready').status_code == 200
+
+
+def test_asgi_ready_endpoint(fresh_state):
+    with TestClient(asgi_app.app) as client:
+        assert client.get('/ready').status_code == 503
+        warmup.warm_up()
+        assert client.get('/ready').json()['ready'] is True
+
+
+def test_background_warmup_keeps_samples_recorded_by_other_threads(fresh_state, monkeypatch):
+    release, started = threading.Event(), threading.Event()
+
+    def slow(file, start, max_pages):
+        started.set()
+        release.wait(10)
+        yield 'Warmup page\n'
+
+    monkeypatch.setitem(pdf_processor.EXTRACTION_BACKENDS, 'slow', slow)
+    monkeypatch.setattr(warmup, 'PDF_BACKEND_ORDER', ['slow'])
+    recorded = []
+    monkeypatch.setattr(metrics, '_apply', lambda *sample: recorded.append(sample))
+    pdf_processor.drain_backend_stats()
+
+    thread = warmup.start_warm_up()
+    assert started.wait(10)
+    # A request thread extracting while the warmup is in its discarding block
+    metrics.count_bytes(123)
+    pdf_processor.extract_pdf_data(BytesIO(warmup.write_pdf([warmup.WARMUP_RECEIPT])), backends=['raw'])
+    release.set()
+    thread.join(10)
+
+    assert ('bytes', (), 123) in recorded
+    assert set(pdf_processor.backend_stats()) == {'raw'}
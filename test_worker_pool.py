@@ -0,0 +1,159 @@
+"""
+Tests for the supervised extraction worker pool
+"""
+import os
+import threading
+import time
+from io import BytesIO
+
+import pytest
+
+import app as api
+from batch_processor import BatchProcessor, process_pdf_bytes
+from result_cache import ResultCache
+from worker_pool import SupervisedPool, WorkerAborted, resource
+
+
+def sleep_for(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def slow_process(data, explain=False, info=None):
+    time.sleep(5)
+
+
+def spin(seconds):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        pass
+
+
+def allocate(megabytes):
+    return len(bytearray(megabytes * 1024 * 1024))
+
+
+def current_pid(_):
+    return os.getpid()
+
+
+def raise_error(message):
+    raise ValueError(message)
+
+
+# Stands in for the logging / prometheus_client / sqlite3 locks a web worker's threads hold
+_lock = threading.Lock()
+
+
+def take_lock(timeout):
+    if not _lock.acquire(timeout=timeout):
+        return False
+    _lock.release()
+    return True
+
+
+@pytest.fixture
+def pool():
+    pool = SupervisedPool(size=1, timeout=5, cpu_limit=0, memory_limit=0, max_jobs_per_worker=50)
+    yield pool
+    pool.shutdown()
+
+
+def test_deadline_kills_worker_and_pool_recovers(pool):
+    with pytest.raises(WorkerAborted) as error:
+        pool.call(sleep_for, 5, timeout=0.3)
+
+    assert error.value.status_code == 504
+    assert pool.stats()['killed'] == 1
+    assert pool.call(sleep_for, 0) == 0
+
+
+def test_errors_are_reported_with_500(pool):
+    with pytest.raises(WorkerAborted) as error:
+        pool.call(raise_error, 'bad input')
+
+    assert error.value.status_code == 500
+    assert 'bad input' in str(error.value)
+    assert pool.call(sleep_for, 0) == 0
+
+
+def test_workers_are_recycled_after_max_jobs():
+    pool = SupervisedPool(size=1, timeout=5, cpu_limit=0, memory_limit=0, max_jobs_per_worker=2)
+    try:
+        pids = [pool.call(current_pid, None) for _ in range(3)]
+    finally:
+        pool.shutdown()
+
+    assert pids[0] == pids[1] != pids[2]
+    assert pool.stats()['recycled'] == 1
+
+
+def test_workers_do_not_inherit_locks_held_by_other_threads():
+    held, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        with _lock:
+            held.set()
+            release.wait(10)
+
+    thread = threading.Thread(target=hold_lock)
+    thread.start()
+    held.wait(5)
+    pool = SupervisedPool(size=1, timeout=10, cpu_limit=0, memory_limit=0)
+    try:
+        assert pool.call(take_lock, 2) is True
+    finally:
+        release.set()
+        thread.join()
+        pool.shutdown()
+
+
+@pytest.mark.skipif(resource is None, reason='rlimits need the resource module')
+def test_memory_limit_returns_422():
+    pool = SupervisedPool(size=1, timeout=10, cpu_limit=0, memory_limit=4096 * 1024 * 1024)
+    try:
+        with pytest.raises(WorkerAborted) as error:
+            pool.call(allocate, 8192)
+        assert error.value.status_code == 422
+        assert 'memory limit' in str(error.value)
+        assert pool.call(allocate, 1) == 1024 * 1024
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.skipif(resource is None, reason='rlimits need the resource module')
+def test_cpu_limit_returns_422():
+    pool = SupervisedPool(size=1, timeout=10, cpu_limit=1, memory_limit=0)
+    try:
+        with pytest.raises(WorkerAborted) as error:
+            pool.call(spin, 8)
+        assert error.value.status_code == 422
+        assert 'CPU time limit' in str(error.value)
+    finally:
+        pool.shutdown()
+
+
+def test_process_receipt_returns_504_on_timeout(monkeypatch, receipt_pdf):
+    processor = BatchProcessor(pool_size=1, timeout=0.3)
+    monkeypatch.setattr(api, 'batch_processor', processor)
+    monkeypatch.setattr(api, 'result_cache', ResultCache(max_entries=8))
+    monkeypatch.setattr(api, 'process_pdf_bytes', slow_process)
+    try:
+        response = api.app.test_client().post('/process-receipt', data={'file': (BytesIO(receipt_pdf), 'slow.pdf')},
+                                              content_type='multipart/form-data')
+    finally:
+        processor.shutdown()
+
+    assert response.status_code == 504
+    assert 'timed out' in response.get_json()['error']
+
+
+def test_batch_reports_timeouts_per_item(receipt_pdf):
+    processor = BatchProcessor(pool_size=2, timeout=0.5)
+    try:
+        results = processor.run([(process_pdf_bytes, receipt_pdf), (sleep_for, 5)])
+    finally:
+        processor.shutdown()
+
+    assert results[0]['success'] and results[0]['data']['amount'] == 100.0
+    assert results[1] == {'success': False, 'error': 'PDF processing timed out after 0.5 seconds'}
@@ -0,0 +1,178 @@
+"""
+Startup warmup: run a synthetic receipt through the pipeline before serving
+
+The first request in a fresh process pays for lazy work - pdfminer and PyPDF2
+building their parser tables, font metrics loading, the first regex searches
+filling caches. warm_up() does that once, on a small generated PDF, through
+every extraction backend in PDF_BACKEND_ORDER (and the layout extractor in
+EXTRACTION_MODE=layout).
+
+The apps call start_warm_up() at import, which runs it in a background
+thread: the process serves requests meanwhile and GET /ready answers 503 until
+it has finished. Under gunicorn with preload_app (gunicorn.conf.py) the master
+waits for it before forking, so web workers share the warmed state
+copy-on-write and are ready from the start. Extraction pool workers come from
+a fork server instead (see worker_pool.py): it imports the extraction modules
+once, and each worker pays for the lazy parser setup on its first PDF.
+"""
+import logging
+import os
+import threading
+import time
+import zlib
+from io import BytesIO
+
+import metrics
+from layout_extractor import parse_layout
+from pdf_processor import EXTRACTION_MODE, PDF_BACKEND_ORDER, discard_backend_stats, extract_pdf_data
+from receipt_parser import parse_receipt_data
+
+logger = logging.getLogger(__name__)
+
+# Set WARMUP=0 to skip (the service is then ready as soon as it is imported)
+WARMUP_ENABLED = os.environ.get('WARMUP', '1') != '0'
+
+WARMUP_RECEIPT = [
+    'Maybank2u',
+    'Transfer Successful',
+    'Reference ID: M2U_20250101_0937',
+    'Date 01/01/2025 09:00:00',
+    'Amount RM 1,234.56',
+    'Beneficiary account number 5641 9177 5091',
+]
+
+_lock = threading.Lock()
+_state = {'ready': False, 'seconds': None, 'backends': {}, 'errors': {}}
+_thread = None
+_start_lock = threading.Lock()
+
+
+def _escape(line):
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(pages, compress=True):
+    """
+    Build a text-based PDF, one content stream per page
+
+    Args:
+        pages (list): One entry per page, each a list of text lines
+        compress (bool): FlateDecode the content streams, as most PDF writers do
+
+    Returns:
+        bytes: PDF file content
+    """
+    objects = [
+        (1, b'<< /Type /Catalog /Pages 2 0 R >>'),
+        (3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>'),
+    ]
+    page_ids = []
+    next_id = 4
+    for lines in pages:
+        stream = ['BT', '/F1 10 Tf', '12 TL', '56 780 Td']
+        stream.extend(f'({_escape(line)}) Tj T*' for line in lines)
+        stream.append('ET')
+        content = '\n'.join(stream).encode('latin-1')
+        header = b'<< /Length %d >>'
+        if compress:
+            content = zlib.compress(content)
+            header = b'<< /Length %d /Filter /FlateDecode >>'
+
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        objects.append((content_id, header % len(content) + b'\nstream\n' + content + b'\nendstream'))
+        objects.append((page_id, (
+            '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>'
+        ).encode('latin-1')))
+        page_ids.append(page_id)
+
+    kids = ' '.join(f'{pid} 0 R' for pid in page_ids)
+    objects.append((2, f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'.encode('latin-1')))
+    objects.sort()
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = {}
+    for obj_id, body in objects:
+        offsets[obj_id] = len(out)
+        out += b'%d 0 obj\n%s\nendobj\n' % (obj_id, body)
+
+    xref_at = len(out)
+    size = max(offsets) + 1
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % size
+    for obj_id in range(1, size):
+        out += b'%010d 00000 n \n' % offsets[obj_id]
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, xref_at)
+    return bytes(out)
+
+
+def warm_up():
+    """
+    Run the warmup receipt through each extraction backend and the parser (once per process)
+
+    Samples and backend counters from the warmup's own runs are dropped (other
+    threads keep theirs), so /metrics and /health only reflect real traffic. A backend that fails is logged and
+    reported by warmup_status(); the service is ready regardless.
+
+    Returns:
+        dict: See warmup_status; waits for a warmup already running in start_warm_up's thread
+    """
+    with _lock:
+        if _state['ready']:
+            return warmup_status()
+        if not WARMUP_ENABLED:
+            _state['ready'] = True
+            return warmup_status()
+
+        started = time.perf_counter()
+        pdf = write_pdf([WARMUP_RECEIPT])
+        with metrics.discard_samples(), discard_backend_stats():
+            for name in PDF_BACKEND_ORDER:
+                backend_started = time.perf_counter()
+                try:
+                    parse_receipt_data(extract_pdf_data(BytesIO(pdf), backends=[name]))
+                except Exception as e:
+                    logger.warning('Warmup with %s failed: %s', name, e)
+                    _state['errors'][name] = str(e)
+                _state['backends'][name] = round(time.perf_counter() - backend_started, 4)
+            if EXTRACTION_MODE == 'layout':
+                backend_started = time.perf_counter()
+                if parse_layout(BytesIO(pdf)) is None:
+                    _state['errors']['layout'] = 'no usable words'
+                _state['backends']['layout'] = round(time.perf_counter() - backend_started, 4)
+
+        _state['seconds'] = round(time.perf_counter() - started, 4)
+        _state['ready'] = True
+        logger.info('Warmup done in %.3fs', _state['seconds'], extra={'warmup': dict(_state['backends'])})
+        return warmup_status()
+
+
+def start_warm_up():
+    """
+    Run warm_up in a background thread (once per process), so /ready can answer meanwhile
+
+    Returns:
+        threading.Thread: The warmup thread; call warm_up() to wait for it
+    """
+    global _thread
+    with _start_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=warm_up, name='warmup', daemon=True)
+            _thread.start()
+        return _thread
+
+
+def warmup_status():
+    """
+    Whether the process is warmed up and how long it took
+
+    Returns:
+        dict: ready (bool), seconds (total, None before the warmup ran),
+              backends (seconds per backend) and errors (message per failed backend)
+    """
+    return {
+        'ready': _state['ready'],
+        'seconds': _state['seconds'],
+        'backends': dict(_state['backends']),
+        'errors': dict(_state['errors']),
+    }
@@ -0,0 +1,257 @@
+"""
+Supervised subprocess workers for PDF extraction
+Each job runs in a worker process with a hard wall-clock deadline and CPU/memory rlimits
+
+A malformed PDF can make pdfminer spin or allocate without ever raising, so
+extraction never runs in the web worker itself. A worker that misses its
+deadline is killed and replaced; one that hits RLIMIT_AS / RLIMIT_CPU dies or
+raises MemoryError and is replaced too. Workers also retire after
+max_jobs_per_worker jobs, which bounds pdfminer's memory growth.
+
+Workers are not forked from the web process: by then it runs request,
+job queue and warmup threads, and a child could inherit a lock one of them
+held (logging, prometheus_client, sqlite3) and hang until its deadline.
+They come from a fork server instead, a clean single-threaded process that
+imports FORKSERVER_PRELOAD once (EXTRACT_START_METHOD, where available).
+"""
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+
+from structured_log import request_id
+
+try:
+    import resource
+except ImportError:  # Windows: deadlines still apply, rlimits don't
+    resource = None
+
+# Wall-clock deadline per job - keep it below the gunicorn worker timeout
+EXTRACT_TIMEOUT = float(os.environ.get('EXTRACT_TIMEOUT', '20'))
+# CPU seconds per job (RLIMIT_CPU) and address space per worker (RLIMIT_AS); 0 = no limit
+EXTRACT_CPU_LIMIT = int(os.environ.get('EXTRACT_CPU_LIMIT', '15'))
+EXTRACT_MEMORY_LIMIT = int(os.environ.get('EXTRACT_MEMORY_LIMIT_MB', '1024')) * 1024 * 1024
+# Jobs a worker process handles before it is replaced
+EXTRACT_MAX_JOBS_PER_WORKER = int(os.environ.get('EXTRACT_MAX_JOBS_PER_WORKER', '100'))
+# multiprocessing start method for workers; 'forkserver' where the platform has it, else its default
+EXTRACT_START_METHOD = os.environ.get('EXTRACT_START_METHOD') or (
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else None)
+# Modules the fork server imports once, so every worker starts with the extraction code loaded
+FORKSERVER_PRELOAD = ['batch_processor', 'receipt_splitter']
+
+
+class WorkerAborted(Exception):
+    """A job was stopped by the supervisor; status_code is the HTTP status to answer with"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _limit_cpu(seconds):
+    """Allow this process `seconds` more CPU time from now (RLIMIT_CPU counts the process lifetime)"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime) + seconds
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(conn, memory_limit, max_jobs):
+    """Worker process loop: run jobs from conn until max_jobs is reached or the pipe closes"""
+    # Ctrl+C is handled by the parent, which tears the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if resource is not None and memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    for _ in range(max_jobs):
+        try:
+            func, arg, cpu_limit, rid = conn.recv()
+        except (EOFError, OSError):
+            return
+        request_id.set(rid)
+        if resource is not None and cpu_limit:
+            _limit_cpu(cpu_limit)
+        try:
+            conn.send(('ok', func(arg)))
+        except MemoryError:
+            # The heap may be left fragmented - report and retire this worker
+            conn.send(('memory', None))
+            return
+        except Exception as e:
+            conn.send(('error', f'{type(e).__name__}: {e}'))
+
+
+class _Worker:
+    def __init__(self, context, memory_limit, max_jobs):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit, max_jobs),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def retire(self):
+        self.conn.close()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.kill()
+
+
+class SupervisedPool:
+    """
+    Fixed-size set of worker processes, each running one job at a time
+
+    - size: maximum worker processes; callers beyond that wait for a free one
+    - timeout: wall-clock seconds per job before the worker is killed (504)
+    - cpu_limit / memory_limit: RLIMIT_CPU seconds per job / RLIMIT_AS bytes per worker (422)
+    - max_jobs_per_worker: jobs before a worker is replaced by a fresh process
+    - start_method: multiprocessing start method (defaults to EXTRACT_START_METHOD)
+    """
+
+    def __init__(self, size=None, timeout=None, cpu_limit=None, memory_limit=None, max_jobs_per_worker=None,
+                 start_method=None):
+        self.size = size or os.cpu_count() or 1
+        self.timeout = EXTRACT_TIMEOUT if timeout is None else timeout
+        self.cpu_limit = EXTRACT_CPU_LIMIT if cpu_limit is None else cpu_limit
+        self.memory_limit = EXTRACT_MEMORY_LIMIT if memory_limit is None else memory_limit
+        self.max_jobs_per_worker = max_jobs_per_worker or EXTRACT_MAX_JOBS_PER_WORKER
+        self._context = multiprocessing.get_context(start_method or EXTRACT_START_METHOD)
+        if self._context.get_start_method() == 'forkserver':
+            # The server itself starts with the first worker, in whichever process needs one
+            self._context.set_forkserver_preload(FORKSERVER_PRELOAD)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = None
+        self._slots = None
+        self._live = 0
+        self.recycled = 0
+        self.killed = 0
+
+    def _reset_if_forked(self):
+        # Workers (and their pipes) belong to the process that started them
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = queue.LifoQueue()
+            self._slots = threading.BoundedSemaphore(self.size)
+            self._live = 0
+
+    def _acquire(self):
+        with self._lock:
+            self._reset_if_forked()
+            slots = self._slots
+        # One slot per worker process, so at most `size` jobs run at once
+        slots.acquire()
+        try:
+            with self._lock:
+                try:
+                    return self._idle.get_nowait()
+                except queue.Empty:
+                    worker = _Worker(self._context, self.memory_limit, self.max_jobs_per_worker)
+                    self._live += 1
+                    return worker
+        except BaseException:
+            slots.release()
+            raise
+
+    def _release(self, worker, keep):
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            if keep:
+                self._idle.put(worker)
+            else:
+                self._live -= 1
+            self._slots.release()
+
+    def call(self, func, arg, timeout=None):
+        """
+        Run func(arg) in a worker process and return its result
+
+        Args:
+            func: Picklable module-level function
+            arg: Picklable argument
+            timeout (float): Override the pool's wall-clock deadline
+
+        Returns:
+            Whatever func returns
+
+        Raises:
+            WorkerAborted: 504 if the deadline passed, 422 if a resource limit was hit
+                or the worker died, 500 if func raised
+        """
+        timeout = self.timeout if timeout is None else timeout
+        worker = self._acquire()
+        keep = False
+        try:
+            try:
+                worker.conn.send((func, arg, self.cpu_limit, request_id.get()))
+                ready = worker.conn.poll(timeout or None)
+                status, value = worker.conn.recv() if ready else (None, None)
+            except (EOFError, OSError):
+                status = value = None
+                ready = True
+
+            if not ready:
+                worker.kill()
+                self.killed += 1
+                raise WorkerAborted(f'PDF processing timed out after {timeout:g} seconds', 504)
+
+            if status is None:
+                # The worker died mid-job: SIGXCPU from RLIMIT_CPU, or killed by the OS
+                worker.kill()
+                self.killed += 1
+                if worker.process.exitcode == -getattr(signal, 'SIGXCPU', -1):
+                    raise WorkerAborted(
+                        f'PDF processing exceeded the CPU time limit ({self.cpu_limit} seconds)', 422)
+                raise WorkerAborted(
+                    f'PDF processing worker crashed (exit code {worker.process.exitcode})', 422)
+
+            worker.jobs += 1
+            if status == 'memory' or worker.jobs >= self.max_jobs_per_worker:
+                worker.retire()
+                self.recycled += 1
+            else:
+                keep = True
+
+            if status == 'memory':
+                raise WorkerAborted(
+                    f'PDF processing exceeded the memory limit ({self.memory_limit // (1024 * 1024)} MB)', 422)
+            if status == 'error':
+                raise WorkerAborted(value, 500)
+            return value
+        finally:
+            self._release(worker, keep)
+
+    def stats(self):
+        """Counters for /health"""
+        with self._lock:
+            current = self._pid == os.getpid()
+            return {
+                'size': self.size,
+                'workers': self._live if current else 0,
+                'idle': self._idle.qsize() if current else 0,
+                'recycled': self.recycled,
+                'killed': self.killed,
+            }
+
+    def shutdown(self):
+        """Stop all idle workers (busy ones are retired when their job finishes)"""
+        with self._lock:
+            if self._idle is None or self._pid != os.getpid():
+                return
+            while True:
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                worker.retire()
+                self._live -= 1